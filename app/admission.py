@@ -0,0 +1,233 @@
+# app/admission.py
+#
+# Admission control, per worker process. Every request is put in a route class
+# (auth, user writes, user reads, admin reads/writes, admin exports), and each class
+# has its own concurrency limit and a bounded FIFO wait queue. A request that finds
+# the queue full, or waits longer than ADMISSION_QUEUE_TIMEOUT_MS, gets an immediate
+# 503 with Retry-After, so a login storm or a burst of admin reports can't take the
+# threads and DB connections that /user/daily needs.
+#
+# Limits are "concurrency:queue" per class, e.g. ADMISSION_USER_READ=12:64. Keep the
+# sum of concurrency limits below the threadpool size (40 by default) and in line
+# with DB_POOL_SIZE + DB_MAX_OVERFLOW.
+#
+# /auth/login also has token buckets per userid and per client IP (429 when empty).
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_QUEUE_TIMEOUT_MS = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# class -> default "concurrency:queue"
+DEFAULT_LIMITS = {
+    "auth": "4:16",
+    "user_write": "12:64",
+    "user_read": "12:64",
+    "admin_read": "4:8",
+    "admin_write": "4:16",
+    "admin_export": "2:4",
+}
+
+# never queued: monitoring must keep working under overload, and the change feed is a
+# long-lived stream capped by CHANGEFEED_MAX_SUBSCRIBERS instead
+EXEMPT_PATHS = {"/admin/metrics", "/admin/changes"}
+
+LOGIN_RATE_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_MINUTE", "10"))        # per userid; 0 disables
+LOGIN_BURST = int(os.getenv("LOGIN_BURST", "5"))
+LOGIN_IP_RATE_PER_MINUTE = float(os.getenv("LOGIN_IP_RATE_PER_MINUTE", "60"))  # per client IP; 0 disables
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+
+
+def _parse_limit(name: str, default: str) -> tuple:
+    raw = os.getenv(f"ADMISSION_{name.upper()}", default)
+    limit, _, queue = raw.partition(":")
+    return max(1, int(limit)), max(0, int(queue or 0))
+
+
+class Limiter:
+    # Concurrency limit with a bounded FIFO queue. Only touched from the event loop
+    # thread, so it needs no lock; waiters are futures of the loop they run on.
+
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.max_waiting = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            self.shed += 1
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.max_waiting = max(self.max_waiting, len(self._waiters))
+        try:
+            # release() hands its slot straight to the first waiter, so `active` is already counted
+            await asyncio.wait_for(fut, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # gave up (or the client went away) while queued: pass on a slot we may
+            # have been handed in the same instant
+            if fut.done() and not fut.cancelled():
+                self.release()
+            self._forget(fut)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timeouts += 1
+            return False
+        self.admitted += 1
+        return True
+
+    def _forget(self, fut):
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timeouts": self.timeouts,
+        }
+
+
+limiters = {name: Limiter(name, *_parse_limit(name, default)) for name, default in DEFAULT_LIMITS.items()}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if method == "OPTIONS" or path in EXEMPT_PATHS:
+        return None
+    reading = method in ("GET", "HEAD")
+    if path == "/auth/login":
+        return "auth"
+    if path.startswith("/user/"):
+        return "user_read" if reading else "user_write"
+    if path.startswith("/admin/"):
+        if path.startswith("/admin/export/"):
+            return "admin_export"
+        return "admin_read" if reading else "admin_write"
+    return None
+
+
+_BUSY_BODY = json.dumps({"detail": "Server busy, retry shortly"}).encode()
+
+
+class AdmissionMiddleware:
+    # pure ASGI: the slot is held until the response, streaming or not, is finished
+
+    def __init__(self, app):
+        self.app = app
+        self.timeout = ADMISSION_QUEUE_TIMEOUT_MS / 1000.0
+
+    async def __call__(self, scope, receive, send):
+        cls = route_class(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+        limiter = limiters[cls]
+        if not await limiter.acquire(self.timeout):
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_BUSY_BODY)).encode()),
+                    (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _BUSY_BODY})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+class TokenBuckets:
+    # one bucket per key, refilled continuously; least recently used keys are evicted
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 100_000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, key) -> float:
+        # 0 if a token was taken, else seconds until the next one
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rate_per_minute": self.rate * 60, "burst": self.burst, "keys": len(self._buckets),
+                    "limited": self.limited}
+
+
+login_by_userid = TokenBuckets(LOGIN_RATE_PER_MINUTE, LOGIN_BURST)
+login_by_ip = TokenBuckets(LOGIN_IP_RATE_PER_MINUTE, LOGIN_IP_BURST)
+
+
+def check_login_rate(userid: str, client_ip: Optional[str]):
+    wait = login_by_ip.take(client_ip) if client_ip else 0.0
+    if not wait:
+        wait = login_by_userid.take(userid.lower())
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many login attempts, retry later",
+                            headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+
+
+def stats() -> dict:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "classes": {name: lim.stats() for name, lim in limiters.items()},
+        "login_by_userid": login_by_userid.stats(),
+        "login_by_ip": login_by_ip.stats(),
+    }
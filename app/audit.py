@@ -0,0 +1,156 @@
+# app/audit.py
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.db import engine
+
+load_dotenv()
+
+# AUDIT_BUFFERED=0 writes every non-durable event in its own short transaction.
+AUDIT_BUFFERED = os.getenv("AUDIT_BUFFERED", "1") == "1"
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "250"))
+# Above this many buffered events the caller flushes inline (backpressure).
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))
+
+logger = logging.getLogger("app.audit")
+
+
+class AuditSink:
+    # Buffers audit events in memory and writes them with multi-row INSERTs from a
+    # background thread, once AUDIT_BATCH_SIZE events are waiting or every
+    # AUDIT_FLUSH_INTERVAL_MS. Buffered events are lost if the process is killed
+    # hard; actions that must be durable pass db= and commit with the caller.
+
+    def __init__(self, buffered: bool, batch_size: int, flush_interval_ms: int, max_pending: int):
+        self.buffered = buffered
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.max_pending = max(self.batch_size, max_pending)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def record(self, action: str, actor_id: Optional[int] = None, details=None, db: Optional[Session] = None):
+        # with db: the row joins the caller's transaction and is durable once it commits
+        if db is not None:
+            db.add(models.AuditLog(actor_user_id=actor_id, action=action, details=details))
+            return
+        row = {
+            "actor_user_id": actor_id,
+            "action": action,
+            "details": details,
+            "created_at": datetime.now(timezone.utc),
+        }
+        if not self.buffered:
+            self._write([row])
+            return
+        self._ensure_thread()
+        with self._lock:
+            self._buffer.append(row)
+            self.recorded += 1
+            pending = len(self._buffer)
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(models.AuditLog), rows)
+            self.written += len(rows)
+            self.batches += 1
+            return
+        except Exception:
+            logger.exception("audit batch of %d rows failed, retrying row by row", len(rows))
+        for row in rows:
+            try:
+                self._write_one(row)
+            except IntegrityError:
+                # actor was hard-deleted before the flush; keep the event like deleting
+                # the user does for its existing rows
+                try:
+                    self._write_one(dict(row, actor_user_id=None))
+                except Exception:
+                    self.dropped += 1
+                    logger.exception("dropped audit event %s", row["action"])
+            except Exception:
+                self.dropped += 1
+                logger.exception("dropped audit event %s", row["action"])
+
+    def _write_one(self, row):
+        with engine.begin() as conn:
+            conn.execute(insert(models.AuditLog), [row])
+        self.written += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("audit flush failed")
+
+    def close(self):
+        # drain on shutdown: stop the flusher and write whatever is still buffered
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread is not threading.current_thread():
+            thread.join(timeout=10)
+        self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._buffer)
+        return {
+            "buffered": self.buffered,
+            "pending": pending,
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+sink = AuditSink(AUDIT_BUFFERED, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS, AUDIT_MAX_PENDING)
+record = sink.record
@@ -1,12 +1,17 @@
 # app/auth.py
+import hashlib
 import os
-from datetime import datetime, timedelta
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from app.db import get_db
+from app.db import get_db, note_write
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app import models
+from app.cache import Principal, principal_cache, principal_from_user
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +19,7 @@ load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRES_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRES_MINUTES", "480"))
+STREAM_TICKET_SECONDS = 30
 
 if not JWT_SECRET:
     raise RuntimeError("JWT_SECRET not set in .env")
@@ -30,25 +36,79 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    credentials_exception = HTTPException(
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    principal = principal_for_token(token, db)
+    # get_read_db routes by principal; a write keeps its author's reads on the primary for a while
+    request.state.principal_id = principal.id
+    if request.method not in ("GET", "HEAD"):
+        note_write(principal.id, request)
+    return principal
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def principal_for_token(token: str, db: Session) -> Principal:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id: int = payload.get("id")
         if user_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
+        raise _credentials_exception()
+    return principal_for_id(user_id, db)
+
+def token_expires_at(token: str) -> Optional[datetime]:
+    # of a token principal_for_token already accepted
+    exp = jwt.get_unverified_claims(token).get("exp")
+    return datetime.fromtimestamp(exp, timezone.utc) if exp is not None else None
+
+def principal_for_id(user_id: int, db: Session) -> Principal:
+    credentials_exception = _credentials_exception()
+    principal, epoch = principal_cache.lookup(user_id)
+    if principal is None:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is None:
+            raise credentials_exception
+        principal = principal_from_user(user)
+        principal_cache.store(principal, epoch)
+    # deactivated accounts lose access immediately, not only at next login
+    if not principal.is_active:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    return principal
 
-def require_admin(user: models.User = Depends(get_current_user)):
+def require_admin(user: Principal = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return user
+
+# One-time tickets for GET /admin/changes: EventSource can't send an Authorization header,
+# and a bearer token in the URL would end up in proxy and access logs. A ticket is good
+# for one stream within STREAM_TICKET_SECONDS, on any worker (they live in the database,
+# hashed), and carries the expiry of the token it was issued for.
+def _ticket_hash(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+def issue_stream_ticket(db: Session, principal: Principal, token: str) -> str:
+    ticket = secrets.token_urlsafe(32)
+    db.execute(text("DELETE FROM stream_tickets WHERE expires_at < now()"))
+    db.execute(text("""
+        INSERT INTO stream_tickets (ticket_hash, user_id, expires_at, token_expires_at)
+        VALUES (:h, :u, now() + make_interval(secs => :s), :t)
+    """), {"h": _ticket_hash(ticket), "u": principal.id, "s": STREAM_TICKET_SECONDS, "t": token_expires_at(token)})
+    db.commit()
+    return ticket
+
+def redeem_stream_ticket(db: Session, ticket: str) -> tuple:
+    # (principal, expiry of the token behind the ticket); each ticket works once
+    row = db.execute(text("""
+        DELETE FROM stream_tickets WHERE ticket_hash = :h AND expires_at > now()
+        RETURNING user_id, token_expires_at
+    """), {"h": _ticket_hash(ticket)}).first()
+    db.commit()
+    if row is None:
+        raise _credentials_exception()
+    return principal_for_id(row.user_id, db), row.token_expires_at
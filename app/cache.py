@@ -0,0 +1,151 @@
+# app/cache.py
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+logger = logging.getLogger("app.cache")
+
+# Snapshot of the User columns the routes need. Unlike an ORM instance it is not
+# bound to a Session, so it can be shared between requests and threads.
+Principal = namedtuple("Principal", ["id", "userid", "full_name", "is_admin", "is_active"])
+
+
+def principal_from_user(user) -> Principal:
+    return Principal(
+        id=user.id,
+        userid=user.userid,
+        full_name=user.full_name,
+        is_admin=bool(user.is_admin),
+        is_active=bool(user.is_active),
+    )
+
+
+class PrincipalCache:
+    # Bounded LRU + TTL cache of principals keyed by (user id, generation, epoch).
+    # invalidate() bumps the user's epoch (invalidate_all() the generation), so an
+    # entry loaded by a request that raced with a deactivate/delete is stored under a
+    # stale key and never served.
+    # The cache is per process. Other workers hear about changes to users through the
+    # change feed listener (changefeed.ChangeFeed), which invalidates here; while it is
+    # disconnected it marks the cache unsynced, and nothing is served from it.
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, epoch) -> (expires_at, principal)
+        self._epochs = {}
+        self._generation = 0
+        self.synced = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def lookup(self, user_id: int):
+        # returns (principal or None, epoch); pass the epoch back to store()
+        with self._lock:
+            epoch = (self._generation, self._epochs.get(user_id, 0))
+            if not self.enabled or not self.synced:
+                return None, epoch
+            key = (user_id, *epoch)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], epoch
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None, epoch
+
+    def store(self, principal: Principal, epoch: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            # the user was invalidated while we were reading it from the DB
+            if not self.synced or (self._generation, self._epochs.get(principal.id, 0)) != epoch:
+                return
+            key = (principal.id, *epoch)
+            self._entries[key] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            epoch = self._epochs.get(user_id, 0)
+            self._entries.pop((user_id, self._generation, epoch), None)
+            self._epochs[user_id] = epoch + 1
+            self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def disable(self):
+        with self._lock:
+            self.ttl = 0
+            self._entries.clear()
+
+    def set_synced(self, synced: bool):
+        # False while cross-process invalidations may be missed; turning it back on starts empty
+        with self._lock:
+            if synced and not self.synced:
+                self._generation += 1
+                self._entries.clear()
+            self.synced = synced
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "synced": self.synced,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def multiple_processes() -> bool:
+    # Whether other processes may be serving the app too: app.serve (and gunicorn-style
+    # setups) export WEB_CONCURRENCY; uvicorn --workers starts the app in multiprocessing children.
+    return int(os.getenv("WEB_CONCURRENCY") or "1") > 1 or multiprocessing.parent_process() is not None
+
+
+def require_invalidation(changefeed_enabled: bool):
+    # Run at app startup. Other workers' invalidations arrive only through the change feed;
+    # without it a worker would keep accepting a deactivated account until its cached
+    # principal expires, so with several processes the cache is turned off.
+    if not changefeed_enabled and principal_cache.enabled and multiple_processes():
+        principal_cache.disable()
+        logger.warning("CHANGEFEED_ENABLED=0 with several worker processes: principal cache disabled")
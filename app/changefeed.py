@@ -0,0 +1,423 @@
+# app/changefeed.py
+#
+# Live change feed for the admin dashboard. Statement-level triggers on users,
+# daily_financials and audit_logs (installed by migration 9) send one NOTIFY per
+# statement on CHANNEL with the changed rows as JSON; Postgres delivers it at
+# commit, so rolled-back changes never show up. Each worker process keeps one
+# dedicated LISTEN connection and fans events out to its connected admins
+# (GET /admin/changes, server-sent events).
+#
+# Event payloads: {"table": ..., "op": "insert|update|delete", "rows": [...]}.
+# Statements touching more than CHANGEFEED_MAX_ROWS rows, or whose rows don't fit
+# in a NOTIFY (8000 bytes), send {"table", "op", "count", "truncated": true}
+# instead and the client reloads that list. audit_logs rows drop their details
+# first ("partial": true) before falling back to truncated.
+#
+# The listener also keeps this worker's principal cache coherent with the other
+# workers: users updates and deletes invalidate the cached principals (see
+# cache.PrincipalCache), so a deactivation on one worker is seen by all of them.
+#
+# LISTEN needs a session, so behind a transaction-mode pooler point
+# CHANGEFEED_DATABASE_URL at the database directly.
+#
+# NOTIFY serializes committing transactions on a global queue lock, so the triggers do
+# nothing in sessions where the webwork.changefeed setting is 'off'. With
+# CHANGEFEED_ENABLED=0 the app sets it on its connections (db._connect_args); behind a
+# transaction-mode pooler, which refuses startup options, set it for the database:
+#   ALTER DATABASE webwork SET webwork.changefeed = 'off';
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from app.cache import principal_cache
+from app.db import DATABASE_URL, DB_PGBOUNCER_MODE
+
+load_dotenv()
+
+CHANGEFEED_ENABLED = os.getenv("CHANGEFEED_ENABLED", "1") == "1"
+CHANGEFEED_DATABASE_URL = os.getenv("CHANGEFEED_DATABASE_URL") or ""
+CHANGEFEED_MAX_SUBSCRIBERS = int(os.getenv("CHANGEFEED_MAX_SUBSCRIBERS", "100"))  # per worker process
+CHANGEFEED_QUEUE_SIZE = int(os.getenv("CHANGEFEED_QUEUE_SIZE", "1000"))           # events buffered per client
+CHANGEFEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGEFEED_HEARTBEAT_SECONDS", "15"))
+CHANGEFEED_STREAM_MAX_SECONDS = float(os.getenv("CHANGEFEED_STREAM_MAX_SECONDS", "60"))
+CHANGEFEED_REPLAY_EVENTS = int(os.getenv("CHANGEFEED_REPLAY_EVENTS", "1000"))     # per worker, for Last-Event-ID
+CHANGEFEED_RETRY_MS = 2000  # browser reconnect delay
+CHANGEFEED_MAX_ROWS = 100  # baked into the trigger functions; change it with a migration
+
+CHANNEL = "webwork_changes"
+SETTING = "webwork.changefeed"  # 'off' skips the triggers; also read by app.db
+NOTIFY_MAX_BYTES = 7900  # pg_notify payloads must stay below 8000 bytes
+
+logger = logging.getLogger("app.changefeed")
+
+
+# --- triggers ---
+
+# table -> (full projection, lighter projection or None); `src` is the transition table
+_projections = {
+    "users": (
+        # never password_hash
+        "SELECT s.id, s.userid, s.full_name, s.is_admin, s.is_active FROM {src} s ORDER BY s.id",
+        None,
+    ),
+    "daily_financials": (
+        "SELECT s.id, s.user_id, u.userid, s.date, s.total_deposit, s.total_withdraw, s.is_deleted{old_cols} "
+        "FROM {src} s LEFT JOIN users u ON u.id = s.user_id{old_join} ORDER BY s.id",
+        None,
+    ),
+    "audit_logs": (
+        "SELECT s.id, s.actor_user_id, s.action, s.details, s.created_at FROM {src} s ORDER BY s.id",
+        "SELECT s.id, s.actor_user_id, s.action, s.created_at FROM {src} s ORDER BY s.id",
+    ),
+}
+
+# updates of daily rows also carry the previous values, so clients can adjust totals
+_daily_old_cols = (", json_build_object('date', o.date, 'total_deposit', o.total_deposit, "
+                   "'total_withdraw', o.total_withdraw, 'is_deleted', o.is_deleted) AS old")
+_daily_old_join = " JOIN old_rows o ON o.id = s.id"
+
+_ops = {
+    "users": ("insert", "update", "delete"),
+    "daily_financials": ("insert", "update", "delete"),
+    "audit_logs": ("insert",),
+}
+
+
+def _projection(table: str, op: str, light: bool = False) -> Optional[str]:
+    full, lighter = _projections[table]
+    sql = lighter if light else full
+    if sql is None:
+        return None
+    src = "old_rows" if op == "delete" else "new_rows"
+    with_old = table == "daily_financials" and op == "update"
+    return sql.format(src=src, old_cols=_daily_old_cols if with_old else "",
+                      old_join=_daily_old_join if with_old else "")
+
+
+def _function_sql(table: str, op: str) -> str:
+    src = "old_rows" if op == "delete" else "new_rows"
+    light = _projection(table, op, light=True)
+    light_step = f"""
+  IF octet_length(payload) > {NOTIFY_MAX_BYTES} THEN
+    SELECT json_build_object('table', '{table}', 'op', '{op}', 'partial', true, 'rows', array_to_json(array_agg(r)))::text
+    INTO payload FROM ({light}) r;
+  END IF;""" if light else ""
+    return f"""
+CREATE OR REPLACE FUNCTION changefeed_{table}_{op}() RETURNS trigger AS $$
+DECLARE
+  n bigint;
+  payload text;
+BEGIN
+  IF current_setting('{SETTING}', true) = 'off' THEN
+    RETURN NULL;
+  END IF;
+  SELECT count(*) INTO n FROM {src};
+  IF n = 0 THEN
+    RETURN NULL;
+  END IF;
+  IF n <= {CHANGEFEED_MAX_ROWS} THEN
+    SELECT json_build_object('table', '{table}', 'op', '{op}', 'rows', array_to_json(array_agg(r)))::text
+    INTO payload FROM ({_projection(table, op)}) r;{light_step}
+  END IF;
+  IF payload IS NULL OR octet_length(payload) > {NOTIFY_MAX_BYTES} THEN
+    payload := json_build_object('table', '{table}', 'op', '{op}', 'count', n, 'truncated', true)::text;
+  END IF;
+  PERFORM pg_notify('{CHANNEL}', payload);
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _trigger_sql(table: str, op: str) -> str:
+    referencing = {
+        "insert": "NEW TABLE AS new_rows",
+        "update": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "delete": "OLD TABLE AS old_rows",
+    }[op]
+    return f"""
+DROP TRIGGER IF EXISTS {table}_changefeed_{op} ON {table};
+CREATE TRIGGER {table}_changefeed_{op}
+AFTER {op.upper()} ON {table}
+REFERENCING {referencing}
+FOR EACH STATEMENT EXECUTE PROCEDURE changefeed_{table}_{op}();
+"""
+
+
+def install(conn):
+    # idempotent; run by migrations 0009 and 0011
+    for table, ops in _ops.items():
+        for op in ops:
+            conn.execute(text(_function_sql(table, op)))
+            conn.execute(text(_trigger_sql(table, op)))
+
+
+# --- listener and fan-out ---
+
+RESET = json.dumps({"reset": True})
+CLOSE = None  # ends a stream; see ChangeFeed.close_streams
+
+
+class ChangeFeedFull(Exception):
+    pass
+
+
+def _invalidate_principals(payload: str):
+    # users changed in any process: drop their cached principals here
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    if event.get("table") != "users" or event.get("op") == "insert":
+        return
+    if "rows" not in event:  # truncated: ids unknown
+        principal_cache.invalidate_all()
+        return
+    for row in event["rows"]:
+        principal_cache.invalidate(row["id"])
+
+
+class Subscription:
+    # one connected client; the queue of (event id, payload) lives on the client's event loop
+
+    def __init__(self, loop, maxsize: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event: tuple):
+        # runs on self.loop. A client that can't keep up loses its backlog and is told to reload
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            if event[1] is not CLOSE:
+                event = (event[0], RESET)
+        self.queue.put_nowait(event)
+
+
+class ChangeFeed:
+    # Event ids are "<boot>-<seq>", unique to this process. The last CHANGEFEED_REPLAY_EVENTS
+    # events are kept so a client reconnecting with Last-Event-ID (after a dropped
+    # connection or CHANGEFEED_STREAM_MAX_SECONDS) gets what it missed; an id from another
+    # process, or one already out of the buffer, gets a reset instead.
+
+    def __init__(self, url: str, max_subscribers: int, queue_size: int, replay: int):
+        self.url = url
+        self.max_subscribers = max(1, max_subscribers)
+        self.queue_size = max(2, queue_size)
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._history = deque(maxlen=max(1, replay))
+        self._boot = f"{os.getpid():x}{int(time.time()):x}"
+        self._seq = 0
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self.connected = False
+        self.received = 0
+        self.replayed = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    def check_capacity(self):
+        # before the response starts; subscribe() re-checks
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise ChangeFeedFull(f"{len(self._subs)} change feed clients connected")
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        # call from the event loop thread
+        sub = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise ChangeFeedFull(f"{len(self._subs)} change feed clients connected")
+            if self._pid != os.getpid():
+                # forked child: ids and history of the parent mean nothing here
+                self._boot = f"{os.getpid():x}{int(time.time()):x}"
+                self._history.clear()
+            if last_event_id:
+                for event in self._missed(last_event_id):
+                    sub.put(event)
+                    self.replayed += 1
+            self._subs.add(sub)
+            self._start()
+        return sub
+
+    def _missed(self, last_event_id: str) -> list:
+        # under self._lock
+        boot, _, seq = last_event_id.partition("-")
+        try:
+            seq = int(seq)
+        except ValueError:
+            seq = -1
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if boot != self._boot or seq < oldest - 1 or seq > self._seq:
+            return [(None, RESET)]
+        return [(f"{self._boot}-{n}", payload) for n, payload in self._history if n > seq]
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def start(self):
+        # at app startup, so principal cache invalidations arrive before any admin subscribes
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        # under self._lock; started on first use, and again in a forked child
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        principal_cache.set_synced(False)
+        self._thread = threading.Thread(target=self._run, name="changefeed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _publish(self, payload: str):
+        with self._lock:
+            self._seq += 1
+            self._history.append((self._seq, payload))
+            event = (f"{self._boot}-{self._seq}", payload)
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.put, event)
+            except RuntimeError:  # loop closed
+                self.unsubscribe(sub)
+
+    def _run(self):
+        # autocommit session of its own; nothing to roll back when it is closed
+        engine = create_engine(self.url, poolclass=NullPool, pool_reset_on_return=None)
+        delay = 1.0
+        first = True
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                self.connected, delay = True, 1.0
+                # invalidations sent while we weren't listening are lost; start the cache over
+                principal_cache.set_synced(True)
+                # clients subscribed before this point (first start, or while we were away)
+                # may have missed changes and must reload
+                self.reconnects += 0 if first else 1
+                first = False
+                self._publish(RESET)
+                logger.info("change feed listening on %s", CHANNEL)
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self.received += 1
+                            payload = conn.notifies.pop(0).payload
+                            _invalidate_principals(payload)
+                            self._publish(payload)
+            except Exception as e:
+                first_line = (str(e).strip().splitlines() or [""])[0]
+                self.last_error = f"{type(e).__name__}: {first_line}"
+                logger.warning("change feed connection lost (%s), retrying in %.0fs", self.last_error, delay)
+            finally:
+                self.connected = False
+                principal_cache.set_synced(False)
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, 30.0)
+        engine.dispose()
+
+    def close_streams(self):
+        # Ends every open stream of this process; browsers reconnect (to another worker)
+        # after CHANGEFEED_RETRY_MS. Called by app.serve when a worker starts shutting
+        # down, so graceful shutdown doesn't wait out CHANGEFEED_STREAM_MAX_SECONDS.
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.put, (None, CLOSE))
+            except RuntimeError:  # loop closed
+                self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subs = list(self._subs)
+        return {
+            "enabled": CHANGEFEED_ENABLED,
+            "connected": self.connected,
+            "subscribers": len(subs),
+            "max_subscribers": self.max_subscribers,
+            "received": self.received,
+            "replayed": self.replayed,
+            "dropped": sum(s.dropped for s in subs),
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+if DB_PGBOUNCER_MODE and not CHANGEFEED_DATABASE_URL and CHANGEFEED_ENABLED:
+    logger.warning("DB_PGBOUNCER_MODE is set but CHANGEFEED_DATABASE_URL is not: LISTEN may not work through the pooler")
+
+feed = ChangeFeed(CHANGEFEED_DATABASE_URL or DATABASE_URL, CHANGEFEED_MAX_SUBSCRIBERS, CHANGEFEED_QUEUE_SIZE,
+                  CHANGEFEED_REPLAY_EVENTS)
+
+
+def _sse(payload: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    head = (f"id: {event_id}\n" if event_id else "") + (f"event: {event}\n" if event else "")
+    return head + "".join(f"data: {line}\n" for line in payload.split("\n")) + "\n"
+
+
+async def stream(last_event_id: Optional[str], still_allowed):
+    # SSE body for one client. It subscribes only once the response is being sent, so
+    # the finally below always unsubscribes. still_allowed() is awaited at every heartbeat
+    # and ends the stream once the token expired or the admin lost access. Streams also
+    # end after CHANGEFEED_STREAM_MAX_SECONDS: graceful shutdown waits for open responses,
+    # and the browser reconnects (with Last-Event-ID) on its own.
+    deadline = time.monotonic() + CHANGEFEED_STREAM_MAX_SECONDS
+    try:
+        sub = feed.subscribe(last_event_id)
+    except ChangeFeedFull:
+        return  # lost a race for the last slot; the browser retries
+    try:
+        yield f"retry: {CHANGEFEED_RETRY_MS}\n" + _sse("{}", "ready")
+        while True:
+            timeout = min(CHANGEFEED_HEARTBEAT_SECONDS, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+            try:
+                event_id, payload = await asyncio.wait_for(sub.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() >= deadline:
+                    return
+                if not await still_allowed():
+                    yield _sse("{}", "expired")
+                    return
+                yield ": keepalive\n\n"
+                continue
+            if payload is CLOSE:
+                return
+            if payload == RESET:
+                yield _sse("{}", "reset", event_id)
+            else:
+                yield _sse(payload, event_id=event_id)
+    finally:
+        feed.unsubscribe(sub)
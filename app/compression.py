@@ -0,0 +1,188 @@
+# app/compression.py
+#
+# gzip / brotli for API responses. Bodies sent in one piece (JSON lists, /admin/logs)
+# are compressed when at least COMPRESSION_MIN_BYTES and only if that makes them
+# smaller; streamed bodies (exports, job downloads) are compressed chunk by chunk.
+# Server-sent events, responses that already carry a Content-Encoding (the
+# precompressed frontend assets) and Cache-Control: no-transform pass through.
+#
+# Brotli is used when the client accepts it and the optional `brotli` package is
+# installed; otherwise gzip. Compressed responses get Vary: Accept-Encoding, and a
+# strong ETag is made weak, as it no longer names the exact bytes (If-None-Match
+# compares weakly, see versions.matches).
+import os
+import zlib
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# chunks above this are compressed on the threadpool (zlib and brotli release the GIL)
+OFFLOAD_BYTES = 64 * 1024
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/javascript",
+    "text/javascript",
+    "text/csv",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+}
+
+
+def accepted_encodings(header: str) -> set:
+    # "gzip, br;q=1.0, *;q=0" -> {"gzip", "br"}; codings with q=0 are refused
+    accepted = set()
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name.strip():
+            accepted.add(name.strip())
+    return accepted
+
+
+def choose_encoding(header: str, available=("br", "gzip")):
+    accepted = accepted_encodings(header)
+    for coding in available:
+        if coding == "br" and brotli is None:
+            continue
+        if coding in accepted:
+            return coding
+    return None
+
+
+class _Compressor:
+
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == "br":
+            self._c = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip framing
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data) if self.coding == "br" else self._c.compress(data)
+
+    def finish(self) -> bytes:
+        return self._c.finish() if self.coding == "br" else self._c.flush()
+
+    def whole(self, data: bytes) -> bytes:
+        return self.compress(data) + self.finish()
+
+
+def _compressible(message: dict) -> bool:
+    status = message["status"]
+    if status < 200 or status in (204, 206, 304):
+        return False
+    headers = Headers(raw=message["headers"])
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    return headers.get("content-type", "").split(";")[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def _set_encoded_headers(message: dict, coding: str, length=None):
+    headers = MutableHeaders(scope=message)
+    headers["Content-Encoding"] = coding
+    if length is None:
+        del headers["Content-Length"]
+    else:
+        headers["Content-Length"] = str(length)
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = vary + ", Accept-Encoding"
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+async def _run(fn, data: bytes) -> bytes:
+    return await run_in_threadpool(fn, data) if len(data) > OFFLOAD_BYTES else fn(data)
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None         # held back until the first body chunk decides the mode
+        compressor = None    # set while streaming compressed chunks
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                if _compressible(message):
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is not None:
+                data = await _run(compressor.compress, body) if body else b""
+                if not more:
+                    data += compressor.finish()
+                if data or not more:
+                    await send({"type": "http.response.body", "body": data, "more_body": more})
+                return
+            # first body chunk
+            first, start = start, None
+            if not more:
+                if len(body) >= self.minimum_size:
+                    packed = await _run(_Compressor(coding).whole, body)
+                    if len(packed) < len(body):
+                        _set_encoded_headers(first, coding, len(packed))
+                        await send(first)
+                        await send({"type": "http.response.body", "body": packed, "more_body": False})
+                        return
+                passthrough = True
+                await send(first)
+                await send(message)
+                return
+            compressor = _Compressor(coding)
+            _set_encoded_headers(first, coding)
+            await send(first)
+            data = await _run(compressor.compress, body) if body else b""
+            if data:
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,9 +1,11 @@
 from sqlalchemy.orm import Session
-from app import models, schemas, utils
-from typing import Optional, List
-from datetime import date
+from app import models, schemas, utils, audit, versions, partitions
+from app.cache import principal_cache
+from app.serializers import DAILY_COLUMNS
+from typing import Optional
+from datetime import date, datetime, timedelta, timezone
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy import func
+from sqlalchemy import and_, delete, false, func, null, or_, select, text, tuple_
 
 # ---------- Users ----------
 def get_user_by_userid(db: Session, userid: str) -> Optional[models.User]:
@@ -19,10 +21,10 @@ def create_user(db: Session, user_in: schemas.UserCreate, actor_id: Optional[int
         is_active=True
     )
     db.add(user)
+    versions.bump(db, versions.USERS)
     db.commit()
     db.refresh(user)
-    db.add(models.AuditLog(actor_user_id=actor_id, action="create_user", details={"created_user": user.userid}))
-    db.commit()
+    audit.record("create_user", actor_id=actor_id, details={"created_user": user.userid})
     return user
 
 def authenticate_user(db: Session, userid: str, password: str) -> Optional[models.User]:
@@ -32,12 +34,54 @@ def authenticate_user(db: Session, userid: str, password: str) -> Optional[model
     # block inactive users
     if getattr(user, "is_active", True) is False:
         return None
-    if not utils.verify_password(password, user.password_hash):
+    ok, new_hash = utils.verify_and_update_password(password, user.password_hash)
+    if not ok:
         return None
+    # hash was made with outdated settings (e.g. fewer rounds): upgrade it transparently
+    if new_hash:
+        user.password_hash = new_hash
+        db.commit()
     return user
 
-def list_users(db: Session) -> List[models.User]:
-    return db.query(models.User).order_by(models.User.id).all()
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def list_users(db: Session, limit: Optional[int] = None, after_id: Optional[int] = None, search: Optional[str] = None,
+               match: str = "contains", is_active: Optional[bool] = None, is_admin: Optional[bool] = None,
+               with_stats: bool = False) -> list:
+    # keyset-paged on id. search is case-insensitive on userid and full_name, as a prefix
+    # (btree pattern index) or substring (pg_trgm index). with_stats adds lifetime totals
+    # from daily_rollups and the last submission date in the same query.
+    U = models.User
+    q = select(U.id, U.userid, U.full_name, U.is_admin, U.is_active)
+    if search:
+        term = _like_escape(search.lower())
+        pattern = term + "%" if match == "prefix" else "%" + term + "%"
+        q = q.where(or_(func.lower(U.userid).like(pattern), func.lower(U.full_name).like(pattern)))
+    if is_active is not None:
+        q = q.where(U.is_active == is_active)
+    if is_admin is not None:
+        q = q.where(U.is_admin == is_admin)
+    if after_id is not None:
+        q = q.where(U.id > after_id)
+    q = q.order_by(U.id)
+    if limit is not None:
+        q = q.limit(limit)
+    if with_stats:
+        page = q.subquery("u")
+        R, D = models.DailyRollup, models.DailyFinancial
+        # newest non-deleted date: a backward scan of unique_user_date per user on the page
+        last_date = select(D.date).where(D.user_id == page.c.id, D.is_deleted == False) \
+            .order_by(D.date.desc()).limit(1).scalar_subquery()
+        q = select(
+            page,
+            func.coalesce(R.days, 0).label("records"),
+            last_date.label("last_date"),
+            func.coalesce(R.total_deposit, 0).label("total_deposit"),
+            func.coalesce(R.total_withdraw, 0).label("total_withdraw"),
+        ).outerjoin(R, and_(R.user_id == page.c.id, R.period == "all", R.period_start == period_start_for("all"))) \
+            .order_by(page.c.id)
+    return db.execute(q).all()
 
 # ---------- Daily financials ----------
 def upsert_daily(db: Session, user_id: int, date_val: date, deposit: float, withdraw: float):
@@ -61,14 +105,35 @@ def upsert_daily(db: Session, user_id: int, date_val: date, deposit: float, with
         models.DailyFinancial.is_deleted
     )
     res = db.execute(stmt)
+    row = res.fetchone()
+    versions.bump(db, versions.daily_scope(user_id))
     db.commit()
-    return res.fetchone()
+    return row
+
+# is_deleted as a constant: every column then comes from ix_daily_financials_user_date_live,
+# so history pages are index-only scans
+LIVE_DAILY_COLUMNS = (*DAILY_COLUMNS[:-1], false().label("is_deleted"))
 
-def list_user_daily(db: Session, user_id: int):
-    return db.query(models.DailyFinancial).filter(
-        models.DailyFinancial.user_id == user_id,
-        models.DailyFinancial.is_deleted == False
-    ).order_by(models.DailyFinancial.date.desc()).all()
+def list_user_daily(db: Session, user_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                    before: Optional[date] = None, limit: Optional[int] = None):
+    # plain tuples in serializers.DAILY_COLUMNS order, no ORM identity-map overhead
+    return user_daily_query(db, user_id, date_from, date_to, before, limit).all()
+
+def user_daily_query(db: Session, user_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     before: Optional[date] = None, limit: Optional[int] = None):
+    # newest first; `before` is the keyset cursor (dates are unique per user)
+    D = models.DailyFinancial
+    q = db.query(*LIVE_DAILY_COLUMNS).filter(D.user_id == user_id, D.is_deleted == False)
+    if date_from is not None:
+        q = q.filter(D.date >= date_from)
+    if date_to is not None:
+        q = q.filter(D.date <= date_to)
+    if before is not None:
+        q = q.filter(D.date < before)
+    q = q.order_by(D.date.desc())
+    if limit is not None:
+        q = q.limit(limit)
+    return q
 
 def get_user_daily_by_userid(db: Session, userid: str):
     user = get_user_by_userid(db, userid)
@@ -76,73 +141,317 @@ def get_user_daily_by_userid(db: Session, userid: str):
         return None
     return list_user_daily(db, user.id)
 
+# ---------- Bulk daily ingestion ----------
+BULK_CHUNK_ROWS = 10000
+
+# set-based upsert: the whole chunk travels as four arrays in a single statement
+bulk_upsert_sql = text("""
+INSERT INTO daily_financials (user_id, date, total_deposit, total_withdraw, created_at, is_deleted)
+SELECT t.user_id, t.date, t.total_deposit, t.total_withdraw, now(), false
+FROM unnest(CAST(:user_ids AS integer[]), CAST(:dates AS date[]),
+            CAST(:deposits AS numeric[]), CAST(:withdraws AS numeric[]))
+     AS t(user_id, date, total_deposit, total_withdraw)
+ON CONFLICT (user_id, date) DO UPDATE
+  SET total_deposit = EXCLUDED.total_deposit,
+      total_withdraw = EXCLUDED.total_withdraw,
+      created_at = now(),
+      is_deleted = false
+RETURNING id, user_id, date
+""")
+
+def bulk_upsert_daily(db: Session, items: list, actor_id: Optional[int], source: str, errors: Optional[list] = None) -> dict:
+    # items: (row_number, user_id, date, deposit, withdraw); errors: (row_number, message) rejected upstream.
+    # One commit and one summarized audit event for the whole batch.
+    errors = list(errors or [])
+    latest = {}
+    for item in items:
+        # Postgres refuses to upsert the same key twice in one statement; the later row wins
+        latest[(item[1], item[2])] = item
+    unique = list(latest.values())
+    ids = {}
+    for start in range(0, len(unique), BULK_CHUNK_ROWS):
+        chunk = unique[start:start + BULK_CHUNK_ROWS]
+        res = db.execute(bulk_upsert_sql, {
+            "user_ids": [c[1] for c in chunk],
+            "dates": [c[2] for c in chunk],
+            "deposits": [c[3] for c in chunk],
+            "withdraws": [c[4] for c in chunk],
+        })
+        for r in res:
+            ids[(r.user_id, r.date)] = r.id
+    versions.bump(db, *(versions.daily_scope(uid) for _, uid, _, _, _ in unique))
+    results = [{"row": n, "status": "ok", "id": ids[(uid, d)]} for n, uid, d, _, _ in items]
+    results += [{"row": n, "status": "error", "error": msg} for n, msg in errors]
+    results.sort(key=lambda r: r["row"])
+    audit.record("bulk_upsert_daily", actor_id=actor_id, details={
+        "source": source,
+        "received": len(items) + len(errors),
+        "upserted": len(items),
+        "errors": len(errors),
+        "users": len({uid for _, uid, _, _, _ in items}),
+    }, db=db)
+    db.commit()
+    return {"received": len(items) + len(errors), "upserted": len(items), "errors": len(errors), "results": results}
+
+def import_daily(db: Session, rows: list, errors: list, actor_id: Optional[int], source: str) -> dict:
+    # rows as produced by app.ingest: (row_number, userid, date, deposit, withdraw)
+    userids = list({r[1] for r in rows})
+    id_by_userid = {}
+    for start in range(0, len(userids), BULK_CHUNK_ROWS):
+        chunk = userids[start:start + BULK_CHUNK_ROWS]
+        id_by_userid.update(db.query(models.User.userid, models.User.id).filter(models.User.userid.in_(chunk)).all())
+    items = []
+    errors = list(errors)
+    for n, userid, day, dep, wit in rows:
+        user_pk = id_by_userid.get(userid)
+        if user_pk is None:
+            errors.append((n, f"unknown userid {userid!r}"))
+        else:
+            items.append((n, user_pk, day, dep, wit))
+    return bulk_upsert_daily(db, items, actor_id, source, errors)
+
+# ---------- Rollups (see app/rollups.py) ----------
+def period_start_for(period: str, day: Optional[date] = None) -> date:
+    day = day or date.today()
+    if period == "month":
+        return day.replace(day=1)
+    if period == "week":
+        return day - timedelta(days=day.weekday())  # ISO week, same as date_trunc('week')
+    return date(1970, 1, 1)
+
+def _rollup_dict(r) -> dict:
+    return {
+        "period_start": r.period_start,
+        "total_deposit": float(r.total_deposit),
+        "total_withdraw": float(r.total_withdraw),
+        "net": float(r.total_deposit - r.total_withdraw),
+        "days": r.days,
+    }
+
+def get_user_summary(db: Session, userid: str, months: int = 12, weeks: int = 12):
+    user = get_user_by_userid(db, userid)
+    if not user:
+        return None
+    R = models.DailyRollup
+    def periods(period: str, limit: int):
+        return db.query(R).filter(R.user_id == user.id, R.period == period, R.days > 0) \
+            .order_by(R.period_start.desc()).limit(limit).all()
+    lifetime = periods("all", 1)
+    return {
+        "userid": user.userid,
+        "lifetime": _rollup_dict(lifetime[0]) if lifetime else
+            {"period_start": period_start_for("all"), "total_deposit": 0.0, "total_withdraw": 0.0, "net": 0.0, "days": 0},
+        "monthly": [_rollup_dict(r) for r in periods("month", months)],
+        "weekly": [_rollup_dict(r) for r in periods("week", weeks)],
+    }
+
+def leaderboard(db: Session, period: str = "all", period_start: Optional[date] = None, limit: int = 20):
+    R, U = models.DailyRollup, models.User
+    start = period_start_for(period, period_start)
+    rows = db.query(U.userid, U.full_name, R.period_start, R.total_deposit, R.total_withdraw, R.days) \
+        .join(U, U.id == R.user_id) \
+        .filter(R.period == period, R.period_start == start, R.days > 0) \
+        .order_by((R.total_deposit - R.total_withdraw).desc()) \
+        .limit(limit).all()
+    return [dict(_rollup_dict(r), userid=r.userid, full_name=r.full_name) for r in rows]
+
 # ---------- Logs ----------
-def list_logs(db: Session, limit: int = 1000):
-    return db.query(models.AuditLog).order_by(models.AuditLog.created_at.desc()).limit(limit).all()
+def list_logs(db: Session, limit: int = 100, cursor: Optional[tuple] = None, action: Optional[str] = None,
+              actor_user_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              include_details: bool = True):
+    # newest first, keyset-paged on (created_at, id); cursor is the key of the previous page's last row.
+    # Read one monthly partition at a time, newest first, until the page is full, so
+    # recent pages never touch older partitions.
+    L = models.AuditLog
+    details_col = L.details if include_details else null().label("details")
+    q = db.query(L.id, L.actor_user_id, L.action, details_col, L.created_at)
+    if action is not None:
+        q = q.filter(L.action == action)
+    if actor_user_id is not None:
+        q = q.filter(L.actor_user_id == actor_user_id)
+    if since is not None:
+        q = q.filter(L.created_at >= since)
+    if until is not None:
+        q = q.filter(L.created_at < until)
+    upper = until
+    if cursor is not None:
+        # the plain bound lets the planner prune partitions; the row comparison can't
+        q = q.filter(L.created_at <= cursor[0], tuple_(L.created_at, L.id) < tuple_(*cursor))
+        upper = cursor[0] if upper is None else min(_utc(upper), _utc(cursor[0]))
+    # naive datetimes are compared as UTC here; the slack keeps a session time zone
+    # offset from skipping a window that has rows
+    slack = timedelta(days=1)
+    rows = []
+    for lo, hi in partitions.windows(db):
+        if upper is not None and lo is not None and lo > _utc(upper) + slack:
+            continue
+        if since is not None and hi is not None and hi <= _utc(since) - slack:
+            break
+        wq = q
+        if lo is not None:
+            wq = wq.filter(L.created_at >= lo)
+        if hi is not None:
+            wq = wq.filter(L.created_at < hi)
+        rows.extend(wq.order_by(L.created_at.desc(), L.id.desc()).limit(limit - len(rows)).all())
+        if len(rows) >= limit:
+            break
+    next_cursor = (rows[-1].created_at, rows[-1].id) if len(rows) == limit else None
+    return rows, next_cursor
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
 
 # ---------- Admin / edit / soft-delete ----------
 def get_daily_by_id(db: Session, daily_id: int):
     return db.query(models.DailyFinancial).filter(models.DailyFinancial.id == daily_id).first()
 
+# Each mutator is one statement: the UPDATE, the ETag version bump and the audit row
+# travel together as data-modifying CTEs, and RETURNING hands back the new row, so a
+# call costs that statement plus COMMIT. Target rows are locked in id order first
+# (FOR UPDATE), which also captures update_daily's "before" values atomically.
+# The single-row functions are the bulk ones with a list of one.
+
+_update_daily_sql = text("""
+WITH target AS (
+    SELECT id, total_deposit, total_withdraw FROM daily_financials
+    WHERE id = ANY(CAST(:ids AS integer[])) ORDER BY id FOR UPDATE
+), changed AS (
+    UPDATE daily_financials d
+    SET total_deposit = v.total_deposit, total_withdraw = v.total_withdraw
+    FROM target t
+    JOIN unnest(CAST(:ids AS integer[]), CAST(:deposits AS numeric[]), CAST(:withdraws AS numeric[]))
+         AS v(id, total_deposit, total_withdraw) ON v.id = t.id
+    WHERE d.id = t.id
+    RETURNING d.id, d.user_id, d.date, d.total_deposit, d.total_withdraw, d.created_at, d.is_deleted,
+              t.total_deposit AS before_deposit, t.total_withdraw AS before_withdraw
+), bumped AS (
+    INSERT INTO change_versions (scope, version)
+    SELECT DISTINCT 'daily:' || user_id, 1 FROM changed ORDER BY 1
+    ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1
+), logged AS (
+    INSERT INTO audit_logs (actor_user_id, action, details)
+    SELECT CAST(:actor_id AS integer), 'update_daily', jsonb_build_object(
+        'daily_id', id,
+        'before', jsonb_build_object('total_deposit', before_deposit::float8, 'total_withdraw', before_withdraw::float8),
+        'after', jsonb_build_object('total_deposit', total_deposit::float8, 'total_withdraw', total_withdraw::float8))
+    FROM changed ORDER BY id
+)
+SELECT id, user_id, date, total_deposit, total_withdraw, created_at, is_deleted FROM changed ORDER BY id
+""")
+
+_set_daily_deleted_sql = text("""
+WITH target AS (
+    SELECT id FROM daily_financials WHERE id = ANY(CAST(:ids AS integer[])) ORDER BY id FOR UPDATE
+), changed AS (
+    UPDATE daily_financials d SET is_deleted = :deleted FROM target t WHERE d.id = t.id
+    RETURNING d.id, d.user_id, d.date, d.total_deposit, d.total_withdraw, d.created_at, d.is_deleted
+), bumped AS (
+    INSERT INTO change_versions (scope, version)
+    SELECT DISTINCT 'daily:' || user_id, 1 FROM changed ORDER BY 1
+    ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1
+), logged AS (
+    INSERT INTO audit_logs (actor_user_id, action, details)
+    SELECT CAST(:actor_id AS integer), :action, jsonb_build_object('daily_id', id) FROM changed ORDER BY id
+)
+SELECT * FROM changed ORDER BY id
+""")
+
+_set_users_active_sql = text("""
+WITH target AS (
+    SELECT id FROM users WHERE userid = ANY(CAST(:userids AS text[])) ORDER BY id FOR UPDATE
+), changed AS (
+    UPDATE users u SET is_active = :active FROM target t WHERE u.id = t.id
+    RETURNING u.id, u.userid, u.full_name, u.is_admin, u.is_active
+), bumped AS (
+    INSERT INTO change_versions (scope, version)
+    SELECT 'users', 1 FROM changed LIMIT 1
+    ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1
+), logged AS (
+    INSERT INTO audit_logs (actor_user_id, action, details)
+    SELECT CAST(:actor_id AS integer), :action, jsonb_build_object('userid', userid) FROM changed ORDER BY id
+)
+SELECT * FROM changed ORDER BY id
+""")
+
 def update_daily(db: Session, daily_id: int, deposit: float, withdraw: float, actor_id: Optional[int] = None):
-    row = db.query(models.DailyFinancial).filter(models.DailyFinancial.id == daily_id).first()
-    if not row:
-        return None
-    before = {"total_deposit": float(row.total_deposit), "total_withdraw": float(row.total_withdraw)}
-    row.total_deposit = deposit
-    row.total_withdraw = withdraw
     # if editing a previously deleted record, leave is_deleted as-is (admin may explicitly restore)
-    db.add(models.AuditLog(actor_user_id=actor_id, action="update_daily", details={"daily_id": daily_id, "before": before, "after": {"total_deposit": deposit, "total_withdraw": withdraw}}))
+    rows = update_daily_many(db, [(daily_id, deposit, withdraw)], actor_id=actor_id)
+    return rows[0] if rows else None
+
+def update_daily_many(db: Session, items: list, actor_id: Optional[int] = None) -> list:
+    # items: (daily_id, deposit, withdraw); a repeated id keeps its last amounts.
+    # Returns the updated rows in DAILY_COLUMNS order; ids that don't exist are skipped.
+    latest = {daily_id: (dep, wit) for daily_id, dep, wit in items}
+    if not latest:
+        return []
+    rows = db.execute(_update_daily_sql, {
+        "ids": list(latest),
+        "deposits": [dep for dep, _ in latest.values()],
+        "withdraws": [wit for _, wit in latest.values()],
+        "actor_id": actor_id,
+    }).all()
     db.commit()
-    db.refresh(row)
-    return row
+    return rows
 
-def soft_delete_daily(db: Session, daily_id: int, actor_id: Optional[int] = None):
-    row = db.query(models.DailyFinancial).filter(models.DailyFinancial.id == daily_id).first()
-    if not row:
-        return None
-    row.is_deleted = True
-    db.add(models.AuditLog(actor_user_id=actor_id, action="delete_daily", details={"daily_id": daily_id}))
+def _set_daily_deleted(db: Session, ids: list, deleted: bool, action: str, actor_id: Optional[int]) -> list:
+    if not ids:
+        return []
+    rows = db.execute(_set_daily_deleted_sql, {"ids": sorted(set(ids)), "deleted": deleted, "action": action,
+                                               "actor_id": actor_id}).all()
     db.commit()
-    db.refresh(row)
-    return row
+    return rows
+
+def soft_delete_daily(db: Session, daily_id: int, actor_id: Optional[int] = None):
+    rows = soft_delete_daily_many(db, [daily_id], actor_id=actor_id)
+    return rows[0] if rows else None
+
+def soft_delete_daily_many(db: Session, daily_ids: list, actor_id: Optional[int] = None) -> list:
+    return _set_daily_deleted(db, daily_ids, True, "delete_daily", actor_id)
 
 def restore_daily(db: Session, daily_id: int, actor_id: Optional[int] = None):
-    row = db.query(models.DailyFinancial).filter(models.DailyFinancial.id == daily_id).first()
-    if not row:
-        return None
-    row.is_deleted = False
-    db.add(models.AuditLog(actor_user_id=actor_id, action="restore_daily", details={"daily_id": daily_id}))
-    db.commit()
-    db.refresh(row)
-    return row
+    rows = restore_daily_many(db, [daily_id], actor_id=actor_id)
+    return rows[0] if rows else None
+
+def restore_daily_many(db: Session, daily_ids: list, actor_id: Optional[int] = None) -> list:
+    return _set_daily_deleted(db, daily_ids, False, "restore_daily", actor_id)
 
 # ---------- User management: deactivate / restore / hard delete ----------
-def deactivate_user(db: Session, userid: str, actor_id: Optional[int] = None):
-    user = db.query(models.User).filter(models.User.userid == userid).first()
-    if not user:
-        return None
-    user.is_active = False
-    db.add(models.AuditLog(actor_user_id=actor_id, action="deactivate_user", details={"userid": userid}))
+def _set_users_active(db: Session, userids: list, active: bool, action: str, actor_id: Optional[int]) -> list:
+    if not userids:
+        return []
+    rows = db.execute(_set_users_active_sql, {"userids": sorted(set(userids)), "active": active, "action": action,
+                                              "actor_id": actor_id}).all()
     db.commit()
-    db.refresh(user)
-    return user
+    for row in rows:
+        principal_cache.invalidate(row.id)
+    return rows
+
+def deactivate_user(db: Session, userid: str, actor_id: Optional[int] = None):
+    rows = deactivate_users(db, [userid], actor_id=actor_id)
+    return rows[0] if rows else None
+
+def deactivate_users(db: Session, userids: list, actor_id: Optional[int] = None) -> list:
+    return _set_users_active(db, userids, False, "deactivate_user", actor_id)
 
 def restore_user(db: Session, userid: str, actor_id: Optional[int] = None):
-    user = db.query(models.User).filter(models.User.userid == userid).first()
-    if not user:
-        return None
-    user.is_active = True
-    db.add(models.AuditLog(actor_user_id=actor_id, action="restore_user", details={"userid": userid}))
-    db.commit()
-    db.refresh(user)
-    return user
+    rows = restore_users(db, [userid], actor_id=actor_id)
+    return rows[0] if rows else None
+
+def restore_users(db: Session, userids: list, actor_id: Optional[int] = None) -> list:
+    return _set_users_active(db, userids, True, "restore_user", actor_id)
 
 def hard_delete_user(db: Session, userid: str, actor_id: Optional[int] = None):
-    user = db.query(models.User).filter(models.User.userid == userid).first()
-    if not user:
+    # One DELETE, nothing loaded into the session: daily_financials and daily_rollups
+    # follow via ON DELETE CASCADE, audit_logs keep their rows with a NULL actor.
+    user_pk = db.execute(
+        delete(models.User).where(models.User.userid == userid).returning(models.User.id),
+        execution_options={"synchronize_session": False},
+    ).scalar()
+    if user_pk is None:
         return None
-    db.add(models.AuditLog(actor_user_id=actor_id, action="delete_user", details={"userid": userid}))
-    db.delete(user)
+    db.execute(delete(models.ChangeVersion).where(models.ChangeVersion.scope == versions.daily_scope(user_pk)))
+    versions.bump(db, versions.USERS)
+    audit.record("delete_user", actor_id=actor_id, details={"userid": userid}, db=db)
     db.commit()
+    principal_cache.invalidate(user_pk)
     return True
@@ -1,7 +1,17 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+import hashlib
+import hmac
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
 from dotenv import load_dotenv
+from starlette.requests import Request
 
 load_dotenv()  # reads .env
 
@@ -9,14 +19,364 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set in .env")
 
-# If using SQLite in future, you may need connect_args={"check_same_thread": False}
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# Connection pool (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))          # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))           # managed Postgres drops idle connections
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = server default
+# Optional streaming replica for read-only routes (see get_read_db)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or ""
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_REPLICA_MAX_OVERFLOW = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))   # primary reads after a principal's write
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10")) # beyond this, reads go to the primary
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+# Set when DATABASE_URL points at a transaction-mode pooler (PgBouncer, Neon/Supabase "-pooler" hosts):
+# no startup options, no server-side prepared statements, session state only via SET LOCAL.
+DB_PGBOUNCER_MODE = os.getenv("DB_PGBOUNCER_MODE", "0") == "1"
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long callers wait to get a connection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.acquires = 0
+        self.acquire_seconds = 0.0
+        self.max_acquire_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.acquires += 1
+                self.acquire_seconds += waited
+                self.max_acquire_seconds = max(self.max_acquire_seconds, waited)
+
+    def recreate(self):
+        # keep counters across dispose()/recycle of the whole pool
+        new = super().recreate()
+        new.acquires, new.acquire_seconds = self.acquires, self.acquire_seconds
+        new.max_acquire_seconds, new.timeouts = self.max_acquire_seconds, self.timeouts
+        return new
+
+
+def _connect_args(url: str, extra=None) -> dict:
+    args = {}
+    options = []
+    if DB_STATEMENT_TIMEOUT_MS:
+        options.append(f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}")
+    if os.getenv("CHANGEFEED_ENABLED", "1") != "1":
+        # nobody listens: skip the change feed NOTIFY triggers (see app.changefeed)
+        options.append("-c webwork.changefeed=off")
+    if options and not DB_PGBOUNCER_MODE:
+        args["options"] = " ".join(options)
+    if DB_PGBOUNCER_MODE and make_url(url).drivername == "postgresql+psycopg":
+        # psycopg 3 auto-prepares repeated statements, which breaks under transaction pooling
+        # (psycopg2, the default driver, never uses server-side prepared statements)
+        args["prepare_threshold"] = None
+    args.update(extra or {})
+    return args
+
+
+def _make_engine(url: str, pool_size: int, max_overflow: int, connect_args: dict):
+    # If using SQLite in future, you may need connect_args={"check_same_thread": False}
+    eng = create_engine(
+        url,
+        echo=False,
+        future=True,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True,  # reuse hot connections, let surplus ones idle out and get recycled
+        connect_args=connect_args,
+    )
+    if DB_STATEMENT_TIMEOUT_MS and DB_PGBOUNCER_MODE:
+        @event.listens_for(eng, "begin")
+        def _set_statement_timeout(conn):
+            # transaction-scoped, so it never leaks to another client of the pooler's server connection.
+            # Plain DBAPI cursor: the Connection may carry stream_results (named cursors can't run SET).
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+            finally:
+                cursor.close()
+    return eng
+
+
+engine = _make_engine(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, _connect_args(DATABASE_URL))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
+    # A Session only checks out a connection on its first query, so requests that
+    # are rejected before touching the DB (or served from caches) never hold one.
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def pool_stats(bind=engine) -> dict:
+    pool = bind.pool
+    acquires = getattr(pool, "acquires", 0)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": getattr(pool, "_max_overflow", DB_MAX_OVERFLOW),
+        "acquires": acquires,
+        "avg_acquire_ms": round(pool.acquire_seconds * 1000 / acquires, 3) if acquires else None,
+        "max_acquire_ms": round(pool.max_acquire_seconds * 1000, 3) if acquires else None,
+        "timeouts": getattr(pool, "timeouts", 0),
+        "pgbouncer_mode": DB_PGBOUNCER_MODE,
+    }
+
+
+# --- read replica ---
+#
+# With DATABASE_REPLICA_URL set, routes that take get_read_db instead of get_db read
+# from the replica while it is healthy: reachable, and replaying WAL within
+# REPLICA_MAX_LAG_SECONDS of the primary (checked every REPLICA_CHECK_SECONDS, and
+# marked down at once when a replica connection fails). Otherwise they read from the
+# primary. A principal that sent a write (any non-GET request, noted by
+# auth.get_current_user) reads from the primary for REPLICA_STICKY_SECONDS, so it sees
+# its own writes. Sticky state is per worker process; a browser's keep-alive
+# connection stays on one worker, so that is where its next read lands.
+
+logger = logging.getLogger("app.db")
+
+replica_engine = None
+if DATABASE_REPLICA_URL:
+    replica_engine = _make_engine(DATABASE_REPLICA_URL, DB_REPLICA_POOL_SIZE, DB_REPLICA_MAX_OVERFLOW,
+                                  _connect_args(DATABASE_REPLICA_URL, {"connect_timeout": REPLICA_CONNECT_TIMEOUT}))
+
+# 0 while caught up (or not a standby at all), else seconds since the last replayed commit
+_replica_lag_sql = text("""
+SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+""")
+
+
+class ReplicaMonitor:
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.healthy = False
+        self.lag_seconds = None
+        self.last_error = None
+        self.checks = 0
+        self.failovers = 0
+        self.reads = {"replica": 0, "primary_sticky": 0, "primary_unhealthy": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        try:
+            with self.bind.connect() as conn:
+                lag = float(conn.execute(_replica_lag_sql).scalar())
+        except Exception as e:
+            self.lag_seconds = None
+            self.mark_down(f"{type(e).__name__}: {(str(e).strip().splitlines() or [''])[0]}")
+            return
+        finally:
+            self.checks += 1
+        self.lag_seconds = round(lag, 3)
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            self.mark_down(f"lag {lag:.1f}s > {REPLICA_MAX_LAG_SECONDS:g}s")
+        elif not self.healthy:
+            logger.info("replica healthy (lag %.3fs), routing reads to it", lag)
+            self.healthy, self.last_error = True, None
+
+    def mark_down(self, reason: str):
+        if self.healthy:
+            self.failovers += 1
+            logger.warning("replica unavailable (%s), reading from the primary", reason)
+        self.healthy, self.last_error = False, reason
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.check()  # route to the replica from the first request
+
+        def run():
+            while not self._stop.wait(REPLICA_CHECK_SECONDS):
+                self.check()
+
+        self._thread = threading.Thread(target=run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "lag_seconds": self.lag_seconds, "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+                "last_error": self.last_error, "checks": self.checks, "failovers": self.failovers,
+                "reads": dict(self.reads), "pool": pool_stats(self.bind)}
+
+
+replica_monitor = ReplicaMonitor(replica_engine) if replica_engine is not None else None
+
+if replica_engine is not None:
+    @event.listens_for(replica_engine, "handle_error")
+    def _replica_error(ctx):
+        # a dropped or refused replica connection fails over right away, not at the next check
+        if ctx.is_disconnect or isinstance(ctx.original_exception, exc.OperationalError):
+            replica_monitor.mark_down(f"{type(ctx.original_exception).__name__} on a replica connection")
+
+
+class _RecentWriters:
+    # principal id -> monotonic time of its last write, LRU-bounded
+
+    def __init__(self, seconds: float, max_keys: int = 100_000):
+        self.seconds = seconds
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._last = OrderedDict()
+
+    def note(self, key):
+        with self._lock:
+            self._last.pop(key, None)
+            self._last[key] = time.monotonic()
+            if len(self._last) > self.max_keys:
+                self._last.popitem(last=False)
+
+    def recent(self, key) -> bool:
+        with self._lock:
+            at = self._last.get(key)
+        return at is not None and time.monotonic() - at < self.seconds
+
+
+recent_writers = _RecentWriters(REPLICA_STICKY_SECONDS)
+
+
+# Read-your-writes across worker processes (and hosts): a writing request hands the
+# client a signed "<principal>.<unix time>.<mac>" token, as the rw cookie and the
+# X-Read-After response header. A read presenting it (cookie, or the header echoed back
+# by clients without a cookie jar) within REPLICA_STICKY_SECONDS goes to the primary,
+# whichever worker serves it. recent_writers covers reads in the writing process itself.
+READ_AFTER_COOKIE = "rw"
+READ_AFTER_HEADER = "X-Read-After"
+_READ_AFTER_KEY = hashlib.sha256(b"read-after:" + os.getenv("JWT_SECRET", "").encode()).digest()
+
+
+def _read_after_mac(body: str) -> str:
+    return hmac.new(_READ_AFTER_KEY, body.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def read_after_token(principal_id: int, at: float) -> str:
+    body = f"{principal_id}.{int(at * 1000)}"
+    return f"{body}.{_read_after_mac(body)}"
+
+
+def written_at(request: Request, principal_id) -> float:
+    # unix time of the principal's last write according to the request's token, 0 if none
+    token = request.headers.get(READ_AFTER_HEADER) or request.cookies.get(READ_AFTER_COOKIE)
+    if not token or principal_id is None:
+        return 0.0
+    body, _, mac = token.rpartition(".")
+    owner, _, millis = body.partition(".")
+    if owner != str(principal_id) or not millis.isdigit() or not hmac.compare_digest(mac, _read_after_mac(body)):
+        return 0.0
+    return int(millis) / 1000
+
+
+def note_write(principal_id: int, request: Optional[Request] = None):
+    if replica_engine is not None:
+        recent_writers.note(principal_id)
+        if request is not None:
+            request.state.read_after = read_after_token(principal_id, time.time())
+
+
+class ReadAfterMiddleware:
+    # sends the token note_write() left on the request with the response
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_token(message):
+            if message["type"] == "http.response.start":
+                token = scope.get("state", {}).get("read_after")
+                if token:
+                    cookie = (f"{READ_AFTER_COOKIE}={token}; Max-Age={max(1, int(REPLICA_STICKY_SECONDS))}; "
+                              f"Path=/; HttpOnly; SameSite=Lax")
+                    message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode()),
+                                          (READ_AFTER_HEADER.lower().encode(), token.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_token)
+
+
+def read_engine(principal_id=None, wrote_at: float = 0.0):
+    # engine for a read-only unit of work: the replica unless it is down or the principal just wrote
+    if replica_engine is None:
+        return engine
+    if principal_id is not None and (recent_writers.recent(principal_id)
+                                     or time.time() - wrote_at < REPLICA_STICKY_SECONDS):
+        replica_monitor.reads["primary_sticky"] += 1
+        return engine
+    if not replica_monitor.healthy:
+        replica_monitor.reads["primary_unhealthy"] += 1
+        return engine
+    replica_monitor.reads["replica"] += 1
+    return replica_engine
+
+
+class ReadSession(Session):
+    # Picks its engine at the first statement, i.e. after the route's auth dependency
+    # has put the principal on request.state, and keeps it for the whole session.
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        bind = self.info.get("bind")
+        if bind is None:
+            request = self.info.get("request")
+            principal_id = getattr(request.state, "principal_id", None) if request is not None else None
+            wrote_at = written_at(request, principal_id) if request is not None else 0.0
+            bind = self.info["bind"] = read_engine(principal_id, wrote_at)
+        return bind
+
+
+ReadSessionLocal = sessionmaker(class_=ReadSession, autocommit=False, autoflush=False)
+
+
+def get_read_db(request: Request):
+    # for GET routes that never write; same as get_db when no replica is configured
+    db = ReadSessionLocal(info={"request": request}) if replica_engine is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _after_fork_in_child():
+    # pooled connections inherited from a parent process (app.serve --preload) belong to it
+    for e in (engine, replica_engine):
+        if e is not None and e.pool.checkedin() + e.pool.checkedout():
+            e.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,89 @@
+# app/export.py
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import select
+
+from app import models
+from app.db import engine
+
+# rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_ROWS = 2000
+
+DAILY_FIELDS = ["id", "userid", "user_id", "date", "total_deposit", "total_withdraw", "created_at", "is_deleted"]
+LOG_FIELDS = ["id", "actor_user_id", "action", "details", "created_at"]
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def daily_query(userid: Optional[str] = None, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                include_deleted: bool = False):
+    D, U = models.DailyFinancial, models.User
+    q = select(D.id, U.userid, D.user_id, D.date, D.total_deposit, D.total_withdraw, D.created_at, D.is_deleted) \
+        .join(U, U.id == D.user_id)
+    if userid is not None:
+        q = q.where(U.userid == userid)
+    if date_from is not None:
+        q = q.where(D.date >= date_from)
+    if date_to is not None:
+        q = q.where(D.date <= date_to)
+    if not include_deleted:
+        q = q.where(D.is_deleted == False)
+    # matches the unique (user_id, date) index so rows stream without a sort
+    return q.order_by(D.user_id, D.date)
+
+
+def logs_query(action: Optional[str] = None, actor_user_id: Optional[int] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None):
+    L = models.AuditLog
+    q = select(L.id, L.actor_user_id, L.action, L.details, L.created_at)
+    if action is not None:
+        q = q.where(L.action == action)
+    if actor_user_id is not None:
+        q = q.where(L.actor_user_id == actor_user_id)
+    if since is not None:
+        q = q.where(L.created_at >= since)
+    if until is not None:
+        q = q.where(L.created_at < until)
+    return q.order_by(L.created_at, L.id)
+
+
+def _json_value(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def _csv_value(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, separators=(",", ":"))
+    return v
+
+
+def stream_rows(stmt, fields: list, fmt: str, bind=None):
+    # Generator of encoded chunks. Uses its own connection and a server-side
+    # cursor, so memory stays at one batch however large the export is.
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerow(fields)
+        yield buf.getvalue().encode()
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(stmt)
+        for batch in result.partitions():
+            buf = io.StringIO()
+            if fmt == "csv":
+                writer = csv.writer(buf)
+                for row in batch:
+                    writer.writerow([_csv_value(v) for v in row])
+            else:
+                for row in batch:
+                    buf.write(json.dumps({k: _json_value(v) for k, v in zip(fields, row)}, separators=(",", ":")))
+                    buf.write("\n")
+            yield buf.getvalue().encode()
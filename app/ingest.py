@@ -0,0 +1,80 @@
+# app/ingest.py
+import csv
+import io
+import json
+import os
+from datetime import date
+from math import isfinite
+from dotenv import load_dotenv
+
+# Parsers for the admin bulk import. Each returns (rows, errors):
+#   rows   -> list of (row_number, userid, date, deposit, withdraw)
+#   errors -> list of (row_number, message)
+# Row numbers are 1-based data rows (the CSV header is not counted).
+
+load_dotenv()
+
+# POST /admin/daily/import runs in one transaction; larger files go in several requests
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(32 * 1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "200000"))
+
+FIELDS = ("userid", "date", "total_deposit", "total_withdraw")
+
+# daily_financials amounts are NUMERIC(14,2): one value out of range would fail the whole upsert
+MAX_AMOUNT = 1e12
+
+
+def amount(value) -> float:
+    if value is None or value == "":
+        return 0.0
+    parsed = float(value)
+    if not isfinite(parsed):
+        raise ValueError(f"invalid amount {value!r}")
+    if abs(parsed) >= MAX_AMOUNT:
+        raise ValueError(f"amount {value!r} out of range")
+    return parsed
+
+
+def _parse_record(n: int, record: dict, rows: list, errors: list):
+    try:
+        userid = (record.get("userid") or "").strip()
+        if not userid:
+            raise ValueError("missing userid")
+        day = date.fromisoformat(str(record.get("date", "")).strip())
+        # an empty amount is 0, a missing one (absent key, null, short CSV row) an error
+        missing = [f for f in FIELDS[2:] if record.get(f) is None]
+        if missing:
+            raise ValueError("missing " + ", ".join(missing))
+        rows.append((n, userid, day, amount(record["total_deposit"]), amount(record["total_withdraw"])))
+    except (ValueError, TypeError, AttributeError) as e:
+        errors.append((n, str(e) or "invalid row"))
+
+
+def parse_csv(text: str):
+    rows, errors = [], []
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [f for f in FIELDS if f not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError("CSV header must include: " + ", ".join(FIELDS))
+    for n, record in enumerate(reader, start=1):
+        _parse_record(n, record, rows, errors)
+    return rows, errors
+
+
+def parse_ndjson(text: str):
+    rows, errors = [], []
+    n = 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            errors.append((n, "invalid JSON"))
+            continue
+        if not isinstance(record, dict):
+            errors.append((n, "expected a JSON object"))
+            continue
+        _parse_record(n, record, rows, errors)
+    return rows, errors
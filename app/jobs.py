@@ -0,0 +1,263 @@
+# app/jobs.py
+#
+# In-process background jobs for admin operations that are too heavy for a request:
+# user purges, rollup rebuilds and large exports. Work runs on a small thread pool
+# inside the worker that accepted it; status is kept in the jobs table so any worker
+# can answer GET /admin/jobs/{id}. Export results are files under JOBS_DIR, which
+# all workers on the host share. Jobs still queued or running when a worker stops
+# are marked failed, not resumed; those of a worker that died without stopping are
+# failed by the next worker to start (reconcile()).
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import insert, select, update
+
+from app import models, audit, crud, export, rollups
+from app.db import engine, read_engine, SessionLocal
+
+load_dotenv()
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "20"))  # queued + running per worker process
+JOBS_DIR = os.getenv("JOBS_DIR") or os.path.join(tempfile.gettempdir(), "webwork-jobs")
+JOBS_RESULT_TTL_HOURS = float(os.getenv("JOBS_RESULT_TTL_HOURS", "24"))
+# queued/running jobs of workers on other hosts count as orphaned after this long; 0 = never
+JOBS_ORPHAN_HOURS = float(os.getenv("JOBS_ORPHAN_HOURS", "24"))
+
+logger = logging.getLogger("app.jobs")
+
+JOB_COLUMNS = [c for c in models.Job.__table__.c]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _set(job_id: int, **values):
+    with engine.begin() as conn:
+        conn.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+
+
+class JobRunner:
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._ids = set()
+        self.completed = 0
+        self.failed = 0
+
+    def _worker_name(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # created lazily, and again in a forked child (threads don't survive fork)
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+            self._pid = os.getpid()
+            self._pending = 0
+            self._ids = set()
+        return self._executor
+
+    def submit(self, kind: str, fn, params: Optional[dict] = None, actor_id: Optional[int] = None) -> dict:
+        # fn(job_id) runs on the pool and returns the job's result dict
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs pending")
+            self._pending += 1
+        try:
+            with engine.begin() as conn:
+                job = conn.execute(
+                    insert(models.Job)
+                    .values(kind=kind, status="queued", params=params, actor_user_id=actor_id, worker=self._worker_name())
+                    .returning(*JOB_COLUMNS)
+                ).mappings().one()
+            with self._lock:
+                self._ids.add(job["id"])
+            executor.submit(self._run, job["id"], kind, fn)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return dict(job)
+
+    def _run(self, job_id: int, kind: str, fn):
+        started = time.perf_counter()
+        try:
+            _set(job_id, status="running", started_at=_now())
+            result = fn(job_id)
+        except Exception as e:
+            logger.exception("job %s (%s) failed", job_id, kind)
+            self.failed += 1
+            try:
+                _set(job_id, status="failed", error=f"{type(e).__name__}: {e}"[:2000], finished_at=_now())
+            except Exception:
+                logger.exception("could not record failure of job %s", job_id)
+        else:
+            self.completed += 1
+            _set(job_id, status="succeeded", result=result, finished_at=_now())
+            logger.info("job %s (%s) finished in %.1fs", job_id, kind, time.perf_counter() - started)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._ids.discard(job_id)
+
+    def shutdown(self):
+        # drop queued jobs, let running ones finish, then mark whatever is left as failed
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None or self._pid != os.getpid():
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            leftover, self._ids = list(self._ids), set()
+            self._pending = 0
+        if leftover:
+            with engine.begin() as conn:
+                conn.execute(
+                    update(models.Job)
+                    .where(models.Job.id.in_(leftover), models.Job.status.in_(["queued", "running"]))
+                    .values(status="failed", error="interrupted by shutdown", finished_at=_now())
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+runner = JobRunner(JOBS_WORKERS, JOBS_MAX_PENDING)
+
+
+def _orphaned(worker: Optional[str], created_at: datetime, host: str) -> bool:
+    # a worker process on this host is checked directly; others (and Windows, where
+    # signal 0 is CTRL_C_EVENT) only by age
+    name, _, pid = (worker or "").rpartition(":")
+    if name == host and pid.isdigit() and os.name != "nt":
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+    return JOBS_ORPHAN_HOURS > 0 and created_at < _now() - timedelta(hours=JOBS_ORPHAN_HOURS)
+
+
+def reconcile() -> int:
+    # Run at startup: a worker that was killed or crashed never reached shutdown(), so its
+    # jobs would show queued/running forever. Marks those failed; returns how many.
+    host = socket.gethostname()
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(models.Job.id, models.Job.worker, models.Job.created_at)
+            .where(models.Job.status.in_(["queued", "running"]))
+        ).all()
+        orphaned = [r.id for r in rows if _orphaned(r.worker, r.created_at, host)]
+        if orphaned:
+            conn.execute(
+                update(models.Job)
+                .where(models.Job.id.in_(orphaned), models.Job.status.in_(["queued", "running"]))
+                .values(status="failed", error="worker exited before the job finished", finished_at=_now())
+            )
+    if orphaned:
+        logger.warning("marked %d orphaned job(s) failed: %s", len(orphaned), orphaned)
+    return len(orphaned)
+
+
+def get(job_id: int) -> Optional[dict]:
+    with engine.connect() as conn:
+        row = conn.execute(select(*JOB_COLUMNS).where(models.Job.id == job_id)).mappings().first()
+    return dict(row) if row else None
+
+
+def list_jobs(limit: int = 50, kind: Optional[str] = None, status: Optional[str] = None) -> list:
+    q = select(*JOB_COLUMNS)
+    if kind is not None:
+        q = q.where(models.Job.kind == kind)
+    if status is not None:
+        q = q.where(models.Job.status == status)
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(q.order_by(models.Job.id.desc()).limit(limit)).mappings()]
+
+
+# --- job bodies ---
+
+def purge_user(userid: str, actor_id: Optional[int]):
+    def run(job_id):
+        db = SessionLocal()
+        try:
+            ok = crud.hard_delete_user(db, userid, actor_id=actor_id)
+        finally:
+            db.close()
+        if not ok:
+            raise LookupError(f"user {userid!r} not found")
+        return {"userid": userid, "deleted": True}
+    return run
+
+
+def rebuild_rollups(user_id: Optional[int], actor_id: Optional[int]):
+    def run(job_id):
+        with engine.begin() as conn:
+            rows = rollups.rebuild(conn, user_id)
+        audit.record("rebuild_rollups", actor_id=actor_id, details={"job_id": job_id, "user_id": user_id, "rows": rows})
+        return {"user_id": user_id, "rollup_rows": rows}
+    return run
+
+
+def result_path(job_id: int, fmt: str) -> str:
+    return os.path.join(JOBS_DIR, f"job-{job_id}.{fmt}")
+
+
+def _sweep_results():
+    # export files are kept JOBS_RESULT_TTL_HOURS; swept whenever a new export is queued
+    cutoff = time.time() - JOBS_RESULT_TTL_HOURS * 3600
+    try:
+        entries = list(os.scandir(JOBS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.startswith("job-") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def export_to_file(stmt, fields: list, fmt: str, name: str, principal_id=None):
+    _sweep_results()
+
+    def run(job_id):
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        path = result_path(job_id, fmt)
+        tmp = path + ".part"
+        size = 0
+        with open(tmp, "wb") as f:
+            for chunk in export.stream_rows(stmt, fields, fmt, read_engine(principal_id)):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, path)
+        return {"format": fmt, "bytes": size, "filename": f"{name}-{datetime.utcnow():%Y%m%dT%H%M%SZ}.{fmt}"}
+    return run
+
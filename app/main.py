@@ -1,13 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException
+import os
+from datetime import date, datetime
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from app.db import Base, engine, get_db
-from app import crud, schemas, auth, models
+from app.db import (engine, get_db, get_read_db, pool_stats, read_engine, replica_engine, replica_monitor, written_at,
+                    ReadAfterMiddleware, READ_AFTER_HEADER, SessionLocal)
+from app import crud, schemas, auth, utils, audit, ingest, export, serializers, versions, migrate, profiling, jobs, partitions, admission, changefeed, compression, static
+from app import cache
+from app.cache import principal_cache
+from app.pagination import encode_cursor, decode_cursor
 
 app = FastAPI(title="FastAPI Finance - Admin/User System")
 
+# Per-route-class concurrency limits; added first so CORS headers also go on its 503s
+if admission.ADMISSION_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+
 # Allow all CORS for local development (restrict in production)
 app.add_middleware(
     CORSMiddleware,
@@ -15,41 +28,118 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", READ_AFTER_HEADER],
 )
 
-# create tables if missing
-Base.metadata.create_all(bind=engine)
-
-# ensure unique constraint for (user_id, date) (Postgres-friendly)
-create_constraint_sql = text("""
-DO $$
-BEGIN
-  IF NOT EXISTS (
-    SELECT 1 FROM pg_constraint WHERE conname = 'unique_user_date'
-  ) THEN
-    ALTER TABLE daily_financials
-    ADD CONSTRAINT unique_user_date UNIQUE (user_id, date);
-  END IF;
-END
-$$;
-""")
-with engine.connect() as conn:
-    conn.execute(create_constraint_sql)
-    conn.commit()
+# read-your-writes token for the replica routing (see db.note_write)
+if replica_engine is not None:
+    app.add_middleware(ReadAfterMiddleware)
+
+# gzip/brotli for larger API responses (SSE and precompressed assets pass through)
+if compression.COMPRESSION_ENABLED:
+    app.add_middleware(compression.CompressionMiddleware)
+
+# Opt-in request profiling (Server-Timing header, per-request log, slow-query log)
+profiling.install(engine)
+if replica_engine is not None:
+    profiling.install(replica_engine)
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+# Schema changes are applied by `python -m app.migrate`, not at import time.
+@app.on_event("startup")
+def check_schema_version():
+    if not migrate.SKIP_SCHEMA_CHECK:
+        migrate.check()
+
+
+@app.on_event("startup")
+def reconcile_jobs():
+    # fail jobs left queued/running by workers that died without shutting down
+    jobs.reconcile()
+
+
+@app.on_event("startup")
+def start_partition_maintenance():
+    # creates upcoming audit_logs partitions (and archives expired ones) in the background
+    partitions.start_maintenance()
+
+
+@app.exception_handler(utils.HashPoolBusy)
+def hash_pool_busy_handler(request: Request, exc: utils.HashPoolBusy):
+    # shed password work early instead of queueing it behind a login burst
+    return JSONResponse(status_code=503, content={"detail": "Server busy, retry shortly"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(jobs.JobQueueFull)
+def job_queue_full_handler(request: Request, exc: jobs.JobQueueFull):
+    return JSONResponse(status_code=503, content={"detail": "Too many background jobs queued, retry later"},
+                        headers={"Retry-After": "10"})
+
+
+@app.exception_handler(changefeed.ChangeFeedFull)
+def change_feed_full_handler(request: Request, exc: changefeed.ChangeFeedFull):
+    return JSONResponse(status_code=503, content={"detail": "Too many change feed clients, retry later"},
+                        headers={"Retry-After": "30"})
+
+
+@app.on_event("startup")
+def start_change_feed():
+    # also carries principal cache invalidations between worker processes
+    if changefeed.CHANGEFEED_ENABLED:
+        changefeed.feed.start()
+    cache.require_invalidation(changefeed.CHANGEFEED_ENABLED)
+
+
+@app.on_event("startup")
+def start_replica_monitor():
+    if replica_monitor is not None:
+        replica_monitor.start()
+
+
+@app.on_event("shutdown")
+def stop_replica_monitor():
+    if replica_monitor is not None:
+        replica_monitor.stop()
+
+
+@app.on_event("shutdown")
+def stop_change_feed():
+    changefeed.feed.stop()
+
+
+@app.on_event("shutdown")
+def stop_partition_maintenance():
+    partitions.stop_maintenance()
+
+
+@app.on_event("shutdown")
+def shutdown_job_runner():
+    jobs.runner.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdown_hash_pool():
+    utils.shutdown_hash_pool()
+
+
+@app.on_event("shutdown")
+def drain_audit_sink():
+    audit.sink.close()
 
 
 # -------------------------
 # AUTH
 # -------------------------
 @app.post("/auth/login", response_model=schemas.Token)
-def login(data: schemas.LoginRequest, db: Session = Depends(get_db)):
+def login(data: schemas.LoginRequest, request: Request, db: Session = Depends(get_db)):
+    admission.check_login_rate(data.userid, request.client.host if request.client else None)
     user = crud.authenticate_user(db, data.userid, data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token_data = {"id": user.id, "userid": user.userid, "is_admin": user.is_admin}
     access_token = auth.create_access_token(token_data)
-    db.add(models.AuditLog(actor_user_id=user.id, action="login", details={"userid": user.userid}))
-    db.commit()
+    audit.record("login", actor_id=user.id, details={"userid": user.userid})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -57,7 +147,7 @@ def login(data: schemas.LoginRequest, db: Session = Depends(get_db)):
 # ADMIN endpoints
 # -------------------------
 @app.post("/admin/users", response_model=schemas.UserOut, status_code=201)
-def admin_create_user(user_in: schemas.UserCreate, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_create_user(user_in: schemas.UserCreate, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     existing = crud.get_user_by_userid(db, user_in.userid)
     if existing:
         raise HTTPException(status_code=400, detail="userid already exists")
@@ -65,56 +155,341 @@ def admin_create_user(user_in: schemas.UserCreate, admin: models.User = Depends(
     return created
 
 
-@app.get("/admin/users", response_model=list[schemas.UserOut])
-def admin_list_users(admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
-    return crud.list_users(db)
+@app.get("/admin/users", response_model=list[schemas.UserListOut])
+def admin_list_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=100),
+    match: str = Query("contains", pattern="^(contains|prefix)$"),
+    is_active: Optional[bool] = None,
+    is_admin: Optional[bool] = None,
+    stats: bool = False,
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_read_db),
+):
+    # stats=true adds records / last_date / lifetime totals per user; those change with
+    # daily data too, so that variant's version also covers every user's daily version
+    version = versions.users_stats_version(db) if stats else versions.current(db, versions.USERS)
+    tag = versions.etag(versions.USERS, version, versions.query_variant(request))
+    if versions.matches(request, tag):
+        return versions.not_modified(tag)
+    response.headers.update(versions.cache_headers(tag))
+    after_id = decode_cursor(cursor, int)[0] if cursor else None
+    rows = crud.list_users(db, limit=limit, after_id=after_id, search=q.strip() if q else None, match=match,
+                           is_active=is_active, is_admin=is_admin, with_stats=stats)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    return rows
 
 
 # *** Updated: admin_get_user_daily returns JSON-serializable primitives including is_deleted ***
 @app.get("/admin/user/{userid}/daily", response_model=list[schemas.DailyOut])
-def admin_get_user_daily(userid: str, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
-    rows = crud.get_user_daily_by_userid(db, userid)
-    if rows is None:
+def admin_get_user_daily(
+    userid: str,
+    request: Request,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_read_db),
+):
+    found = versions.daily_version_by_userid(db, userid)
+    if found is None:
         raise HTTPException(status_code=404, detail="User not found")
-    out = []
-    for r in rows:
-        out.append({
-            "id": int(r.id),
-            "user_id": int(r.user_id),
-            "date": str(r.date),
-            "total_deposit": float(r.total_deposit),
-            "total_withdraw": float(r.total_withdraw),
-            "created_at": str(r.created_at),
-            "is_deleted": bool(r.is_deleted)
-        })
-    return out
+    user_pk, version = found
+    return _daily_history(db, request, user_pk, version, date_from, date_to, limit, cursor)
+
+
+def _daily_history(db: Session, request: Request, user_pk: int, version: int,
+                   date_from: Optional[date], date_to: Optional[date], limit: Optional[int], cursor: Optional[str]):
+    # newest first; without limit the whole from/to window. Pass X-Next-Cursor back as ?cursor=
+    # for the next (older) page.
+    tag = versions.etag(versions.daily_scope(user_pk), version, versions.query_variant(request))
+    if versions.matches(request, tag):
+        return versions.not_modified(tag)
+    before = decode_cursor(cursor, date)[0] if cursor else None
+    rows = crud.list_user_daily(db, user_pk, date_from=date_from, date_to=date_to, before=before, limit=limit)
+    headers = versions.cache_headers(tag)
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][2])
+    return serializers.daily_list_response(rows, headers=headers)
 
 
 @app.get("/admin/logs", response_model=list[schemas.AuditOut])
-def admin_get_logs(admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
-    return crud.list_logs(db)
+def admin_get_logs(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    action: Optional[str] = None,
+    actor_user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    details: bool = True,
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_read_db),
+):
+    # pass X-Next-Cursor back as ?cursor= to fetch the next (older) page
+    after = decode_cursor(cursor, datetime, int) if cursor else None
+    rows, next_key = crud.list_logs(db, limit=limit, cursor=after, action=action, actor_user_id=actor_user_id,
+                                    since=since, until=until, include_details=details)
+    if next_key:
+        response.headers["X-Next-Cursor"] = encode_cursor(*next_key)
+    return rows
+
+
+@app.get("/admin/metrics")
+def admin_metrics(admin: auth.Principal = Depends(auth.require_admin)):
+    return {
+        "principal_cache": principal_cache.stats(),
+        "hash_pool": utils.hash_pool_stats(),
+        "audit_sink": audit.sink.stats(),
+        "db_pool": pool_stats(),
+        "jobs": jobs.runner.stats(),
+        "admission": admission.stats(),
+        "changefeed": changefeed.feed.stats(),
+        "replica": replica_monitor.stats() if replica_monitor is not None else None,
+    }
+
+
+# --- Admin live change feed (server-sent events) ---
+def _stream_admin(check) -> auth.Principal:
+    # own short Session: a get_db one would stay open (and maybe hold a connection) for the whole stream
+    db = SessionLocal()
+    try:
+        principal = check(db)
+    finally:
+        db.close()
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return principal
+
+
+@app.post("/admin/changes/ticket", response_model=schemas.StreamTicketOut)
+def admin_changes_ticket(token: str = Depends(auth.oauth2_scheme), admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    # EventSource can't send headers; browsers open the stream with ?ticket= from here
+    if not changefeed.CHANGEFEED_ENABLED:
+        raise HTTPException(status_code=404, detail="Change feed disabled")
+    return {"ticket": auth.issue_stream_ticket(db, admin, token), "expires_in": auth.STREAM_TICKET_SECONDS}
+
+
+@app.get("/admin/changes")
+async def admin_changes(request: Request, ticket: Optional[str] = None, last_event_id: Optional[str] = None):
+    # Authorization: Bearer, or a one-time ?ticket= (never the token itself in the URL, which
+    # proxies and access logs keep); a reconnecting browser passes ?last_event_id= with its new ticket
+    if not changefeed.CHANGEFEED_ENABLED:
+        raise HTTPException(status_code=404, detail="Change feed disabled")
+    scheme, _, bearer = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and bearer:
+        principal = await run_in_threadpool(_stream_admin, lambda db: auth.principal_for_token(bearer, db))
+        expires = auth.token_expires_at(bearer)
+    elif ticket:
+        redeemed = {}
+
+        def redeem(db):
+            principal, redeemed["expires"] = auth.redeem_stream_ticket(db, ticket)
+            return principal
+
+        principal = await run_in_threadpool(_stream_admin, redeem)
+        expires = redeemed["expires"]
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    async def still_allowed():
+        # the stream lives no longer than the token it was opened with, nor the admin's access
+        if expires is not None and datetime.now(expires.tzinfo) >= expires:
+            return False
+        try:
+            await run_in_threadpool(_stream_admin, lambda db: auth.principal_for_id(principal.id, db))
+            return True
+        except HTTPException:
+            return False
+
+    changefeed.feed.check_capacity()
+    return StreamingResponse(
+        changefeed.stream(request.headers.get("last-event-id") or last_event_id, still_allowed),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/admin/daily/import", response_model=schemas.BulkResult)
+async def admin_import_daily(request: Request, errors_only: bool = False, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    # body: CSV (text/csv, header userid,date,total_deposit,total_withdraw) or NDJSON (one object per line)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in ("text/csv", "application/x-ndjson", "application/ndjson"):
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    too_large = HTTPException(status_code=413, detail=f"At most {ingest.IMPORT_MAX_BYTES} bytes per import")
+    if int(request.headers.get("content-length") or 0) > ingest.IMPORT_MAX_BYTES:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > ingest.IMPORT_MAX_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    body = b"".join(chunks).decode("utf-8-sig", errors="replace")
+    parser = ingest.parse_csv if content_type == "text/csv" else ingest.parse_ndjson
+    try:
+        rows, errors = await run_in_threadpool(parser, body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(rows) + len(errors) > ingest.IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {ingest.IMPORT_MAX_ROWS} rows per import")
+    source = "csv" if content_type == "text/csv" else "ndjson"
+    result = await run_in_threadpool(crud.import_daily, db, rows, errors, admin.id, source)
+    if errors_only:
+        result["results"] = [r for r in result["results"] if r["status"] == "error"]
+    return result
+
+
+# --- Admin summaries (served from daily_rollups) ---
+@app.get("/admin/summary/user/{userid}", response_model=schemas.UserSummary)
+def admin_user_summary(userid: str, months: int = Query(12, ge=0, le=120), weeks: int = Query(12, ge=0, le=520),
+                       admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_read_db)):
+    summary = crud.get_user_summary(db, userid, months=months, weeks=weeks)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return summary
+
+
+@app.get("/admin/summary/leaderboard", response_model=list[schemas.LeaderboardEntry])
+def admin_leaderboard(period: str = Query("all", pattern="^(all|month|week)$"), start: Optional[date] = None,
+                      limit: int = Query(20, ge=1, le=500),
+                      admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_read_db)):
+    # start: any day inside the wanted month/week (default: the current one)
+    return crud.leaderboard(db, period=period, period_start=start, limit=limit)
+
+
+# --- Admin streaming exports ---
+def _export_response(request: Request, stmt, fields: list, fmt: str, name: str, principal_id: int):
+    filename = f"{name}-{datetime.utcnow():%Y%m%dT%H%M%SZ}.{fmt}"
+    return StreamingResponse(
+        export.stream_rows(stmt, fields, fmt, read_engine(principal_id, written_at(request, principal_id))),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/admin/export/daily")
+def admin_export_daily(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    userid: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    include_deleted: bool = False,
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_read_db),
+):
+    if userid is not None and not crud.get_user_by_userid(db, userid):
+        raise HTTPException(status_code=404, detail="User not found")
+    stmt = export.daily_query(userid, date_from, date_to, include_deleted)
+    return _export_response(request, stmt, export.DAILY_FIELDS, format, "daily_financials", admin.id)
+
+
+@app.get("/admin/export/logs")
+def admin_export_logs(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    action: Optional[str] = None,
+    actor_user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin: auth.Principal = Depends(auth.require_admin),
+):
+    stmt = export.logs_query(action, actor_user_id, since, until)
+    return _export_response(request, stmt, export.LOG_FIELDS, format, "audit_logs", admin.id)
+
+
+# --- Admin background jobs (purge, rollup rebuild, large exports) ---
+@app.post("/admin/jobs/export/daily", response_model=schemas.JobOut, status_code=202)
+def admin_export_daily_job(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    userid: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    include_deleted: bool = False,
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_db),
+):
+    if userid is not None and not crud.get_user_by_userid(db, userid):
+        raise HTTPException(status_code=404, detail="User not found")
+    stmt = export.daily_query(userid, date_from, date_to, include_deleted)
+    params = {"format": format, "userid": userid, "from": date_from and date_from.isoformat(),
+              "to": date_to and date_to.isoformat(), "include_deleted": include_deleted}
+    return jobs.runner.submit("export_daily", jobs.export_to_file(stmt, export.DAILY_FIELDS, format, "daily_financials", admin.id),
+                              params=params, actor_id=admin.id)
+
+
+@app.post("/admin/jobs/export/logs", response_model=schemas.JobOut, status_code=202)
+def admin_export_logs_job(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    action: Optional[str] = None,
+    actor_user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin: auth.Principal = Depends(auth.require_admin),
+):
+    stmt = export.logs_query(action, actor_user_id, since, until)
+    params = {"format": format, "action": action, "actor_user_id": actor_user_id,
+              "since": since and since.isoformat(), "until": until and until.isoformat()}
+    return jobs.runner.submit("export_logs", jobs.export_to_file(stmt, export.LOG_FIELDS, format, "audit_logs", admin.id),
+                              params=params, actor_id=admin.id)
+
+
+@app.post("/admin/jobs/rollups/rebuild", response_model=schemas.JobOut, status_code=202)
+def admin_rebuild_rollups_job(userid: Optional[str] = None, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    user_id = None
+    if userid is not None:
+        user = crud.get_user_by_userid(db, userid)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_id = user.id
+    return jobs.runner.submit("rebuild_rollups", jobs.rebuild_rollups(user_id, admin.id),
+                              params={"userid": userid}, actor_id=admin.id)
+
+
+@app.get("/admin/jobs", response_model=list[schemas.JobOut])
+def admin_list_jobs(limit: int = Query(50, ge=1, le=500), kind: Optional[str] = None, status: Optional[str] = None,
+                    admin: auth.Principal = Depends(auth.require_admin)):
+    return jobs.list_jobs(limit=limit, kind=kind, status=status)
+
+
+@app.get("/admin/jobs/{job_id}", response_model=schemas.JobOut)
+def admin_get_job(job_id: int, admin: auth.Principal = Depends(auth.require_admin)):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/admin/jobs/{job_id}/download")
+def admin_download_job(job_id: int, admin: auth.Principal = Depends(auth.require_admin)):
+    job = jobs.get(job_id)
+    if not job or not job["kind"].startswith("export_"):
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    path = jobs.result_path(job_id, job["result"]["format"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Export file expired")
+    return FileResponse(path, media_type=export.MEDIA_TYPES[job["result"]["format"]], filename=job["result"]["filename"])
 
 
 # --- Admin edit/delete/restore daily ---
 @app.put("/admin/daily/{daily_id}", response_model=schemas.DailyOut)
-def admin_update_daily(daily_id: int, payload: schemas.DailyIn, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_update_daily(daily_id: int, payload: schemas.DailyIn, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     updated = crud.update_daily(db, daily_id, payload.total_deposit, payload.total_withdraw, actor_id=admin.id)
     if not updated:
         raise HTTPException(status_code=404, detail="Daily record not found")
-    # serialize for response
-    return {
-        "id": int(updated.id),
-        "user_id": int(updated.user_id),
-        "date": str(updated.date),
-        "total_deposit": float(updated.total_deposit),
-        "total_withdraw": float(updated.total_withdraw),
-        "created_at": str(updated.created_at),
-        "is_deleted": bool(updated.is_deleted)
-    }
+    return serializers.daily_response(updated)
 
 
 @app.delete("/admin/daily/{daily_id}")
-def admin_delete_daily(daily_id: int, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_delete_daily(daily_id: int, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     row = crud.soft_delete_daily(db, daily_id, actor_id=admin.id)
     if not row:
         raise HTTPException(status_code=404, detail="Daily record not found")
@@ -122,16 +497,51 @@ def admin_delete_daily(daily_id: int, admin: models.User = Depends(auth.require_
 
 
 @app.post("/admin/daily/{daily_id}/restore")
-def admin_restore_daily(daily_id: int, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_restore_daily(daily_id: int, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     row = crud.restore_daily(db, daily_id, actor_id=admin.id)
     if not row:
         raise HTTPException(status_code=404, detail="Daily record not found")
     return {"detail": "restored"}
 
 
+# bulk variants: one statement for the whole list, one audit row per changed record
+MAX_BULK_IDS = 10000
+
+
+def _check_bulk_size(requested: list):
+    if len(requested) > MAX_BULK_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_IDS} entries per request")
+
+
+def _bulk_result(requested: list, rows: list, key: str) -> dict:
+    changed = [getattr(r, key) for r in rows]
+    found = set(changed)
+    return {"changed": changed, "not_found": sorted({k for k in requested if k not in found})}
+
+
+@app.put("/admin/daily", response_model=schemas.BulkChangeResult)
+def admin_update_daily_bulk(items: list[schemas.DailyUpdate], admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    ids = [i.id for i in items]
+    _check_bulk_size(ids)
+    rows = crud.update_daily_many(db, [(i.id, i.total_deposit, i.total_withdraw) for i in items], actor_id=admin.id)
+    return _bulk_result(ids, rows, "id")
+
+
+@app.post("/admin/daily/delete", response_model=schemas.BulkChangeResult)
+def admin_delete_daily_bulk(payload: schemas.DailyIds, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    _check_bulk_size(payload.ids)
+    return _bulk_result(payload.ids, crud.soft_delete_daily_many(db, payload.ids, actor_id=admin.id), "id")
+
+
+@app.post("/admin/daily/restore", response_model=schemas.BulkChangeResult)
+def admin_restore_daily_bulk(payload: schemas.DailyIds, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    _check_bulk_size(payload.ids)
+    return _bulk_result(payload.ids, crud.restore_daily_many(db, payload.ids, actor_id=admin.id), "id")
+
+
 # --- Admin user management endpoints ---
 @app.post("/admin/user/{userid}/deactivate")
-def admin_deactivate_user(userid: str, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_deactivate_user(userid: str, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     u = crud.deactivate_user(db, userid, actor_id=admin.id)
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
@@ -139,26 +549,53 @@ def admin_deactivate_user(userid: str, admin: models.User = Depends(auth.require
 
 
 @app.post("/admin/user/{userid}/restore")
-def admin_restore_user(userid: str, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
+def admin_restore_user(userid: str, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
     u = crud.restore_user(db, userid, actor_id=admin.id)
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
     return {"detail": "restored", "userid": userid}
 
 
+@app.post("/admin/users/deactivate", response_model=schemas.BulkChangeResult)
+def admin_deactivate_users(payload: schemas.UserIds, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    _check_bulk_size(payload.userids)
+    return _bulk_result(payload.userids, crud.deactivate_users(db, payload.userids, actor_id=admin.id), "userid")
+
+
+@app.post("/admin/users/restore", response_model=schemas.BulkChangeResult)
+def admin_restore_users(payload: schemas.UserIds, admin: auth.Principal = Depends(auth.require_admin), db: Session = Depends(get_db)):
+    _check_bulk_size(payload.userids)
+    return _bulk_result(payload.userids, crud.restore_users(db, payload.userids, actor_id=admin.id), "userid")
+
+
 @app.delete("/admin/user/{userid}")
-def admin_delete_user(userid: str, admin: models.User = Depends(auth.require_admin), db: Session = Depends(get_db)):
-    ok = crud.hard_delete_user(db, userid, actor_id=admin.id)
-    if not ok:
+def admin_delete_user(
+    userid: str,
+    response: Response,
+    run_async: bool = Query(False, alias="async"),
+    admin: auth.Principal = Depends(auth.require_admin),
+    db: Session = Depends(get_db),
+):
+    # deletes before responding; with ?async=1 the purge runs as a background job instead
+    # (202 + job_id, poll GET /admin/jobs/{id}), for users with a lot of history
+    if userid == admin.userid:
+        raise HTTPException(status_code=400, detail="Cannot delete your own account")
+    if not run_async:
+        if not crud.hard_delete_user(db, userid, actor_id=admin.id):
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"detail": "deleted", "userid": userid}
+    if not crud.get_user_by_userid(db, userid):
         raise HTTPException(status_code=404, detail="User not found")
-    return {"detail": "deleted", "userid": userid}
+    job = jobs.runner.submit("purge_user", jobs.purge_user(userid, admin.id), params={"userid": userid}, actor_id=admin.id)
+    response.status_code = 202
+    return {"detail": "queued", "userid": userid, "job_id": job["id"]}
 
 
 # -------------------------
 # USER endpoints
 # -------------------------
 @app.post("/user/daily", response_model=schemas.DailyOut)
-def user_post_daily(daily: schemas.DailyIn, user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def user_post_daily(daily: schemas.DailyIn, user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_db)):
     q = text("""
     INSERT INTO daily_financials (user_id, date, total_deposit, total_withdraw, created_at, is_deleted)
     VALUES (:uid, :date, :dep, :wit, now(), false)
@@ -170,35 +607,45 @@ def user_post_daily(daily: schemas.DailyIn, user: models.User = Depends(auth.get
     RETURNING id, user_id, date, total_deposit, total_withdraw, created_at, is_deleted;
     """)
     result = db.execute(q, {"uid": user.id, "date": daily.date, "dep": daily.total_deposit, "wit": daily.total_withdraw})
-    db.commit()
     row = result.fetchone()
-    db.add(models.AuditLog(actor_user_id=user.id, action="submit_daily", details={"date": str(daily.date), "deposit": daily.total_deposit, "withdraw": daily.total_withdraw}))
+    versions.bump(db, versions.daily_scope(user.id))
     db.commit()
-    resp = {
-        "id": int(row.id),
-        "user_id": int(row.user_id),
-        "date": str(row.date),
-        "total_deposit": float(row.total_deposit),
-        "total_withdraw": float(row.total_withdraw),
-        "created_at": str(row.created_at),
-        "is_deleted": bool(row.is_deleted)
-    }
-    return resp
+    audit.record("submit_daily", actor_id=user.id, details={"date": str(daily.date), "deposit": daily.total_deposit, "withdraw": daily.total_withdraw})
+    return serializers.daily_response(row)
+
+
+USER_BATCH_MAX_ROWS = 10000
+
+@app.post("/user/daily/batch", response_model=schemas.BulkResult)
+def user_post_daily_batch(items: list[schemas.DailyIn], user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    if len(items) > USER_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {USER_BATCH_MAX_ROWS} rows per batch")
+    rows, errors = [], []
+    for n, d in enumerate(items, start=1):
+        try:
+            rows.append((n, user.id, d.date, ingest.amount(d.total_deposit), ingest.amount(d.total_withdraw)))
+        except ValueError as e:
+            errors.append((n, str(e)))
+    return crud.bulk_upsert_daily(db, rows, user.id, "user_batch", errors)
 
 
 # *** Updated: user_get_daily returns primitives so frontend can display history reliably ***
 @app.get("/user/daily", response_model=list[schemas.DailyOut])
-def user_get_daily(user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    rows = db.query(models.DailyFinancial).filter(models.DailyFinancial.user_id == user.id, models.DailyFinancial.is_deleted == False).order_by(models.DailyFinancial.date.desc()).all()
-    out = []
-    for r in rows:
-        out.append({
-            "id": int(r.id),
-            "user_id": int(r.user_id),
-            "date": str(r.date),
-            "total_deposit": float(r.total_deposit),
-            "total_withdraw": float(r.total_withdraw),
-            "created_at": str(r.created_at),
-            "is_deleted": bool(r.is_deleted)
-        })
-    return out
+def user_get_daily(
+    request: Request,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    version = versions.current(db, versions.daily_scope(user.id))
+    return _daily_history(db, request, user.id, version, date_from, date_to, limit, cursor)
+
+
+# -------------------------
+# FRONTEND (optional; mounted last so every API route above takes precedence)
+# -------------------------
+if static.SERVE_FRONTEND:
+    app.mount("/", static.FrontendApp(), name="frontend")
@@ -0,0 +1,319 @@
+# app/migrate.py
+#
+# Versioned schema migrations. Applied versions are recorded in schema_migrations;
+# the app itself only checks the version at startup (see check()).
+#
+#   python -m app.migrate           # apply pending migrations
+#   python -m app.migrate status    # show applied / pending versions
+import os
+import sys
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.db import engine
+from app import rollups, partitions, changefeed
+
+load_dotenv()
+
+# SKIP_SCHEMA_CHECK=1 starts workers without touching the database at all.
+SKIP_SCHEMA_CHECK = os.getenv("SKIP_SCHEMA_CHECK", "0") == "1"
+
+# arbitrary constant; serializes concurrent `migrate` runs across processes
+MIGRATION_LOCK_KEY = 72160414
+
+
+def _sql(statements: str):
+    def apply(conn):
+        conn.execute(text(statements))
+    return apply
+
+
+# 1: the schema the app used to create at import time (create_all + unique_user_date),
+#    written out explicitly and idempotently so existing databases adopt it as-is.
+_baseline = _sql("""
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    userid TEXT NOT NULL,
+    full_name TEXT,
+    password_hash TEXT NOT NULL,
+    is_admin BOOLEAN,
+    is_active BOOLEAN NOT NULL DEFAULT true,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT true;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_userid ON users (userid);
+CREATE INDEX IF NOT EXISTS ix_users_id ON users (id);
+
+CREATE TABLE IF NOT EXISTS daily_financials (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    total_deposit NUMERIC(14, 2),
+    total_withdraw NUMERIC(14, 2),
+    created_at TIMESTAMPTZ DEFAULT now(),
+    is_deleted BOOLEAN NOT NULL DEFAULT false
+);
+ALTER TABLE daily_financials ADD COLUMN IF NOT EXISTS is_deleted BOOLEAN NOT NULL DEFAULT false;
+CREATE INDEX IF NOT EXISTS ix_daily_financials_id ON daily_financials (id);
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conname = 'unique_user_date'
+  ) THEN
+    ALTER TABLE daily_financials
+    ADD CONSTRAINT unique_user_date UNIQUE (user_id, date);
+  END IF;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id SERIAL PRIMARY KEY,
+    actor_user_id INTEGER REFERENCES users (id),
+    action TEXT NOT NULL,
+    details JSONB,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_id ON audit_logs (id);
+""")
+
+# 2: keyset paging / filters of /admin/logs
+_audit_log_indexes = _sql("""
+CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at_id ON audit_logs (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_action_created_at_id ON audit_logs (action, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_audit_logs_actor_created_at_id ON audit_logs (actor_user_id, created_at, id);
+""")
+
+# 3: per-user/period totals and the triggers maintaining them
+_create_rollups_table = _sql("""
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    period TEXT NOT NULL,
+    period_start DATE NOT NULL,
+    total_deposit NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    total_withdraw NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    days INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period, period_start)
+);
+CREATE INDEX IF NOT EXISTS ix_daily_rollups_period_net
+    ON daily_rollups (period, period_start, (total_deposit - total_withdraw) DESC);
+""")
+
+def _rollups(conn):
+    _create_rollups_table(conn)
+    rollups.install(conn)
+
+# 4: change counters behind the ETags
+_change_versions = _sql("""
+CREATE TABLE IF NOT EXISTS change_versions (
+    scope TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+""")
+
+# 5: user hard deletes are one set-based DELETE; audit history survives with a NULL actor
+_audit_actor_set_null = _sql("""
+DO $$
+DECLARE c record;
+BEGIN
+  FOR c IN SELECT conname FROM pg_constraint
+           WHERE conrelid = 'audit_logs'::regclass AND confrelid = 'users'::regclass AND contype = 'f'
+  LOOP
+    EXECUTE format('ALTER TABLE audit_logs DROP CONSTRAINT %I', c.conname);
+  END LOOP;
+END
+$$;
+ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_actor_user_id_fkey
+    FOREIGN KEY (actor_user_id) REFERENCES users (id) ON DELETE SET NULL NOT VALID;
+ALTER TABLE audit_logs VALIDATE CONSTRAINT audit_logs_actor_user_id_fkey;
+""")
+
+# 6: status of background admin jobs (app.jobs)
+_jobs = _sql("""
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    params JSONB,
+    result JSONB,
+    error TEXT,
+    actor_user_id INTEGER REFERENCES users (id) ON DELETE SET NULL,
+    worker TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+""")
+
+# 7: audit_logs range-partitioned by month (see app.partitions); existing rows are copied over
+_partition_audit_logs_sql = _sql("""
+DROP INDEX IF EXISTS ix_audit_logs_id;
+DROP INDEX IF EXISTS ix_audit_logs_created_at_id;
+DROP INDEX IF EXISTS ix_audit_logs_action_created_at_id;
+DROP INDEX IF EXISTS ix_audit_logs_actor_created_at_id;
+ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned;
+ALTER INDEX audit_logs_pkey RENAME TO audit_logs_unpartitioned_pkey;
+ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE;
+ALTER SEQUENCE audit_logs_id_seq AS BIGINT;
+
+CREATE TABLE audit_logs (
+    id BIGINT NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+    actor_user_id INTEGER REFERENCES users (id) ON DELETE SET NULL,
+    action TEXT NOT NULL,
+    details JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id;
+CREATE INDEX ix_audit_logs_created_at_id ON audit_logs (created_at, id);
+CREATE INDEX ix_audit_logs_action_created_at_id ON audit_logs (action, created_at, id);
+CREATE INDEX ix_audit_logs_actor_created_at_id ON audit_logs (actor_user_id, created_at, id);
+CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+""")
+
+def _partition_audit_logs(conn):
+    _partition_audit_logs_sql(conn)
+    oldest, now = conn.execute(text("SELECT min(created_at), now() FROM audit_logs_unpartitioned")).one()
+    partitions.ensure_partitions(conn, (oldest or now).date(),
+                                 partitions.add_months(now.date(), partitions.AUDIT_PARTITION_MONTHS_AHEAD))
+    conn.execute(text("""
+        INSERT INTO audit_logs (id, actor_user_id, action, details, created_at)
+        SELECT id, actor_user_id, action, details, COALESCE(created_at, now()) FROM audit_logs_unpartitioned
+    """))
+    conn.execute(text("DROP TABLE audit_logs_unpartitioned"))
+    conn.execute(text("ANALYZE audit_logs"))
+
+# 8: /admin/users search: prefix via btree pattern ops, substring via pg_trgm when the server has it
+_users_search = _sql("""
+CREATE INDEX IF NOT EXISTS ix_users_userid_lower_prefix ON users (lower(userid) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS ix_users_full_name_lower_prefix ON users (lower(full_name) text_pattern_ops);
+DO $$
+BEGIN
+  BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+  EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm unavailable (%), substring user search will scan users', SQLERRM;
+  END;
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+    EXECUTE 'CREATE INDEX IF NOT EXISTS ix_users_userid_trgm ON users USING gin (lower(userid) gin_trgm_ops)';
+    EXECUTE 'CREATE INDEX IF NOT EXISTS ix_users_full_name_trgm ON users USING gin (lower(full_name) gin_trgm_ops)';
+  END IF;
+END
+$$;
+""")
+
+# 9: NOTIFY triggers feeding the admin change feed (see app.changefeed)
+def _change_feed(conn):
+    changefeed.install(conn)
+
+# 10: partial covering index for date-windowed history (crud.list_user_daily)
+_daily_history_index = _sql("""
+CREATE INDEX IF NOT EXISTS ix_daily_financials_user_date_live
+    ON daily_financials (user_id, date DESC)
+    INCLUDE (id, total_deposit, total_withdraw, created_at)
+    WHERE NOT is_deleted;
+ANALYZE daily_financials;
+""")
+
+# 11: change feed triggers skip sessions with webwork.changefeed = 'off' (see app.changefeed)
+def _change_feed_guard(conn):
+    changefeed.install(conn)
+
+# 12: one-time tickets authenticating the admin change feed stream (see app.auth)
+_stream_tickets = _sql("""
+CREATE UNLOGGED TABLE IF NOT EXISTS stream_tickets (
+    ticket_hash TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ NOT NULL,
+    token_expires_at TIMESTAMPTZ
+);
+""")
+
+# (version, name, apply(conn)) -- append only, never edit an applied migration
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "audit_log_indexes", _audit_log_indexes),
+    (3, "daily_rollups", _rollups),
+    (4, "change_versions", _change_versions),
+    (5, "audit_actor_set_null", _audit_actor_set_null),
+    (6, "jobs", _jobs),
+    (7, "partition_audit_logs", _partition_audit_logs),
+    (8, "users_search", _users_search),
+    (9, "change_feed", _change_feed),
+    (10, "daily_history_index", _daily_history_index),
+    (11, "change_feed_guard", _change_feed_guard),
+    (12, "stream_tickets", _stream_tickets),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def _ensure_table(conn):
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """))
+
+
+def applied_versions(conn) -> set:
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def migrate(bind=engine, log=print) -> list:
+    # applies pending migrations, each in its own transaction; returns the versions applied
+    done = []
+    with bind.connect() as conn:
+        for version, name, apply in MIGRATIONS:
+            with conn.begin():
+                # transaction-scoped lock: also safe behind a transaction-mode pooler
+                conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+                _ensure_table(conn)
+                if version in applied_versions(conn):
+                    continue
+                log(f"applying {version:04d}_{name}")
+                apply(conn)
+                conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                             {"v": version, "n": name})
+            done.append(version)
+    return done
+
+
+def current_version(bind=engine) -> int:
+    try:
+        with bind.connect() as conn:
+            return conn.execute(text("SELECT COALESCE(max(version), 0) FROM schema_migrations")).scalar()
+    except ProgrammingError:  # schema_migrations does not exist yet
+        return 0
+
+
+def check(bind=engine):
+    # the one startup query: refuse to serve against an out-of-date schema
+    version = current_version(bind)
+    if version < LATEST:
+        raise RuntimeError(
+            f"Database schema is at version {version}, this code needs {LATEST}. Run: python -m app.migrate"
+        )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "status":
+        with engine.connect() as conn:
+            try:
+                applied = applied_versions(conn)
+            except ProgrammingError:
+                applied = set()
+        for version, name, _ in MIGRATIONS:
+            print(f"{'applied' if version in applied else 'pending':8} {version:04d}_{name}")
+        return
+    if argv:
+        raise SystemExit("usage: python -m app.migrate [status]")
+    done = migrate()
+    print(f"applied {len(done)} migration(s); schema at version {LATEST}" if done else f"schema up to date (version {LATEST})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, Boolean, Date, Numeric, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Text, Boolean, Date, Numeric, TIMESTAMP, ForeignKey, Index, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from app.db import Base
@@ -15,9 +15,10 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
-    # cascade deletes daily entries when user is hard-deleted
-    daily = relationship("DailyFinancial", back_populates="user", cascade="all, delete-orphan")
-    logs = relationship("AuditLog", back_populates="actor")
+    # hard deletes are left to the database: daily rows go via ON DELETE CASCADE and
+    # audit rows keep their history with actor_user_id SET NULL, without loading either
+    daily = relationship("DailyFinancial", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    logs = relationship("AuditLog", back_populates="actor", passive_deletes=True)
 
 
 class DailyFinancial(Base):
@@ -33,13 +34,81 @@ class DailyFinancial(Base):
 
     user = relationship("User", back_populates="daily")
 
+    __table_args__ = (
+        # history reads (crud.list_user_daily) as index-only scans
+        Index("ix_daily_financials_user_date_live", "user_id", text("date DESC"),
+              postgresql_include=["id", "total_deposit", "total_withdraw", "created_at"],
+              postgresql_where=text("NOT is_deleted")),
+    )
+
 
 class AuditLog(Base):
+    # Partitioned by month on created_at (app.partitions); the table's primary key is
+    # (id, created_at), id alone is unique through its sequence and identifies rows here.
     __tablename__ = "audit_logs"
-    id = Column(Integer, primary_key=True, index=True)
-    actor_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    id = Column(BigInteger, primary_key=True)
+    actor_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     action = Column(Text, nullable=False)
     details = Column(JSONB)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
     actor = relationship("User", back_populates="logs")
+
+    # keyset paging of /admin/logs on (created_at, id), optionally filtered by action or actor
+    __table_args__ = (
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),
+        Index("ix_audit_logs_action_created_at_id", "action", "created_at", "id"),
+        Index("ix_audit_logs_actor_created_at_id", "actor_user_id", "created_at", "id"),
+    )
+
+
+class DailyRollup(Base):
+    # Running totals of non-deleted daily_financials per user and period
+    # ('all' with period_start 1970-01-01, 'month', 'week'). Maintained by the
+    # triggers installed by app.rollups; rebuild with `python -m app.rollups rebuild`.
+    __tablename__ = "daily_rollups"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(Text, primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    total_deposit = Column(Numeric(16, 2), nullable=False, default=0)
+    total_withdraw = Column(Numeric(16, 2), nullable=False, default=0)
+    days = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # leaderboard: top users by net flow within one period
+        Index("ix_daily_rollups_period_net", "period", "period_start", text("(total_deposit - total_withdraw) DESC")),
+    )
+
+
+class ChangeVersion(Base):
+    # Monotonic change counter per scope ("users", "daily:<user id>"), bumped in the
+    # same transaction as the change; read endpoints derive their ETags from it.
+    __tablename__ = "change_versions"
+    scope = Column(Text, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class Job(Base):
+    # Background admin jobs (app.jobs). Rows are written by the worker process that
+    # runs the job so any worker can report its status.
+    __tablename__ = "jobs"
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(Text, nullable=False)
+    status = Column(Text, nullable=False, default="queued")  # queued | running | succeeded | failed
+    params = Column(JSONB)
+    result = Column(JSONB)
+    error = Column(Text)
+    actor_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    worker = Column(Text)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(TIMESTAMP(timezone=True))
+    finished_at = Column(TIMESTAMP(timezone=True))
+
+
+class StreamTicket(Base):
+    # One-time credentials for GET /admin/changes (app.auth.issue_stream_ticket); unlogged.
+    __tablename__ = "stream_tickets"
+    ticket_hash = Column(Text, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    token_expires_at = Column(TIMESTAMP(timezone=True))
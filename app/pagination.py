@@ -0,0 +1,28 @@
+# app/pagination.py
+import base64
+from datetime import date, datetime
+from fastapi import HTTPException
+
+# Opaque keyset cursors: the sort key of the last row of a page, base64 encoded.
+# Values are kept as strings and parsed back by the caller-provided types.
+
+def encode_cursor(*values) -> str:
+    raw = "|".join(v.isoformat() if isinstance(v, (date, datetime)) else str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if len(parts) != len(types):
+            raise ValueError(cursor)
+        return tuple(_parse(t, p) for t, p in zip(types, parts))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse(t, value: str):
+    if t is datetime:
+        return datetime.fromisoformat(value)
+    if t is date:
+        return date.fromisoformat(value)
+    return t(value)
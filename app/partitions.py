@@ -0,0 +1,376 @@
+# app/partitions.py
+#
+# audit_logs is range-partitioned by month on created_at (migration 7): one
+# audit_logs_pYYYYMM table per month, plus audit_logs_default for anything outside
+# them so writes never fail. maintain() creates the partitions for the coming
+# AUDIT_PARTITION_MONTHS_AHEAD months and, when AUDIT_RETENTION_MONTHS is set,
+# archives older partitions to gzip-compressed NDJSON under AUDIT_ARCHIVE_DIR
+# and drops them. Each app worker runs it every AUDIT_PARTITION_MAINTENANCE_HOURS
+# (one at a time, via transaction-scoped advisory locks); it can also be run from cron:
+#
+#   python -m app.partitions status
+#   python -m app.partitions maintain
+#   python -m app.partitions import audit_archive/audit_logs_p202401.ndjson.gz [--table audit_logs_restored]
+#
+# Importing into audit_logs restores the month in place; if it is older than the
+# retention window the next maintain() archives it again, so use --table to load
+# an archive into a standalone table for a one-off look instead.
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.db import engine
+
+load_dotenv()
+
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "3"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "0"))  # 0 keeps every month
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+AUDIT_PARTITION_MAINTENANCE_HOURS = float(os.getenv("AUDIT_PARTITION_MAINTENANCE_HOURS", "6"))  # 0: cron/CLI only
+
+PARENT = "audit_logs"
+DEFAULT_PARTITION = "audit_logs_default"
+COLUMNS = ["id", "actor_user_id", "action", "details", "created_at"]
+
+# arbitrary constant, next to migrate.MIGRATION_LOCK_KEY
+MAINTENANCE_LOCK_KEY = 72160415
+
+logger = logging.getLogger("app.partitions")
+
+_NAME = re.compile(r"^audit_logs_p(\d{4})(\d{2})$")
+_IDENT = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    m = month.year * 12 + month.month - 1 + n
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"audit_logs_p{month:%Y%m}"
+
+
+def _bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def list_partitions(conn) -> list:
+    # month starts of the attached monthly partitions, oldest first
+    names = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs'::regclass
+    """)).scalars()
+    months = []
+    for name in names:
+        m = _NAME.match(name)
+        if m:
+            months.append(date(int(m.group(1)), int(m.group(2)), 1))
+    return sorted(months)
+
+
+_cache_lock = threading.Lock()
+_cache = {"at": 0.0, "months": []}
+
+
+def cached_partitions(conn, ttl: float = 60.0) -> list:
+    # only used to split reads into per-partition windows, so a stale list costs
+    # an extra query at worst, never rows
+    with _cache_lock:
+        if time.monotonic() - _cache["at"] < ttl:
+            return _cache["months"]
+    months = list_partitions(conn)
+    with _cache_lock:
+        _cache.update(at=time.monotonic(), months=months)
+    return months
+
+
+def windows(conn) -> list:
+    # (lo, hi) created_at ranges covering all time, newest first, each of which the
+    # planner prunes to a single monthly partition (plus the default one at the ends);
+    # the still-empty future partitions share the current month's window
+    this_month = month_start(datetime.now(timezone.utc))
+    starts = [_bound(m) for m in cached_partitions(conn) if m <= this_month]
+    if not starts:
+        return [(None, None)]
+    out = [(starts[-1], None)]
+    for i in range(len(starts) - 1, 0, -1):
+        out.append((starts[i - 1], starts[i]))
+    out[-1] = (None, out[-1][1])
+    return out
+
+
+def create_partition(conn, month: date) -> bool:
+    # idempotent; rows already sitting in the default partition for that month are moved in
+    month = month_start(month)
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is not None:
+        return False
+    params = {"lo": _bound(month), "hi": _bound(add_months(month, 1))}
+    in_range = "created_at >= :lo AND created_at < :hi"
+    stray = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"), params).scalar()
+    if stray:
+        conn.execute(text(f"CREATE TEMP TABLE _audit_moved (LIKE {PARENT}) ON COMMIT DROP"))
+        conn.execute(text(f"""
+            WITH m AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *)
+            INSERT INTO _audit_moved SELECT * FROM m
+        """), params)
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{params['lo'].isoformat()}') TO ('{params['hi'].isoformat()}')"
+    ))
+    if stray:
+        conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM _audit_moved"))
+        conn.execute(text("DROP TABLE _audit_moved"))
+    return True
+
+
+def ensure_partitions(conn, first: date, last: date) -> list:
+    # creates the monthly partitions for first..last (inclusive); returns the new names
+    created = []
+    month = month_start(first)
+    while month <= month_start(last):
+        if create_partition(conn, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def _row_json(row) -> bytes:
+    obj = dict(zip(COLUMNS, row))
+    obj["created_at"] = obj["created_at"].isoformat()
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+def _archive_path(archive_dir: str, name: str) -> str:
+    # an archive of this month may exist already (rows stranded in the default partition,
+    # or a restored month archived again); never overwrite it
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    if os.path.exists(path):
+        path = os.path.join(archive_dir, f"{name}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.ndjson.gz")
+    return path
+
+
+def archive_partition(conn, month: date, archive_dir: str = AUDIT_ARCHIVE_DIR) -> Optional[tuple]:
+    # dump one month to <archive_dir>/audit_logs_pYYYYMM.ndjson.gz, then detach and drop it,
+    # all in one transaction: the file is in place (and fsynced) before the rows go away.
+    # A transaction-scoped advisory lock per month (safe behind a transaction-mode pooler)
+    # keeps two workers off the same partition; returns None if another one has it, or
+    # already archived it.
+    name = partition_name(month)
+    os.makedirs(archive_dir, exist_ok=True)
+    rows = 0
+    with conn.begin():
+        locked = conn.execute(text("SELECT pg_try_advisory_xact_lock(:k, :m)"),
+                              {"k": MAINTENANCE_LOCK_KEY, "m": month.year * 100 + month.month}).scalar()
+        if not locked or conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is None:
+            return None
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        conn.execute(text(f"LOCK TABLE {name} IN SHARE ROW EXCLUSIVE MODE"))
+        result = conn.execute(text(f"SELECT {', '.join(COLUMNS)} FROM {name} ORDER BY created_at, id"),
+                              execution_options={"stream_results": True, "yield_per": 5000})
+        path = _archive_path(archive_dir, name)
+        fd, tmp = tempfile.mkstemp(prefix=f"{name}.", suffix=".part", dir=archive_dir)
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                    for batch in result.partitions():
+                        gz.write(b"".join(_row_json(r) for r in batch))
+                        rows += len(batch)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+    with _cache_lock:
+        _cache["at"] = 0.0
+    return path, rows
+
+
+def stranded_months(conn, before: date) -> list:
+    # months before `before` with rows in the default partition (written while their
+    # partition didn't exist); they get a partition so they can be archived like the rest
+    return list(conn.execute(text(f"""
+        SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date AS month
+        FROM {DEFAULT_PARTITION} WHERE created_at < :before ORDER BY month
+    """), {"before": _bound(before)}).scalars())
+
+
+def maintain(today: Optional[date] = None, ahead: int = AUDIT_PARTITION_MONTHS_AHEAD,
+             retention_months: int = AUDIT_RETENTION_MONTHS, archive_dir: str = AUDIT_ARCHIVE_DIR, log=logger.info) -> dict:
+    today = today or datetime.now(timezone.utc).date()
+    this_month = month_start(today)
+    cutoff = add_months(this_month, -retention_months) if retention_months > 0 else None
+    # Only transaction-scoped advisory locks, so this also works behind a transaction-mode
+    # pooler (DB_PGBOUNCER_MODE): one for creating partitions, one per archived month.
+    with engine.connect() as conn:
+        with conn.begin():
+            if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": MAINTENANCE_LOCK_KEY}).scalar():
+                return {"skipped": "another worker is running maintenance"}
+            # creating a partition briefly locks audit_logs; give up rather than queue writers behind it
+            conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            created = ensure_partitions(conn, this_month, add_months(this_month, ahead))
+            if cutoff is not None:
+                for month in stranded_months(conn, cutoff):
+                    if create_partition(conn, month):
+                        created.append(partition_name(month))
+            months = list_partitions(conn)
+        for name in created:
+            log(f"created partition {name}")
+        archived = []
+        if cutoff is not None:
+            for month in months:
+                if add_months(month, 1) <= cutoff:
+                    done = archive_partition(conn, month, archive_dir)
+                    if done is None:
+                        continue
+                    path, rows = done
+                    log(f"archived {partition_name(month)}: {rows} rows -> {path}")
+                    archived.append({"partition": partition_name(month), "rows": rows, "path": path})
+    if created:
+        with _cache_lock:
+            _cache["at"] = 0.0
+    return {"created": created, "archived": archived}
+
+
+_IMPORT_SQL = """
+INSERT INTO {table} (id, actor_user_id, action, details, created_at)
+SELECT r.id, {actor}, r.action, r.details, r.created_at
+FROM unnest(CAST(:ids AS bigint[]), CAST(:actors AS integer[]), CAST(:actions AS text[]),
+            CAST(:details AS jsonb[]), CAST(:created AS timestamptz[])) AS r(id, actor, action, details, created_at)
+{join}
+ON CONFLICT DO NOTHING
+"""
+
+
+def _import_batch(batch: list, table: Optional[str]) -> int:
+    params = {
+        "ids": [r["id"] for r in batch],
+        "actors": [r["actor_user_id"] for r in batch],
+        "actions": [r["action"] for r in batch],
+        "details": [None if r["details"] is None else json.dumps(r["details"]) for r in batch],
+        "created": [r["created_at"] for r in batch],
+    }
+    with engine.begin() as conn:
+        if table is None:
+            stamps = [datetime.fromisoformat(r["created_at"]).astimezone(timezone.utc) for r in batch]
+            ensure_partitions(conn, min(stamps), max(stamps))
+            # actors deleted since the archive was written come back as NULL, as they would have
+            sql = _IMPORT_SQL.format(table=PARENT, actor="u.id", join="LEFT JOIN users u ON u.id = r.actor")
+        else:
+            sql = _IMPORT_SQL.format(table=table, actor="r.actor", join="")
+        return conn.execute(text(sql), params).rowcount
+
+
+def import_archive(path: str, table: Optional[str] = None, batch_size: int = 5000) -> int:
+    # loads an archive back into audit_logs (or into `table`, created like audit_logs
+    # but unpartitioned and without foreign keys); rows already present are skipped
+    if table is not None:
+        if not _IDENT.match(table) or table == PARENT or table.startswith("audit_logs_p"):
+            raise ValueError(f"invalid table name {table!r}")
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (LIKE {PARENT} INCLUDING DEFAULTS)"))
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_id_created_at ON {table} (id, created_at)"))
+    inserted = 0
+    batch = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                inserted += _import_batch(batch, table)
+                batch = []
+    if batch:
+        inserted += _import_batch(batch, table)
+    return inserted
+
+
+# --- periodic maintenance inside the app ---
+_stop = threading.Event()
+_thread = None
+
+
+def start_maintenance():
+    global _thread
+    if AUDIT_PARTITION_MAINTENANCE_HOURS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+
+    def run():
+        while True:
+            try:
+                maintain()
+            except Exception:
+                logger.exception("audit partition maintenance failed")
+            if _stop.wait(AUDIT_PARTITION_MAINTENANCE_HOURS * 3600):
+                return
+
+    _thread = threading.Thread(target=run, name="audit-partitions", daemon=True)
+    _thread.start()
+
+
+def stop_maintenance():
+    _stop.set()
+
+
+def status(conn) -> dict:
+    rows = conn.execute(text("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs'::regclass
+        ORDER BY c.relname
+    """)).all()
+    default_rows = conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+    return {"partitions": [{"name": n, "est_rows": max(0, t), "bytes": b} for n, t, b in rows],
+            "default_rows": default_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list audit_logs partitions")
+    mt = sub.add_parser("maintain", help="create upcoming partitions, archive expired ones")
+    mt.add_argument("--retention-months", type=int, default=AUDIT_RETENTION_MONTHS)
+    mt.add_argument("--archive-dir", default=AUDIT_ARCHIVE_DIR)
+    im = sub.add_parser("import", help="load an archived month back")
+    im.add_argument("path")
+    im.add_argument("--table", help="load into this standalone table instead of audit_logs")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        with engine.connect() as conn:
+            info = status(conn)
+        for p in info["partitions"]:
+            print(f"{p['name']:24} ~{p['est_rows']:>10} rows {p['bytes'] / 1048576:10.1f} MiB")
+        print(f"{DEFAULT_PARTITION} holds {info['default_rows']} rows")
+    elif args.command == "maintain":
+        result = maintain(retention_months=args.retention_months, archive_dir=args.archive_dir, log=print)
+        if "skipped" in result:
+            print(result["skipped"])
+        elif not result["created"] and not result["archived"]:
+            print("nothing to do")
+    else:
+        started = time.perf_counter()
+        n = import_archive(args.path, args.table)
+        print(f"imported {n} rows into {args.table or PARENT} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
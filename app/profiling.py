@@ -0,0 +1,121 @@
+# app/profiling.py
+#
+# Opt-in per-request profiling. With PROFILING_ENABLED=1 every HTTP response gets a
+# Server-Timing header (db / hash / serialize / app) and one structured log line on
+# the "app.profiling" logger. SLOW_QUERY_MS logs individual slow statements and
+# works on its own. With both off nothing is hooked into the engine or the app.
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))          # 0 disables the slow-query log
+PROFILING_QUERY_WARN = int(os.getenv("PROFILING_QUERY_WARN", "0"))  # warn above N queries per request; 0 disables
+
+logger = logging.getLogger("app.profiling")
+
+_current = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("queries", "db_seconds", "rows", "timings")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.timings = {}
+
+    def server_timing(self, app_seconds: float) -> str:
+        parts = [f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries, {self.rows} rows"']
+        for name, seconds in self.timings.items():
+            parts.append(f"{name};dur={seconds * 1000:.2f}")
+        parts.append(f"app;dur={app_seconds * 1000:.2f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def timed(name: str):
+    # adds the block's duration to the current request's Server-Timing entry `name`
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.timings[name] = prof.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._profiling_started
+    prof = _current.get()
+    if prof is not None:
+        prof.queries += 1
+        prof.db_seconds += elapsed
+        if cursor.description is not None and cursor.rowcount > 0:
+            prof.rows += cursor.rowcount
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow query %.1fms: %s", elapsed * 1000, " ".join(statement.split())[:1000])
+
+
+def install(engine):
+    if PROFILING_ENABLED or SLOW_QUERY_MS:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    # pure ASGI so streaming responses pass through untouched
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        prof = RequestProfile()
+        token = _current.set(prof)
+        started = time.perf_counter()
+        status = [0]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", prof.server_timing(time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - started
+            record = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status[0],
+                "total_ms": round(total * 1000, 2),
+                "db_ms": round(prof.db_seconds * 1000, 2),
+                "queries": prof.queries,
+                "rows": prof.rows,
+            }
+            record.update({f"{k}_ms": round(v * 1000, 2) for k, v in prof.timings.items()})
+            logger.info(json.dumps(record))
+            if PROFILING_QUERY_WARN and prof.queries > PROFILING_QUERY_WARN:
+                logger.warning("%s %s issued %d queries (limit %d)", scope["method"], scope["path"],
+                               prof.queries, PROFILING_QUERY_WARN)
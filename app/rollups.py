@@ -0,0 +1,132 @@
+# app/rollups.py
+#
+# daily_rollups is kept in step with daily_financials by statement-level
+# triggers: each INSERT/UPDATE/DELETE statement folds its transition table into
+# the per-user 'all', 'month' and 'week' totals with one set-based upsert, so
+# bulk imports pay once per statement rather than once per row. Soft-deleted
+# rows do not count.
+#
+#   python -m app.rollups rebuild            # recompute everything from daily_financials
+#   python -m app.rollups rebuild --user bob # one user only
+import argparse
+from typing import Optional
+from sqlalchemy import text
+
+from app.db import engine
+
+LIFETIME_START = "1970-01-01"
+
+_merge_sql = """
+INSERT INTO daily_rollups AS r (user_id, period, period_start, total_deposit, total_withdraw, days)
+SELECT d.user_id, p.period, p.period_start, sum(d.dep), sum(d.wit), sum(d.days)
+FROM ({delta}) AS d
+-- rows removed by the cascade of a user delete have no user left to roll up into
+JOIN users u ON u.id = d.user_id
+CROSS JOIN LATERAL (VALUES
+    ('all', DATE '1970-01-01'),
+    ('month', date_trunc('month', d.date)::date),
+    ('week', date_trunc('week', d.date)::date)
+) AS p(period, period_start)
+GROUP BY d.user_id, p.period, p.period_start
+ON CONFLICT (user_id, period, period_start) DO UPDATE
+  SET total_deposit = r.total_deposit + EXCLUDED.total_deposit,
+      total_withdraw = r.total_withdraw + EXCLUDED.total_withdraw,
+      days = r.days + EXCLUDED.days
+"""
+
+_added = "SELECT user_id, date, COALESCE(total_deposit, 0) AS dep, COALESCE(total_withdraw, 0) AS wit, 1 AS days FROM new_rows WHERE NOT is_deleted"
+_removed = "SELECT user_id, date, -COALESCE(total_deposit, 0) AS dep, -COALESCE(total_withdraw, 0) AS wit, -1 AS days FROM old_rows WHERE NOT is_deleted"
+
+_deltas = {
+    "insert": _added,
+    "update": _added + " UNION ALL " + _removed,
+    "delete": _removed,
+}
+
+
+def _function_sql(op: str) -> str:
+    return f"""
+CREATE OR REPLACE FUNCTION daily_rollup_on_{op}() RETURNS trigger AS $$
+BEGIN
+{_merge_sql.format(delta=_deltas[op])};
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _trigger_sql(op: str) -> str:
+    referencing = {
+        "insert": "NEW TABLE AS new_rows",
+        "update": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "delete": "OLD TABLE AS old_rows",
+    }[op]
+    # transition tables allow only one event per trigger, hence three triggers
+    return f"""
+DROP TRIGGER IF EXISTS daily_financials_rollup_{op} ON daily_financials;
+CREATE TRIGGER daily_financials_rollup_{op}
+AFTER {op.upper()} ON daily_financials
+REFERENCING {referencing}
+FOR EACH STATEMENT EXECUTE PROCEDURE daily_rollup_on_{op}();
+"""
+
+
+def install(conn):
+    # idempotent; run by migration 0003 after creating daily_rollups
+    for op in _deltas:
+        conn.execute(text(_function_sql(op)))
+        conn.execute(text(_trigger_sql(op)))
+    # first install on a database that already has history: backfill once
+    needs_backfill = conn.execute(text(
+        "SELECT NOT EXISTS (SELECT 1 FROM daily_rollups) AND EXISTS (SELECT 1 FROM daily_financials)"
+    )).scalar()
+    if needs_backfill:
+        rebuild(conn)
+
+
+_rebuild_sql = """
+INSERT INTO daily_rollups (user_id, period, period_start, total_deposit, total_withdraw, days)
+SELECT d.user_id, p.period, p.period_start,
+       sum(COALESCE(d.total_deposit, 0)), sum(COALESCE(d.total_withdraw, 0)), count(*)
+FROM daily_financials d
+CROSS JOIN LATERAL (VALUES
+    ('all', DATE '1970-01-01'),
+    ('month', date_trunc('month', d.date)::date),
+    ('week', date_trunc('week', d.date)::date)
+) AS p(period, period_start)
+WHERE NOT d.is_deleted {user_filter}
+GROUP BY d.user_id, p.period, p.period_start
+"""
+
+
+def rebuild(conn, user_id: Optional[int] = None) -> int:
+    # recompute from scratch; blocks writers to daily_financials until the caller commits
+    conn.execute(text("LOCK TABLE daily_financials IN SHARE MODE"))
+    if user_id is None:
+        conn.execute(text("DELETE FROM daily_rollups"))
+        res = conn.execute(text(_rebuild_sql.format(user_filter="")))
+    else:
+        conn.execute(text("DELETE FROM daily_rollups WHERE user_id = :uid"), {"uid": user_id})
+        res = conn.execute(text(_rebuild_sql.format(user_filter="AND d.user_id = :uid")), {"uid": user_id})
+    return res.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rb = sub.add_parser("rebuild", help="recompute daily_rollups from daily_financials")
+    rb.add_argument("--user", help="userid to rebuild (default: everyone)")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        user_id = None
+        if args.user:
+            user_id = conn.execute(text("SELECT id FROM users WHERE userid = :u"), {"u": args.user}).scalar()
+            if user_id is None:
+                raise SystemExit(f"user {args.user!r} not found")
+        rows = rebuild(conn, user_id)
+    print(f"rebuilt {rows} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import date, datetime
-from typing import Optional, Any
+from typing import Optional, Any, List
 
 class Token(BaseModel):
     access_token: str
@@ -27,6 +27,13 @@ class UserOut(BaseModel):
     class Config:
         orm_mode = True
 
+class UserListOut(UserOut):
+    # filled in only with ?stats=true
+    records: Optional[int] = None
+    last_date: Optional[date] = None
+    total_deposit: Optional[float] = None
+    total_withdraw: Optional[float] = None
+
 class DailyIn(BaseModel):
     date: date
     total_deposit: float
@@ -54,3 +61,65 @@ class AuditOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+class DailyUpdate(BaseModel):
+    id: int
+    total_deposit: float
+    total_withdraw: float
+
+class DailyIds(BaseModel):
+    ids: List[int]
+
+class UserIds(BaseModel):
+    userids: List[str]
+
+class BulkChangeResult(BaseModel):
+    # ids / userids that matched and were changed, and the ones that don't exist
+    changed: List[Any]
+    not_found: List[Any]
+
+class BulkRowResult(BaseModel):
+    row: int
+    status: str  # "ok" or "error"
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    received: int
+    upserted: int
+    errors: int
+    results: List[BulkRowResult]
+
+class RollupOut(BaseModel):
+    period_start: date
+    total_deposit: float
+    total_withdraw: float
+    net: float
+    days: int
+
+class UserSummary(BaseModel):
+    userid: str
+    lifetime: RollupOut
+    monthly: List[RollupOut]
+    weekly: List[RollupOut]
+
+class LeaderboardEntry(RollupOut):
+    userid: str
+    full_name: Optional[str] = None
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    params: Optional[Any] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    actor_user_id: Optional[int] = None
+    worker: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class StreamTicketOut(BaseModel):
+    ticket: str
+    expires_in: int
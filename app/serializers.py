@@ -0,0 +1,59 @@
+# app/serializers.py
+import json
+from datetime import date, datetime
+from fastapi import Response
+
+from app import models
+from app.profiling import timed
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# Column order every daily row tuple follows (queries and RETURNING clauses).
+D = models.DailyFinancial
+DAILY_COLUMNS = (D.id, D.user_id, D.date, D.total_deposit, D.total_withdraw, D.created_at, D.is_deleted)
+
+
+def daily_dict(row) -> dict:
+    # same shape as schemas.DailyOut; dates stay native for the encoder
+    id_, user_id, day, deposit, withdraw, created_at, is_deleted = row
+    return {
+        "id": id_,
+        "user_id": user_id,
+        "date": day,
+        "total_deposit": float(deposit),
+        "total_withdraw": float(withdraw),
+        "created_at": created_at,
+        "is_deleted": is_deleted,
+    }
+
+
+def _default(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    raise TypeError(f"Object of type {type(v).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def json_response(obj, **kwargs) -> Response:
+    # already-encoded body; FastAPI skips response_model validation for Response objects
+    with timed("serialize"):
+        body = dumps(obj)
+    return Response(content=body, media_type="application/json", **kwargs)
+
+
+def daily_list_response(rows, **kwargs) -> Response:
+    with timed("serialize"):
+        items = [daily_dict(r) for r in rows]
+    return json_response(items, **kwargs)
+
+
+def daily_response(row, **kwargs) -> Response:
+    return json_response(daily_dict(row), **kwargs)
@@ -0,0 +1,389 @@
+# app/serve.py
+#
+# Production entry point: a pre-fork process manager around uvicorn.
+#
+#   python -m app.serve                               # SERVE_WORKERS workers (default: one per CPU)
+#   python -m app.serve --workers 4 --preload --host 0.0.0.0 --port 8000
+#
+# The parent binds the listening socket once and forks the workers, which all accept
+# from it, so workers can be replaced without refusing a connection:
+#   kill -HUP <parent>    rolling restart: one worker at a time, the replacement is
+#                         accepting before the old worker drains and exits
+#   kill -TERM <parent>   graceful stop (SIGINT / Ctrl-C too); a second signal kills
+# A worker that dies is replaced. A stopping worker finishes its in-flight requests
+# (up to SERVE_GRACEFUL_TIMEOUT) and ends its change feed streams right away; the
+# browsers reconnect to another worker.
+#
+# --preload imports app.main once in the parent, so workers start by fork() instead of
+# each importing it. Rolling restarts then reuse the code the parent loaded: restart
+# the parent to deploy new code (without --preload, HUP picks up new code).
+#
+# Workers share deactivations and deletions of users through the change feed (each
+# worker's cached principals are invalidated by its LISTEN connection); with
+# CHANGEFEED_ENABLED=0 and more than one worker the principal cache is turned off
+# (app.cache.require_invalidation, told the worker count through WEB_CONCURRENCY).
+#
+# With DB_CONNECTION_BUDGET set (the connections this deployment may hold on the
+# primary), DB_POOL_SIZE / DB_MAX_OVERFLOW are derived per worker so that all workers,
+# plus one more during a rolling restart, stay within it. Likewise HASH_POOL_BUDGET
+# password hashing processes (default one per CPU) are split into HASH_POOL_WORKERS.
+#
+# Nothing from app is imported at module level: the pool settings have to be in the
+# environment before app.db is first imported.
+import argparse
+import asyncio
+import gc
+import importlib
+import importlib.util
+import logging
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+from dotenv import load_dotenv
+
+import uvicorn
+
+load_dotenv()
+
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))                # 0 = one per CPU
+SERVE_PRELOAD = os.getenv("SERVE_PRELOAD", "0") == "1"
+SERVE_LOOP = os.getenv("SERVE_LOOP", "auto")                        # auto | uvloop | asyncio
+SERVE_HTTP = os.getenv("SERVE_HTTP", "auto")                        # auto | httptools | h11
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "2048"))
+SERVE_ACCESS_LOG = os.getenv("SERVE_ACCESS_LOG", "0") == "1"
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", "0"))  # 0 = use DB_POOL_SIZE / DB_MAX_OVERFLOW as set
+HASH_POOL_BUDGET = int(os.getenv("HASH_POOL_BUDGET", "0"))          # 0 = one per CPU
+
+APP = "app.main:app"
+WORKER_STARTUP_TIMEOUT = 60.0
+ACCEPTED_GRACE = 0.5      # a stopping worker reads requests on just-accepted connections before closing idle ones
+MAX_RESPAWN_DELAY = 30.0
+
+logger = logging.getLogger("app.serve")
+
+# choice -> (module it needs, fallback for "auto")
+_IMPLEMENTATIONS = {
+    "loop": {"uvloop": "uvloop", "asyncio": None},
+    "http": {"httptools": "httptools", "h11": "h11"},
+}
+
+
+def resolve(kind: str, choice: str) -> str:
+    options = _IMPLEMENTATIONS[kind]
+    if choice == "auto":
+        fast = next(iter(options))
+        return fast if importlib.util.find_spec(options[fast]) else list(options)[-1]
+    if choice not in options:
+        raise SystemExit(f"--{kind} must be auto or one of {', '.join(options)}")
+    module = options[choice]
+    if module and importlib.util.find_spec(module) is None:
+        raise SystemExit(f"--{kind} {choice} needs the {module} package (pip install {module})")
+    return choice
+
+
+def pool_sizes(budget: int, workers: int, changefeed: bool) -> tuple:
+    # (pool size, max overflow) per worker. One extra worker's share is kept for the
+    # overlap of a rolling restart; the change feed listener holds one more connection.
+    per_worker = budget // (workers + 1) - (1 if changefeed else 0)
+    if per_worker < 1:
+        raise SystemExit(f"DB_CONNECTION_BUDGET={budget} is too small for {workers} workers "
+                         f"(needs at least {(workers + 1) * (2 if changefeed else 1)})")
+    pool_size = max(1, per_worker // 2)
+    return pool_size, per_worker - pool_size
+
+
+def hash_pool_size(budget: int, workers: int) -> int:
+    # hashing processes per worker; 0 (more workers than budget) hashes inline, and the
+    # workers themselves already spread the hashing over the CPUs
+    return budget // workers
+
+
+class WorkerServer(uvicorn.Server):
+
+    def __init__(self, config, ready_fd: int, parent_pid: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+        self.parent_pid = parent_pid
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:  # lifespan startup succeeded: tell the parent we're accepting
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+    async def shutdown(self, sockets=None):
+        # uvicorn closes connections that have no request in progress right after it stops
+        # accepting; a connection accepted a moment earlier may not have had its request
+        # read yet, and its client would see the connection drop
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(ACCEPTED_GRACE)
+        await super().shutdown(sockets=sockets)
+
+    def handle_exit(self, sig, frame):
+        if not self.should_exit and "app.changefeed" in sys.modules:
+            # graceful shutdown waits for open responses; don't let SSE streams hold it up
+            sys.modules["app.changefeed"].feed.close_streams()
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if counter % 10 == 0 and os.getppid() != self.parent_pid:
+            logger.warning("parent process is gone, stopping worker %d", os.getpid())
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+
+class _Worker:
+
+    def __init__(self, pid: int, ready_fd: int):
+        self.pid = pid
+        self.ready_fd = ready_fd  # closed (None) once the worker reported, or failed to
+        self.started = time.monotonic()
+        self.ready = False
+        self.retiring = False
+
+
+class Supervisor:
+
+    def __init__(self, config, sock, workers: int, graceful_timeout: int):
+        self.config = config
+        self.sock = sock
+        self.count = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}        # pid -> _Worker
+        self.exited = {}         # pid -> wait status, for retiring workers
+        self.stopping = False
+        self.force = False
+        self.restart_requested = False
+        self.respawn_delay = 0.0
+        self.respawn_at = 0.0
+
+    # --- worker processes ---
+
+    def spawn(self) -> _Worker:
+        r, w = os.pipe()
+        parent = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            code = 0
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                    signal.signal(sig, signal.SIG_DFL)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                WorkerServer(self.config, w, parent).run(sockets=[self.sock])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(w)
+        worker = _Worker(pid, r)
+        self.workers[pid] = worker
+        return worker
+
+    def _poll_ready(self, timeout: float):
+        pending = {w.ready_fd: w for w in self.workers.values() if w.ready_fd is not None}
+        if not pending:
+            time.sleep(timeout)
+            return
+        try:
+            readable, _, _ = select.select(list(pending), [], [], timeout)
+        except InterruptedError:
+            return
+        for fd in readable:
+            worker = pending[fd]
+            worker.ready = os.read(fd, 1) == b"1"
+            os.close(fd)
+            worker.ready_fd = None
+            if worker.ready:
+                logger.info("worker %d ready in %.2fs", worker.pid, time.monotonic() - worker.started)
+                self.respawn_delay = 0.0
+        now = time.monotonic()
+        for worker in pending.values():
+            if worker.ready_fd is not None and now - worker.started > WORKER_STARTUP_TIMEOUT:
+                logger.error("worker %d did not start within %.0fs, killing it", worker.pid, WORKER_STARTUP_TIMEOUT)
+                self._signal(worker.pid, signal.SIGKILL)
+
+    def _reap(self) -> list:
+        # collects every exited child; returns the workers that died unexpectedly
+        died = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+                worker.ready_fd = None
+            self.exited[pid] = status
+            if not worker.retiring and not self.stopping:
+                died.append((worker, status))
+        return died
+
+    def _signal(self, pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _wait_gone(self, pids: list, timeout: float):
+        deadline = time.monotonic() + timeout
+        while any(pid in self.workers for pid in pids):
+            if self.force or time.monotonic() > deadline:
+                for pid in pids:
+                    if pid in self.workers:
+                        logger.warning("worker %d still running, killing it", pid)
+                        self._signal(pid, signal.SIGKILL)
+                deadline = float("inf")
+            self._handle_deaths(self._reap())
+            self._poll_ready(0.1)
+
+    def _retire(self, pids: list):
+        for pid in pids:
+            if pid in self.workers:
+                self.workers[pid].retiring = True
+                self._signal(pid, signal.SIGTERM)
+        # graceful shutdown of the workers themselves, plus a little slack
+        self._wait_gone(pids, self.graceful_timeout + 5)
+
+    def _handle_deaths(self, died: list):
+        for worker, status in died:
+            code = os.waitstatus_to_exitcode(status)
+            if worker.ready:
+                logger.error("worker %d exited unexpectedly (%s), replacing it", worker.pid, code)
+            else:
+                # crashed while starting: back off so a broken deploy doesn't fork in a loop
+                self.respawn_delay = min(MAX_RESPAWN_DELAY, max(1.0, self.respawn_delay * 2))
+                logger.error("worker %d failed to start (%s), retrying in %.0fs", worker.pid, code, self.respawn_delay)
+            self.respawn_at = time.monotonic() + (0 if worker.ready else self.respawn_delay)
+
+    # --- lifecycle ---
+
+    def _on_signal(self, sig, frame):
+        if sig == signal.SIGHUP:
+            self.restart_requested = True
+        elif self.stopping:
+            self.force = True
+        else:
+            self.stopping = True
+
+    def boot(self) -> bool:
+        # all workers must come up once; a failing startup (e.g. schema check) stops everything
+        for _ in range(self.count):
+            self.spawn()
+        while not self.stopping and not all(w.ready for w in self.workers.values()):
+            died = self._reap()
+            if died or len(self.workers) < self.count:
+                logger.error("a worker failed to start, stopping")
+                return False
+            self._poll_ready(0.2)
+        return not self.stopping
+
+    def rolling_restart(self):
+        self.restart_requested = False
+        old = [pid for pid, w in self.workers.items() if not w.retiring]
+        logger.info("rolling restart of %d worker(s)", len(old))
+        for pid in old:
+            if self.stopping:
+                return
+            if pid not in self.workers:
+                continue
+            new = self.spawn()
+            while new.pid in self.workers and not new.ready and not self.stopping:
+                self._handle_deaths([d for d in self._reap() if d[0] is not new])
+                self._poll_ready(0.2)
+            if self.stopping:
+                return
+            if not new.ready:
+                logger.error("replacement worker failed to start, keeping the remaining old workers")
+                return
+            self._retire([pid])
+        logger.info("rolling restart done")
+
+    def run(self) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self._on_signal)
+        logger.info("starting %d worker(s), parent pid %d", self.count, os.getpid())
+        ok = self.boot()
+        while ok and not self.stopping:
+            if self.restart_requested:
+                self.rolling_restart()
+                continue
+            self._handle_deaths(self._reap())
+            missing = self.count - sum(1 for w in self.workers.values() if not w.retiring)
+            if missing > 0 and time.monotonic() >= self.respawn_at:
+                self.spawn()
+            self._poll_ready(0.5)
+        logger.info("stopping %d worker(s)", len(self.workers))
+        self.stopping = True
+        self._retire(list(self.workers))
+        return 0 if ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.serve")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="0 = one per CPU")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=SERVE_PRELOAD,
+                        help="import the app once in the parent before forking")
+    parser.add_argument("--loop", default=SERVE_LOOP, help="auto | uvloop | asyncio")
+    parser.add_argument("--http", default=SERVE_HTTP, help="auto | httptools | h11")
+    parser.add_argument("--graceful-timeout", type=int, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--backlog", type=int, default=SERVE_BACKLOG)
+    parser.add_argument("--access-log", action=argparse.BooleanOptionalAction, default=SERVE_ACCESS_LOG)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     [%(process)d] %(name)s: %(message)s")
+    workers = args.workers or os.cpu_count() or 1
+    loop, http = resolve("loop", args.loop), resolve("http", args.http)
+
+    changefeed = os.getenv("CHANGEFEED_ENABLED", "1") == "1"
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    hash_workers = hash_pool_size(HASH_POOL_BUDGET or os.cpu_count() or 1, workers)
+    os.environ["HASH_POOL_WORKERS"] = str(hash_workers)
+    logger.info("hash pool: %d process(es) per worker", hash_workers)
+
+    if DB_CONNECTION_BUDGET:
+        pool_size, max_overflow = pool_sizes(DB_CONNECTION_BUDGET, workers, changefeed)
+        os.environ["DB_POOL_SIZE"], os.environ["DB_MAX_OVERFLOW"] = str(pool_size), str(max_overflow)
+        logger.info("DB_CONNECTION_BUDGET=%d: pool %d + overflow %d per worker", DB_CONNECTION_BUDGET,
+                    pool_size, max_overflow)
+
+    target = APP
+    if args.preload:
+        started = time.perf_counter()
+        module, _, attr = APP.partition(":")
+        target = getattr(importlib.import_module(module), attr)
+        # keep the imported objects out of the collector, so workers don't copy-on-write them
+        gc.freeze()
+        logger.info("preloaded %s in %.2fs", APP, time.perf_counter() - started)
+
+    config = uvicorn.Config(target, host=args.host, port=args.port, loop=loop, http=http, lifespan="on",
+                            backlog=args.backlog, timeout_graceful_shutdown=args.graceful_timeout,
+                            access_log=args.access_log, log_level=args.log_level)
+    sock = config.bind_socket()
+    logger.info("event loop %s, HTTP parser %s", loop, http)
+    try:
+        code = Supervisor(config, sock, workers, args.graceful_timeout).run()
+    finally:
+        sock.close()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
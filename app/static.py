@@ -0,0 +1,238 @@
+# app/static.py
+#
+# Serves frontend/ from the app itself (SERVE_FRONTEND=1), mounted at /.
+#
+#   python -m app.static build     # frontend/ -> FRONTEND_DIST (default frontend_dist/)
+#
+# The build copies every file, gives non-HTML assets content-hashed names
+# (admin.js -> admin.1c9e4f0a2b.js), rewrites src/href references in the HTML to
+# them, and writes .gz (and .br, with the optional `brotli` package) next to each
+# compressible file, plus manifest.json. Hashed assets are served with
+# Cache-Control: immutable, so repeat page loads fetch no asset bytes; HTML pages
+# keep their names and are revalidated (ETag / 304) on every load.
+#
+# Without a build the source directory is served as-is with no-cache and an ETag,
+# and CompressionMiddleware compresses it on the fly.
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+
+from app.compression import COMPRESSIBLE_TYPES, brotli, choose_encoding
+
+load_dotenv()
+
+SERVE_FRONTEND = os.getenv("SERVE_FRONTEND", "0") == "1"
+FRONTEND_SRC = os.getenv("FRONTEND_SRC", "frontend")
+FRONTEND_DIST = os.getenv("FRONTEND_DIST", "frontend_dist")
+FRONTEND_INDEX = "login.html"
+
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRECOMPRESS_MIN_BYTES = 256
+
+logger = logging.getLogger("app.static")
+
+_REF = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+
+
+def _content_type(name: str) -> str:
+    if name.endswith(".js"):  # some platforms map .js to text/plain
+        return "application/javascript"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _compressible(name: str) -> bool:
+    return _content_type(name) in COMPRESSIBLE_TYPES
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:10]}{ext}"
+
+
+# --- build ---
+
+def build(src: str = FRONTEND_SRC, out: str = FRONTEND_DIST) -> dict:
+    files = {}
+    for root, _, names in os.walk(src):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, src).replace(os.sep, "/")] = open(path, "rb").read()
+
+    # assets first, so pages can point at their hashed names
+    renamed = {}
+    for name, data in files.items():
+        if not name.endswith(".html"):
+            renamed[name] = _hashed_name(name, _digest(data))
+
+    def rewrite(page: str, html: bytes) -> bytes:
+        base = os.path.dirname(page)
+
+        def sub(m):
+            target = os.path.normpath(os.path.join(base, m.group(2))).replace(os.sep, "/")
+            if target not in renamed:
+                return m.group(0)
+            return m.group(1) + os.path.relpath(renamed[target], base or ".").replace(os.sep, "/") + m.group(3)
+        return _REF.sub(sub, html.decode("utf-8")).encode("utf-8")
+
+    tmp = out.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    manifest = {}
+    for name, data in sorted(files.items()):
+        if name.endswith(".html"):
+            data = rewrite(name, data)
+        target = renamed.get(name, name)
+        digest = _digest(data)
+        encodings = []
+        path = os.path.join(tmp, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        if _compressible(name) and len(data) >= PRECOMPRESS_MIN_BYTES:
+            variants = {"gzip": (".gz", gzip.compress(data, 9, mtime=0))}
+            if brotli is not None:
+                variants["br"] = (".br", brotli.compress(data, quality=11))
+            for coding, (suffix, packed) in variants.items():
+                if len(packed) < len(data):
+                    with open(path + suffix, "wb") as f:
+                        f.write(packed)
+                    encodings.append(coding)
+        manifest[name] = {"file": target, "sha256": digest, "bytes": len(data), "encodings": encodings,
+                          "immutable": name in renamed}
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    # swap in the finished build (a running app keeps what it loaded at startup)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return manifest
+
+
+# --- serving ---
+
+_SUFFIX = {"gzip": ".gz", "br": ".br"}
+
+
+class _Asset:
+
+    def __init__(self, content_type: str, etag: str, cache_control: str, bodies: dict):
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = cache_control
+        self.bodies = bodies  # content coding ("identity", "gzip", "br") -> bytes
+
+
+def _load_dist(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    assets = {}
+    for name, entry in manifest.items():
+        path = os.path.join(directory, entry["file"])
+        bodies = {"identity": open(path, "rb").read()}
+        for coding in entry["encodings"]:
+            bodies[coding] = open(path + _SUFFIX[coding], "rb").read()
+        asset = _Asset(_content_type(name), f'"{entry["sha256"][:20]}"', REVALIDATE, bodies)
+        assets[name] = asset
+        if entry["immutable"]:
+            assets[entry["file"]] = _Asset(asset.content_type, asset.etag, IMMUTABLE, bodies)
+    return assets
+
+
+def _load_source(directory: str) -> dict:
+    assets = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            data = open(path, "rb").read()
+            rel = os.path.relpath(path, directory).replace(os.sep, "/")
+            assets[rel] = _Asset(_content_type(rel), f'"{_digest(data)[:20]}"', REVALIDATE, {"identity": data})
+    return assets
+
+
+class FrontendApp:
+    # Pure ASGI app serving the built (or source) frontend from memory; files are read
+    # once at startup. Precompressed variants go out as-is, so CompressionMiddleware
+    # leaves them alone (they already carry Content-Encoding).
+
+    def __init__(self, dist: str = FRONTEND_DIST, src: str = FRONTEND_SRC):
+        if os.path.exists(os.path.join(dist, MANIFEST)):
+            self.assets = _load_dist(dist)
+            self.built = True
+        else:
+            logger.warning("%s has no build, serving %s uncompressed (run: python -m app.static build)", dist, src)
+            self.assets = _load_source(src)
+            self.built = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        path = scope["path"]
+        root = scope.get("root_path", "")
+        if root and path.startswith(root):
+            path = path[len(root):]
+        name = path.lstrip("/") or FRONTEND_INDEX
+        asset = self.assets.get(name)
+        if asset is None:
+            await _plain(send, 404, b"Not Found")
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await _plain(send, 405, b"Method Not Allowed", [(b"allow", b"GET, HEAD")])
+            return
+        request_headers = Headers(scope=scope)
+        coding = choose_encoding(request_headers.get("accept-encoding", ""),
+                                 [c for c in ("br", "gzip") if c in asset.bodies])
+        headers = [
+            (b"cache-control", asset.cache_control.encode()),
+            (b"etag", (asset.etag if coding is None else f'{asset.etag[:-1]}-{coding}"').encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        inm = request_headers.get("if-none-match")
+        if inm and any(t.strip().removeprefix("W/").split("-")[0].strip('"') == asset.etag.strip('"')
+                       for t in inm.split(",")):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = asset.bodies[coding or "identity"]
+        headers += [(b"content-type", asset.content_type.encode()), (b"content-length", str(len(body)).encode())]
+        if coding:
+            headers.append((b"content-encoding", coding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+async def _plain(send, status: int, body: bytes, extra=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode()), *extra]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.static")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="hash and precompress the frontend")
+    b.add_argument("--src", default=FRONTEND_SRC)
+    b.add_argument("--out", default=FRONTEND_DIST)
+    args = parser.parse_args()
+    manifest = build(args.src, args.out)
+    for name, entry in sorted(manifest.items()):
+        sizes = ", ".join(f"{c} {os.path.getsize(os.path.join(args.out, entry['file']) + _SUFFIX[c])}"
+                          for c in entry["encodings"])
+        print(f"{name:24} -> {entry['file']:28} {entry['bytes']:8d} B" + (f"  ({sizes})" if sizes else ""))
+    if brotli is None:
+        print("brotli not installed: wrote gzip variants only (pip install brotli)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,106 @@
 # Use pbkdf2_sha256 to avoid bcrypt binary dependency issues on Windows
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from dotenv import load_dotenv
 from passlib.context import CryptContext
 
+from app.profiling import timed
+
+load_dotenv()
+
+# Number of processes used for hashing/verification; 0 hashes inline in the request thread.
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a free process before new ones are rejected.
+HASH_POOL_MAX_QUEUE = int(os.getenv("HASH_POOL_MAX_QUEUE", "32"))
+# Seconds a caller waits for its hash before giving up.
+HASH_POOL_TIMEOUT_SECONDS = float(os.getenv("HASH_POOL_TIMEOUT_SECONDS", "10"))
+# Changing this makes existing hashes with fewer rounds get rehashed on next login.
+PBKDF2_ROUNDS = os.getenv("PBKDF2_ROUNDS")
+
+_rounds = {}
+if PBKDF2_ROUNDS:
+    _rounds = {
+        "pbkdf2_sha256__default_rounds": int(PBKDF2_ROUNDS),
+        "pbkdf2_sha256__min_rounds": int(PBKDF2_ROUNDS),
+    }
+
 # pbkdf2_sha256 is pure-python (provided by passlib), stable and secure enough for typical apps
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", **_rounds)
 
-def hash_password(password: str) -> str:
+
+class HashPoolBusy(Exception):
+    pass
+
+
+# these run inside the pool processes
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def _verify_and_update(plain: str, hashed: str):
+    return pwd_context.verify_and_update(plain, hashed)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = 0
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # a pool inherited through fork() is unusable in the child
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: the request workers are multi-threaded, forking them is unsafe
+            ctx = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS, mp_context=ctx)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    with timed("hash"):
+        return _run_in_pool(fn, *args)
+
+
+def _run_in_pool(fn, *args):
+    global _pending
+    if HASH_POOL_WORKERS <= 0:
+        return fn(*args)
+    with _pool_lock:
+        if _pending >= HASH_POOL_WORKERS + HASH_POOL_MAX_QUEUE:
+            raise HashPoolBusy()
+        _pending += 1
+    try:
+        return _get_pool().submit(fn, *args).result(timeout=HASH_POOL_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        raise HashPoolBusy()
+    finally:
+        with _pool_lock:
+            _pending -= 1
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password)
+
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    ok, _ = _run(_verify_and_update, plain, hashed)
+    return ok
+
+def verify_and_update_password(plain: str, hashed: str):
+    # (ok, new_hash); new_hash is set when the stored hash uses outdated settings
+    return _run(_verify_and_update, plain, hashed)
+
+
+def hash_pool_stats() -> dict:
+    return {"workers": HASH_POOL_WORKERS, "max_queue": HASH_POOL_MAX_QUEUE, "pending": _pending}
+
+
+def shutdown_hash_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
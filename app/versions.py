@@ -0,0 +1,72 @@
+# app/versions.py
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+USERS = "users"
+
+def daily_scope(user_id: int) -> str:
+    return f"daily:{user_id}"
+
+
+# one statement for any number of scopes; sorted so concurrent bumps lock rows in the same order
+_bump_sql = text("""
+INSERT INTO change_versions (scope, version)
+SELECT s, 1 FROM unnest(CAST(:scopes AS text[])) AS s
+ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1
+""")
+
+def bump(db: Session, *scopes: str):
+    # call before the caller's commit so the new version is visible together with the change
+    if scopes:
+        db.execute(_bump_sql, {"scopes": sorted(set(scopes))})
+
+def current(db: Session, scope: str) -> int:
+    v = db.execute(text("SELECT version FROM change_versions WHERE scope = :s"), {"s": scope}).scalar()
+    return v or 0
+
+def daily_version_by_userid(db: Session, userid: str):
+    # (user id, daily version) in one round trip, or None if the user does not exist
+    row = db.execute(text("""
+        SELECT u.id, COALESCE(v.version, 0)
+        FROM users u LEFT JOIN change_versions v ON v.scope = 'daily:' || u.id
+        WHERE u.userid = :userid
+    """), {"userid": userid}).first()
+    return (row[0], row[1]) if row else None
+
+def users_stats_version(db: Session) -> str:
+    # for user lists with stats (lifetime totals, last dates): the users version plus the sum of
+    # every daily version. Daily versions only go up and the one that is ever removed
+    # (hard_delete_user) bumps users with it, so a pair never comes back with other data.
+    users, daily = db.execute(text("""
+        SELECT COALESCE(max(version) FILTER (WHERE scope = 'users'), 0),
+               COALESCE(sum(version) FILTER (WHERE scope LIKE 'daily:%'), 0)
+        FROM change_versions
+    """)).one()
+    return f"{users}-{daily}"
+
+
+def etag(scope: str, version: int, variant: str = "") -> str:
+    # strong validator; variant distinguishes representations of the same scope (query params)
+    return f'"{scope}.{version}{"." + variant if variant else ""}"'
+
+def query_variant(request: Request) -> str:
+    # short digest of the query string, so each filter/page of a list gets its own ETag
+    items = sorted(request.query_params.multi_items())
+    return hashlib.sha1(repr(items).encode()).hexdigest()[:12] if items else ""
+
+def cache_headers(tag: str) -> dict:
+    # private + no-cache: browsers may keep the body but must revalidate every time
+    return {"ETag": tag, "Cache-Control": "private, no-cache"}
+
+def matches(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == tag for t in header.split(","))
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(tag))
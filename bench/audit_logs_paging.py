@@ -0,0 +1,75 @@
+# bench/audit_logs_paging.py
+#
+# Seeds audit_logs with millions of rows, then times one /admin/logs page at
+# increasing depths, keyset cursor vs. the equivalent OFFSET query.
+#   python -m bench.audit_logs_paging --rows 3000000 --seed
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import crud, models
+from app.db import SessionLocal, engine
+
+SEED_SQL = text("""
+INSERT INTO audit_logs (actor_user_id, action, details, created_at)
+SELECT NULL,
+       (ARRAY['login','submit_daily','update_daily','create_user'])[1 + (g % 4)],
+       jsonb_build_object('bench', true, 'n', g),
+       now() - make_interval(secs => g)
+FROM generate_series(:start, :stop) AS g
+""")
+
+
+def seed(rows: int, chunk: int = 500_000):
+    for start in range(1, rows + 1, chunk):
+        stop = min(rows, start + chunk - 1)
+        with engine.begin() as conn:
+            conn.execute(SEED_SQL, {"start": start, "stop": stop})
+        print(f"seeded {stop}/{rows}")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE audit_logs"))
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.rows)
+
+    L = models.AuditLog
+    db = SessionLocal()
+    try:
+        depth = 0
+        print(f"{'depth':>10} {'keyset ms':>10} {'offset ms':>10} {'keyset/no details ms':>21}")
+        while depth < args.rows:
+            key = db.query(L.created_at, L.id).order_by(L.created_at.desc(), L.id.desc()).offset(depth).limit(1).first()
+            if key is None:
+                break
+            cursor = (key.created_at, key.id)
+            keyset = timed(lambda: crud.list_logs(db, limit=args.page_size, cursor=cursor))
+            light = timed(lambda: crud.list_logs(db, limit=args.page_size, cursor=cursor, include_details=False))
+            offset = timed(lambda: db.query(L).order_by(L.created_at.desc(), L.id.desc())
+                           .offset(depth).limit(args.page_size).all(), repeat=2)
+            print(f"{depth:>10} {keyset:>10.2f} {offset:>10.2f} {light:>21.2f}")
+            depth = depth * 10 if depth else 1000
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench/bulk_ingest.py
+#
+# Rows/second through crud.bulk_upsert_daily (the path behind /user/daily/batch
+# and /admin/daily/import). Creates bench users if needed.
+#   python -m bench.bulk_ingest --users 50 --days 2000
+import argparse
+import time
+from datetime import date, timedelta
+
+from app import crud, ingest, models, utils
+from app.db import SessionLocal
+
+
+def ensure_users(db, count: int):
+    userids = [f"bench_user_{i:05d}" for i in range(count)]
+    existing = dict(db.query(models.User.userid, models.User.id).filter(models.User.userid.in_(userids)).all())
+    missing = [u for u in userids if u not in existing]
+    if missing:
+        hashed = utils.hash_password("bench")
+        db.add_all([models.User(userid=u, full_name=u, password_hash=hashed, is_admin=False, is_active=True) for u in missing])
+        db.commit()
+        existing = dict(db.query(models.User.userid, models.User.id).filter(models.User.userid.in_(userids)).all())
+    return existing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        ids = ensure_users(db, args.users)
+        start = date(2015, 1, 1)
+        lines = ["userid,date,total_deposit,total_withdraw"]
+        for userid in ids:
+            for d in range(args.days):
+                lines.append(f"{userid},{(start + timedelta(days=d)).isoformat()},{d % 500}.25,{d % 300}.50")
+        csv_text = "\n".join(lines)
+        total = len(lines) - 1
+
+        t0 = time.perf_counter()
+        rows, errors = ingest.parse_csv(csv_text)
+        t1 = time.perf_counter()
+        result = crud.import_daily(db, rows, errors, None, "bench")
+        t2 = time.perf_counter()
+    finally:
+        db.close()
+
+    print(f"rows: {total}  upserted: {result['upserted']}  errors: {result['errors']}")
+    print(f"parse:  {t1 - t0:.2f}s ({total / (t1 - t0):,.0f} rows/s)")
+    print(f"upsert: {t2 - t1:.2f}s ({total / (t2 - t1):,.0f} rows/s)")
+    print(f"total:  {t2 - t0:.2f}s ({total / (t2 - t0):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench/client.py
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+# one keep-alive connection per thread and base URL, like a browser or an HTTP client pool
+_local = threading.local()
+
+
+def _connection(base_url: str, fresh: bool = False) -> http.client.HTTPConnection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(base_url)
+    if conn is None or fresh:
+        if conn is not None:
+            conn.close()
+        parts = urlsplit(base_url)
+        cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = conns[base_url] = cls(parts.hostname, parts.port, timeout=60)
+    return conn
+
+
+def request(base_url: str, method: str, path: str, body=None, token: str = None, headers: dict = None,
+            raw: bytes = None, content_type: str = None):
+    # returns (status, elapsed_seconds, parsed_json_or_None)
+    hdrs = dict(headers or {})
+    data = raw
+    if body is not None:
+        data = json.dumps(body).encode()
+        content_type = content_type or "application/json"
+    if content_type:
+        hdrs["Content-Type"] = content_type
+    if token:
+        hdrs["Authorization"] = "Bearer " + token
+    started = time.perf_counter()
+    for attempt in range(2):
+        conn = _connection(base_url, fresh=attempt > 0)
+        try:
+            conn.request(method, path, body=data, headers=hdrs)
+            resp = conn.getresponse()
+            payload_raw = resp.read()
+            status = resp.status
+            break
+        except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+            # server closed an idle keep-alive connection; retry once on a new one
+            if attempt:
+                raise
+            started = time.perf_counter()
+    elapsed = time.perf_counter() - started
+    try:
+        payload = json.loads(payload_raw) if payload_raw else None
+    except ValueError:
+        payload = None
+    return status, elapsed, payload
+
+
+def login(base_url: str, userid: str, password: str) -> str:
+    status, _, payload = request(base_url, "POST", "/auth/login", {"userid": userid, "password": password})
+    if status != 200:
+        raise RuntimeError(f"login as {userid!r} failed: {status} {payload}")
+    return payload["access_token"]
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
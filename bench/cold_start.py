@@ -0,0 +1,42 @@
+# bench/cold_start.py
+#
+# Per-worker cold start: time to import app.main and run its startup handlers,
+# measured in fresh interpreters. Run it on two commits to compare, e.g. before
+# and after moving DDL out of import time.
+#   python -m bench.cold_start --runs 10
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+asyncio.run(app.main.app.router.startup())
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    imports, startups = [], []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], check=True, capture_output=True, text=True).stdout
+        sample = json.loads(out.strip().splitlines()[-1])
+        imports.append(sample["import"])
+        startups.append(sample["startup"])
+
+    totals = [a + b for a, b in zip(imports, startups)]
+    for label, xs in (("import", imports), ("startup", startups), ("total", totals)):
+        print(f"{label:8} median {statistics.median(xs) * 1000:8.1f} ms   min {min(xs) * 1000:8.1f} ms   max {max(xs) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
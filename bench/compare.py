@@ -0,0 +1,50 @@
+# bench/compare.py
+#
+# Side-by-side view of two bench.loadtest result files:
+#   python -m bench.compare results/before.json results/after.json
+# Latency deltas are after vs. before; negative is faster.
+import argparse
+import json
+
+
+def _delta(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(before: dict, after: dict):
+    for name, r in (("before", before), ("after", after)):
+        git = r.get("git", {})
+        print(f"{name:7} {git.get('commit', '')[:12]}{' (dirty)' if git.get('dirty') else ''}  {r['timestamp']}  "
+              f"{r['args'].get('clients')} clients, {r['seconds']:.0f}s")
+    print(f"{'endpoint':34} {'rps':>23} {'p50 ms':>23} {'p95 ms':>23} {'p99 ms':>23}")
+    keys = list(before["endpoints"]) + [k for k in after["endpoints"] if k not in before["endpoints"]]
+    for key in keys:
+        a, b = before["endpoints"].get(key), after["endpoints"].get(key)
+        if a is None or b is None:
+            print(f"{key:34} only in {'after' if a is None else 'before'}")
+            continue
+        cols = [f"{a['rps']:7.1f}>{b['rps']:<7.1f}{_delta(a['rps'], b['rps']):>8}"]
+        for p in ("p50_ms", "p95_ms", "p99_ms"):
+            cols.append(f"{a[p]:7.1f}>{b[p]:<7.1f}{_delta(a[p], b[p]):>8}")
+        print(f"{key:34} " + " ".join(cols))
+    ta, tb = before["total"], after["total"]
+    print(f"{'total':34} {ta['rps']:7.1f}>{tb['rps']:<7.1f}{_delta(ta['rps'], tb['rps']):>8}"
+          f"   errors {ta['errors']} > {tb['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    compare(before, after)
+
+
+if __name__ == "__main__":
+    main()
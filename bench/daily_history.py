@@ -0,0 +1,120 @@
+# bench/daily_history.py
+#
+# Times the user history reads (crud.list_user_daily) for users with 10+ years of
+# daily rows, with and without the partial covering index from migration 10:
+# whole history, newest page, one-year window and a page five years back (cursor).
+#   python -m bench.daily_history --seed --users 50 --days 3700
+# --seed adds the rows through bench.seed, soft-deletes ~5% of them, then VACUUMs so
+# the visibility map allows index-only scans. The "without" column drops the index
+# inside a transaction that is rolled back afterwards.
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import crud
+from app.db import SessionLocal, engine
+from bench.seed import bench_userid, seed
+
+INDEX = "ix_daily_financials_user_date_live"
+
+
+def soft_delete_some(users: int):
+    with engine.begin() as conn:
+        n = conn.execute(text("""
+            UPDATE daily_financials d SET is_deleted = true
+            FROM users u
+            WHERE u.id = d.user_id AND u.userid BETWEEN :first AND :last AND (d.date - DATE '2000-01-01' + d.user_id) % 20 = 0
+        """), {"first": bench_userid(0), "last": bench_userid(users - 1)}).rowcount
+    print(f"soft-deleted {n} rows")
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE daily_financials"))
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def plan(db, user_id: int, **kwargs) -> dict:
+    # scan node, pages touched and server-side time of the query list_user_daily sends
+    q = crud.user_daily_query(db, user_id, **kwargs)
+    sql = str(q.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    explained = db.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)).scalar()[0]
+    top = node = explained["Plan"]
+    while "Plans" in node and "Scan" not in node["Node Type"]:
+        node = node["Plans"][0]
+    scan = node["Node Type"]
+    if node.get("Heap Fetches") is not None:
+        scan += f" (heap fetches {node['Heap Fetches']})"
+    return {"scan": scan, "pages": top["Shared Hit Blocks"] + top["Shared Read Blocks"],
+            "db_ms": round(explained["Execution Time"], 3)}
+
+
+def run_cases(db, user_ids: list, page: int) -> dict:
+    today = date.today()
+    cases = {
+        "whole history": {},
+        f"newest {page}": {"limit": page},
+        "last 365 days": {"date_from": today - timedelta(days=365)},
+        f"{page} rows 5y back": {"before": today - timedelta(days=5 * 365), "limit": page},
+    }
+    out = {}
+    for name, kwargs in cases.items():
+        rows = len(crud.list_user_daily(db, user_ids[0], **kwargs))
+        ms = sum(timed(lambda u=u: crud.list_user_daily(db, u, **kwargs)) for u in user_ids) / len(user_ids)
+        out[name] = {"rows": rows, "ms": round(ms, 3), **plan(db, user_ids[0], **kwargs)}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=3700, help="daily rows per user (3650+ = 10+ years)")
+    parser.add_argument("--sample", type=int, default=10, help="users timed per case")
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--out", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.users, args.days, 0)
+        soft_delete_some(args.users)
+
+    db = SessionLocal()
+    try:
+        user_ids = list(db.execute(text("SELECT id FROM users WHERE userid BETWEEN :a AND :b ORDER BY id LIMIT :n"),
+                                   {"a": bench_userid(0), "b": bench_userid(args.users - 1), "n": args.sample}).scalars())
+        if not user_ids:
+            raise SystemExit("no bench users; run with --seed")
+        with_index = run_cases(db, user_ids, args.page)
+        db.rollback()
+        db.execute(text(f"DROP INDEX IF EXISTS {INDEX}"))
+        try:
+            without_index = run_cases(db, user_ids, args.page)
+        finally:
+            db.rollback()
+    finally:
+        db.close()
+
+    # ms: whole call incl. row conversion, averaged over the sample; pages / db ms: EXPLAIN ANALYZE of one user
+    print(f"{'':29}{'-------- without index --------':>32}   {'---------- with index ----------':>32}")
+    print(f"{'case':22} {'rows':>6} {'ms':>9} {'db ms':>8} {'pages':>7} {'':5} {'ms':>9} {'db ms':>8} {'pages':>7}  scan with / without")
+    for name, w in with_index.items():
+        wo = without_index[name]
+        print(f"{name:22} {w['rows']:6d} {wo['ms']:9.2f} {wo['db_ms']:8.2f} {wo['pages']:7d} {'':5} "
+              f"{w['ms']:9.2f} {w['db_ms']:8.2f} {w['pages']:7d}  {w['scan']} / {wo['scan']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "with_index": with_index, "without_index": without_index}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
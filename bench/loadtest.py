@@ -0,0 +1,294 @@
+# bench/loadtest.py
+#
+# Drives the real app over HTTP with a weighted mix of user and admin traffic and
+# reports throughput and p50/p95/p99 per endpoint. Seed the database first:
+#   python -m bench.seed --users 200 --days 365 --audit-rows 100000
+#   python -m bench.loadtest --spawn-server --clients 32 --duration 60 --out results/$(git rev-parse --short HEAD).json
+#   python -m bench.compare results/before.json results/after.json
+# --spawn-server starts uvicorn on a free local port against DATABASE_URL and stops it
+# afterwards; without it the run targets --url. --server serve spawns app.serve (the
+# pre-fork entry point) instead, to compare it with plain uvicorn:
+#   python -m bench.loadtest --spawn-server --workers 1 --out results/uvicorn-1.json
+#   python -m bench.loadtest --spawn-server --server serve --workers 4 --preload --out results/serve-4.json Each virtual client has its own RNG
+# derived from --seed, so two runs draw the same operation mix.
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from bench.client import login, percentile, request
+from bench.seed import BENCH_ADMIN, BENCH_PASSWORD, bench_userid
+
+# operation -> relative weight; override per run with --mix
+DEFAULT_MIX = {
+    "login": 2,
+    "user_post_daily": 25,
+    "user_get_daily": 25,
+    "admin_users": 5,
+    "admin_logs": 10,
+    "admin_user_daily": 15,
+    "admin_edit_daily": 8,
+    "admin_delete_restore_daily": 5,
+}
+
+ENDPOINTS = {
+    "login": "POST /auth/login",
+    "user_post_daily": "POST /user/daily",
+    "user_get_daily": "GET /user/daily",
+    "admin_users": "GET /admin/users",
+    "admin_logs": "GET /admin/logs",
+    "admin_user_daily": "GET /admin/user/{userid}/daily",
+    "admin_edit_daily": "PUT /admin/daily/{id}",
+    "admin_delete_daily": "DELETE /admin/daily/{id}",
+    "admin_restore_daily": "POST /admin/daily/{id}/restore",
+}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.recording = False
+
+    def add(self, endpoint: str, status: int, elapsed: float):
+        if not self.recording:
+            return
+        with self.lock:
+            if 200 <= status < 400:
+                self.latencies.setdefault(endpoint, []).append(elapsed)
+            else:
+                per = self.errors.setdefault(endpoint, {})
+                per[str(status)] = per.get(str(status), 0) + 1
+
+    def summary(self, seconds: float) -> dict:
+        out = {}
+        for key in ENDPOINTS.values():
+            ok = self.latencies.get(key, [])
+            errors = self.errors.get(key, {})
+            count = len(ok) + sum(errors.values())
+            if not count:
+                continue
+            out[key] = {
+                "count": count,
+                "errors": errors,
+                "rps": round(count / seconds, 2),
+                "p50_ms": round(percentile(ok, 50) * 1000, 2),
+                "p95_ms": round(percentile(ok, 95) * 1000, 2),
+                "p99_ms": round(percentile(ok, 99) * 1000, 2),
+                "max_ms": round(max(ok) * 1000, 2) if ok else 0.0,
+            }
+        return out
+
+
+class VirtualClient:
+    def __init__(self, n: int, args, admin_token: str, stats: Stats, stop: threading.Event):
+        self.rng = random.Random(args.seed * 100_003 + n)
+        self.args = args
+        self.url = args.url
+        self.admin_token = admin_token
+        self.stats = stats
+        self.stop = stop
+        self.userid = bench_userid(n % args.users)
+        self.token = login(self.url, self.userid, args.password)
+        self.daily_ids = []
+        names = list(args.mix)
+        self.names, self.weights = names, [args.mix[k] for k in names]
+
+    def call(self, name, method, path, body=None, token=None):
+        status, elapsed, payload = request(self.url, method, path, body, token=token)
+        self.stats.add(ENDPOINTS[name], status, elapsed)
+        return status, payload
+
+    def random_day(self) -> str:
+        return (date.today() - timedelta(days=self.rng.randrange(self.args.days))).isoformat()
+
+    def random_amounts(self) -> dict:
+        return {"total_deposit": round(self.rng.uniform(0, 1000), 2),
+                "total_withdraw": round(self.rng.uniform(0, 500), 2)}
+
+    def known_daily_id(self):
+        # ids of rows this client wrote itself, so edits never race another client's deletes
+        if not self.daily_ids:
+            status, payload = self.call("user_post_daily", "POST", "/user/daily",
+                                        {"date": self.random_day(), **self.random_amounts()}, self.token)
+            if status != 200:
+                return None
+            self.daily_ids.append(payload["id"])
+        return self.rng.choice(self.daily_ids)
+
+    def step(self, name):
+        if name == "login":
+            userid = bench_userid(self.rng.randrange(self.args.users))
+            self.call(name, "POST", "/auth/login", {"userid": userid, "password": self.args.password})
+        elif name == "user_post_daily":
+            status, payload = self.call(name, "POST", "/user/daily",
+                                        {"date": self.random_day(), **self.random_amounts()}, self.token)
+            if status == 200 and payload["id"] not in self.daily_ids:
+                self.daily_ids.append(payload["id"])
+                del self.daily_ids[:-50]
+        elif name == "user_get_daily":
+            self.call(name, "GET", "/user/daily", token=self.token)
+        elif name == "admin_users":
+            self.call(name, "GET", "/admin/users", token=self.admin_token)
+        elif name == "admin_logs":
+            self.call(name, "GET", "/admin/logs?limit=100", token=self.admin_token)
+        elif name == "admin_user_daily":
+            userid = bench_userid(self.rng.randrange(self.args.users))
+            self.call(name, "GET", f"/admin/user/{userid}/daily", token=self.admin_token)
+        elif name == "admin_edit_daily":
+            daily_id = self.known_daily_id()
+            if daily_id is not None:
+                # the date in the body is required by the schema but ignored; PUT changes amounts only
+                self.call(name, "PUT", f"/admin/daily/{daily_id}",
+                          {"date": date.today().isoformat(), **self.random_amounts()}, self.admin_token)
+        elif name == "admin_delete_restore_daily":
+            daily_id = self.known_daily_id()
+            if daily_id is not None:
+                self.call("admin_delete_daily", "DELETE", f"/admin/daily/{daily_id}", token=self.admin_token)
+                self.call("admin_restore_daily", "POST", f"/admin/daily/{daily_id}/restore", token=self.admin_token)
+
+    def run(self):
+        while not self.stop.is_set():
+            self.step(self.rng.choices(self.names, self.weights)[0])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(workers: int, timeout: float = 60.0, server: str = "uvicorn", preload: bool = False):
+    port = _free_port()
+    if server == "serve":
+        cmd = [sys.executable, "-m", "app.serve", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+               "--preload" if preload else "--no-preload"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    # all virtual clients share one IP and log in far more often than people do; keep the
+    # login token buckets out of the measurement unless explicitly configured
+    env = dict(os.environ)
+    env.setdefault("LOGIN_RATE_PER_MINUTE", "0")
+    env.setdefault("LOGIN_IP_RATE_PER_MINUTE", "0")
+    proc = subprocess.Popen(cmd, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            status, _, _ = request(url, "GET", "/openapi.json")
+            if status == 200:
+                return proc, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server did not come up within {timeout:.0f}s")
+
+
+def git_revision() -> dict:
+    def git(*argv):
+        try:
+            return subprocess.run(["git", *argv], capture_output=True, text=True, timeout=30).stdout.strip()
+        except OSError:
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def parse_mix(spec: str) -> dict:
+    # "user_get_daily=50,admin_logs=10" overrides individual weights; 0 drops an operation
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, spec.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in mix:
+            raise SystemExit(f"unknown operation {name!r}; choose from {', '.join(mix)}")
+        mix[name] = int(weight)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def print_report(results: dict):
+    print(f"{'endpoint':34} {'count':>8} {'err':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for key, r in results["endpoints"].items():
+        print(f"{key:34} {r['count']:8d} {sum(r['errors'].values()):6d} {r['rps']:9.1f} "
+              f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f}")
+    t = results["total"]
+    print(f"{'total':34} {t['count']:8d} {t['errors']:6d} {t['rps']:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--spawn-server", action="store_true", help="start uvicorn on a free port for the run")
+    parser.add_argument("--workers", type=int, default=1, help="server workers with --spawn-server")
+    parser.add_argument("--server", choices=("uvicorn", "serve"), default="uvicorn", help="what --spawn-server starts")
+    parser.add_argument("--preload", action="store_true", help="--server serve: import the app before forking")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    parser.add_argument("--users", type=int, default=200, help="bench users present in the database (see bench.seed)")
+    parser.add_argument("--days", type=int, default=365, help="dates are drawn from the last N days")
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--mix", default="", help="weight overrides, e.g. admin_logs=0,user_get_daily=50")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+    args.mix = parse_mix(args.mix)
+
+    proc = None
+    if args.spawn_server:
+        proc, args.url = spawn_server(args.workers, server=args.server, preload=args.preload)
+    try:
+        admin_token = login(args.url, BENCH_ADMIN, args.password)
+        stats = Stats()
+        stop = threading.Event()
+        clients = [VirtualClient(n, args, admin_token, stats, stop) for n in range(args.clients)]
+        threads = [threading.Thread(target=c.run, daemon=True) for c in clients]
+        for t in threads:
+            t.start()
+        time.sleep(args.warmup)
+        stats.recording = True
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        stats.recording = False
+        measured = time.perf_counter() - started
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    endpoints = stats.summary(measured)
+    count = sum(r["count"] for r in endpoints.values())
+    results = {
+        "git": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "args": {k: v for k, v in vars(args).items() if k != "password"},
+        "seconds": round(measured, 3),
+        "total": {"count": count, "errors": sum(sum(r["errors"].values()) for r in endpoints.values()),
+                  "rps": round(count / measured, 2)},
+        "endpoints": endpoints,
+    }
+    print_report(results)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
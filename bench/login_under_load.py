@@ -0,0 +1,69 @@
+# bench/login_under_load.py
+#
+# Login latency while other clients hammer the user endpoints.
+# Start the server first (uvicorn app.main:app --port 8000), then e.g.
+#   python -m bench.login_under_load --userid alice --password secret --logins 200
+# Compare runs with HASH_POOL_WORKERS=0 (inline hashing) and the default pool.
+# Start that server with LOGIN_RATE_PER_MINUTE=0 LOGIN_IP_RATE_PER_MINUTE=0, or the
+# login rate limits answer most of these attempts with 429.
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from bench.client import login, percentile, request
+
+
+def background_load(base_url, token, stop, counts):
+    day = date(2020, 1, 1)
+    i = 0
+    while not stop.is_set():
+        if i % 2:
+            request(base_url, "GET", "/user/daily", token=token)
+        else:
+            d = (day + timedelta(days=i % 3650)).isoformat()
+            request(base_url, "POST", "/user/daily", {"date": d, "total_deposit": 10, "total_withdraw": 5}, token=token)
+        counts[0] += 1
+        i += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--userid", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--load-clients", type=int, default=8)
+    args = parser.parse_args()
+
+    token = login(args.url, args.userid, args.password)
+    stop = threading.Event()
+    counts = [0]
+    loaders = [threading.Thread(target=background_load, args=(args.url, token, stop, counts), daemon=True)
+               for _ in range(args.load_clients)]
+    for t in loaders:
+        t.start()
+
+    def one_login(_):
+        status, elapsed, _ = request(args.url, "POST", "/auth/login", {"userid": args.userid, "password": args.password})
+        return status, elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.login_concurrency) as ex:
+        results = list(ex.map(one_login, range(args.logins)))
+    wall = time.perf_counter() - started
+    stop.set()
+    for t in loaders:
+        t.join()
+
+    ok = [e for s, e in results if s == 200]
+    shed = sum(1 for s, _ in results if s == 503)
+    print(f"logins ok={len(ok)} shed(503)={shed} other={len(results) - len(ok) - shed} in {wall:.2f}s")
+    print(f"login p50={percentile(ok, 50) * 1000:.1f}ms p95={percentile(ok, 95) * 1000:.1f}ms p99={percentile(ok, 99) * 1000:.1f}ms")
+    print(f"background user requests completed: {counts[0]} ({counts[0] / wall:.1f}/s)")
+
+
+if __name__ == "__main__":
+    main()
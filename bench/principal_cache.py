@@ -0,0 +1,58 @@
+# bench/principal_cache.py
+#
+# Queries issued to authenticate a request (auth.principal_for_token) with and without the principal cache.
+#   python -m bench.principal_cache --userid admin --requests 1000
+import argparse
+import time
+
+from app import auth, crud
+from app.cache import principal_cache
+from app.db import SessionLocal, engine
+from bench.querycount import count_queries
+
+
+def run(token: str, requests: int):
+    principal_cache.clear()
+    started = time.perf_counter()
+    with count_queries(engine) as counter:
+        for _ in range(requests):
+            db = SessionLocal()
+            try:
+                auth.principal_for_token(token, db)
+            finally:
+                db.close()
+    elapsed = time.perf_counter() - started
+    return counter.count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--userid", default="admin")
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_userid(db, args.userid)
+        if user is None:
+            raise SystemExit(f"user {args.userid!r} not found; run python -m app.create_admin first")
+        token = auth.create_access_token({"id": user.id, "userid": user.userid, "is_admin": user.is_admin})
+    finally:
+        db.close()
+
+    enabled_size, enabled_ttl = principal_cache.maxsize, principal_cache.ttl
+
+    principal_cache.maxsize = 0
+    uncached_queries, uncached_secs = run(token, args.requests)
+
+    principal_cache.maxsize, principal_cache.ttl = enabled_size or 1024, enabled_ttl or 30
+    cached_queries, cached_secs = run(token, args.requests)
+
+    print(f"requests:            {args.requests}")
+    print(f"uncached queries/req {uncached_queries / args.requests:.3f}  ({uncached_secs * 1000 / args.requests:.3f} ms/req)")
+    print(f"cached queries/req   {cached_queries / args.requests:.3f}  ({cached_secs * 1000 / args.requests:.3f} ms/req)")
+    print(f"cache stats          {principal_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/querycount.py
+import argparse
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import audit, crud, schemas
+from app.db import SessionLocal, engine
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    # counts every statement sent to the DB (commits are not statements)
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._on_execute)
+
+
+# Statements per call of the admin mutators, against a scratch user that is removed
+# afterwards. Each should be a single statement (plus COMMIT); exits non-zero if not.
+#   python -m bench.querycount --calls 50 --bulk 500
+EXPECTED = 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50, help="calls per single-row mutator")
+    parser.add_argument("--bulk", type=int, default=500, help="ids per bulk call")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    userid = f"qc_{uuid.uuid4().hex[:8]}"
+    try:
+        user = crud.create_user(db, schemas.UserCreate(userid=userid, password="querycount", full_name="Query count"))
+        start = date.today() - timedelta(days=args.bulk)
+        crud.bulk_upsert_daily(db, [(n, user.id, start + timedelta(days=n), 1, 1) for n in range(args.bulk)],
+                               actor_id=None, source="querycount")
+        ids = [r[0] for r in crud.list_user_daily(db, user.id)]
+        one = ids[0]
+        audit.sink.flush()  # create_user's buffered event would otherwise be written mid-measurement
+        cases = [
+            ("update_daily", lambda i: crud.update_daily(db, one, i, i / 2)),
+            ("soft_delete_daily", lambda i: crud.soft_delete_daily(db, one)),
+            ("restore_daily", lambda i: crud.restore_daily(db, one)),
+            ("deactivate_user", lambda i: crud.deactivate_user(db, userid)),
+            ("restore_user", lambda i: crud.restore_user(db, userid)),
+            (f"update_daily_many x{len(ids)}", lambda i: crud.update_daily_many(db, [(d, i, i) for d in ids])),
+            (f"soft_delete_daily_many x{len(ids)}", lambda i: crud.soft_delete_daily_many(db, ids)),
+            (f"restore_daily_many x{len(ids)}", lambda i: crud.restore_daily_many(db, ids)),
+            ("deactivate_users x1", lambda i: crud.deactivate_users(db, [userid])),
+            ("restore_users x1", lambda i: crud.restore_users(db, [userid])),
+        ]
+        failed = False
+        print(f"{'call':32} {'statements/call':>16} {'ms/call':>9}")
+        for name, call in cases:
+            calls = args.calls if "x" not in name else max(1, args.calls // 10)
+            started = time.perf_counter()
+            with count_queries(engine) as counter:
+                for i in range(calls):
+                    result = call(i + 1)
+                    if not result:
+                        raise SystemExit(f"{name} changed nothing")
+            elapsed = time.perf_counter() - started
+            per_call = counter.count / calls
+            failed |= per_call != EXPECTED
+            print(f"{name:32} {per_call:16.2f} {elapsed * 1000 / calls:9.2f}")
+        if failed:
+            print(f"FAIL: expected {EXPECTED} statement per call")
+            sys.exit(1)
+    finally:
+        db.rollback()
+        crud.hard_delete_user(db, userid)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
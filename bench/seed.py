@@ -0,0 +1,101 @@
+# bench/seed.py
+#
+# Seeds the database from DATABASE_URL with benchmark data, set-based and idempotent:
+#   bench_admin                       admin account
+#   bench_user_00000 .. N-1           regular users, all with the same password
+#   <days> daily_financials per user  ending today
+#   <audit-rows> audit_logs rows      spread over the last year
+#
+#   python -m bench.seed --users 200 --days 730 --audit-rows 1000000
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import utils
+from app.db import engine
+
+BENCH_ADMIN = "bench_admin"
+BENCH_PASSWORD = "bench"
+
+
+def bench_userid(i: int) -> str:
+    return f"bench_user_{i:05d}"
+
+
+def seed(users: int, days: int, audit_rows: int, password: str = BENCH_PASSWORD, chunk_users: int = 100, log=print):
+    hashed = utils.hash_password(password)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO users (userid, full_name, password_hash, is_admin, is_active)
+            VALUES (:userid, 'Bench Admin', :hash, true, true)
+            ON CONFLICT (userid) DO UPDATE SET password_hash = EXCLUDED.password_hash, is_active = true
+        """), {"userid": BENCH_ADMIN, "hash": hashed})
+        conn.execute(text("""
+            INSERT INTO users (userid, full_name, password_hash, is_admin, is_active)
+            SELECT 'bench_user_' || lpad(g::text, 5, '0'), 'Bench User ' || g, :hash, false, true
+            FROM generate_series(0, :n - 1) AS g
+            ON CONFLICT (userid) DO UPDATE SET password_hash = EXCLUDED.password_hash, is_active = true
+        """), {"hash": hashed, "n": users})
+    log(f"users: {users} (+ {BENCH_ADMIN})")
+
+    started = time.perf_counter()
+    for first in range(0, users, chunk_users):
+        last = min(users, first + chunk_users) - 1
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO daily_financials (user_id, date, total_deposit, total_withdraw, created_at, is_deleted)
+                SELECT u.id, current_date - d,
+                       round((random() * 1000)::numeric, 2), round((random() * 500)::numeric, 2), now(), false
+                FROM users u CROSS JOIN generate_series(0, :days - 1) AS d
+                WHERE u.userid BETWEEN :first AND :last
+                ON CONFLICT (user_id, date) DO NOTHING
+            """), {"days": days, "first": bench_userid(first), "last": bench_userid(last)})
+        log(f"daily_financials: users {first}..{last} done")
+    log(f"daily_financials: {users * days} rows in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    step = 500_000
+    for first in range(0, audit_rows, step):
+        n = min(step, audit_rows - first)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO audit_logs (actor_user_id, action, details, created_at)
+                SELECT u.id,
+                       (ARRAY['login', 'submit_daily', 'update_daily', 'delete_daily'])[1 + (g % 4)],
+                       jsonb_build_object('bench', true, 'n', g),
+                       now() - random() * interval '365 days'
+                FROM generate_series(1, :n) AS g
+                JOIN users u ON u.userid = 'bench_user_' || lpad(((g * 7919) % :users)::text, 5, '0')
+            """), {"n": n, "users": max(1, users)})
+        log(f"audit_logs: {first + n}/{audit_rows}")
+    if audit_rows:
+        log(f"audit_logs: {audit_rows} rows in {time.perf_counter() - started:.1f}s")
+
+    with engine.begin() as conn:
+        # invalidate ETags of everything the seed touched
+        conn.execute(text("""
+            INSERT INTO change_versions (scope, version)
+            SELECT 'daily:' || id, 1 FROM users WHERE userid LIKE 'bench\\_%'
+            UNION ALL SELECT 'users', 1
+            ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1
+        """))
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("users", "daily_financials", "daily_rollups", "audit_logs"):
+            conn.execute(text(f"ANALYZE {table}"))
+    log("analyzed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--audit-rows", type=int, default=100_000)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    args = parser.parse_args()
+    seed(args.users, args.days, args.audit_rows, args.password)
+
+
+if __name__ == "__main__":
+    main()
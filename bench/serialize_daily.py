@@ -0,0 +1,77 @@
+# bench/serialize_daily.py
+#
+# Encoding cost of a daily-history response: the old path (dict per row,
+# DailyOut validation, jsonable_encoder, json.dumps) vs serializers.daily_list_response.
+# No database needed.
+#   python -m bench.serialize_daily
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from app import schemas, serializers
+
+
+def make_rows(n: int):
+    start = date(2000, 1, 1)
+    created = datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    return [(i, 7, start + timedelta(days=i), Decimal("1234.50"), Decimal("99.25"), created, False) for i in range(n)]
+
+
+def old_path(rows) -> bytes:
+    out = []
+    for r in rows:
+        out.append({
+            "id": int(r[0]),
+            "user_id": int(r[1]),
+            "date": str(r[2]),
+            "total_deposit": float(r[3]),
+            "total_withdraw": float(r[4]),
+            "created_at": str(r[5]),
+            "is_deleted": bool(r[6]),
+        })
+    validated = [schemas.DailyOut(**d) for d in out]
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def new_path(rows) -> bytes:
+    return serializers.daily_list_response(rows).body
+
+
+def same_payload(a: bytes, b: bytes) -> bool:
+    # pydantic v2 writes UTC offsets as "Z", v1 and the fast path as "+00:00"
+    def norm(body):
+        items = json.loads(body)
+        for item in items:
+            item["created_at"] = datetime.fromisoformat(item["created_at"].replace("Z", "+00:00"))
+        return items
+    return norm(a) == norm(b)
+
+
+def best_of(fn, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    encoder = "orjson" if serializers.orjson is not None else "json (stdlib)"
+    print(f"encoder: {encoder}")
+    print(f"{'rows':>8} {'old ms':>10} {'new ms':>10} {'speedup':>8}")
+    for n in (10, 1_000, 100_000):
+        rows = make_rows(n)
+        assert same_payload(old_path(rows), new_path(rows))
+        repeat = 200 if n <= 10 else (20 if n <= 1000 else 3)
+        old = best_of(old_path, rows, repeat)
+        new = best_of(new_path, rows, repeat)
+        print(f"{n:>8} {old * 1000:>10.3f} {new * 1000:>10.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+/* admin.html — robust listeners + logging */
+// same origin when the app serves the pages (SERVE_FRONTEND=1); the API server when
+// they come from `python -m http.server 8080` in frontend/
+const API = location.port === "8080" ? "http://localhost:8000" : "";
+const token = localStorage.getItem("token");
+if (!token || localStorage.getItem("is_admin") !== "true") {
+  console.warn("Not logged in as admin — redirecting to login");
+  location = "login.html";
+}
+const authHeader = { "Authorization": "Bearer " + token };
+
+// conditional GET: resend the last ETag and reuse the cached body on 304
+const etagCache = new Map();
+async function cachedGet(url){
+  const hit = etagCache.get(url);
+  const headers = { ...authHeader };
+  if (hit) headers["If-None-Match"] = hit.etag;
+  const res = await fetch(url, { headers, cache: "no-store" });
+  if (res.status === 304 && hit) return { ok: true, status: 200, data: hit.data, next: hit.next };
+  if (!res.ok) return { ok: false, status: res.status, text: await res.text() };
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  const next = res.headers.get("X-Next-Cursor");
+  if (etag) etagCache.set(url, { etag, data, next });
+  return { ok: true, status: res.status, data, next };
+}
+
+document.getElementById('logoutBtn').addEventListener('click', () => {
+  localStorage.clear();
+  location = "login.html";
+});
+document.getElementById('createBtn').addEventListener('click', createUser);
+
+async function createUser(){
+  const body = {
+    userid: document.getElementById("userid").value.trim(),
+    password: document.getElementById("password").value,
+    full_name: document.getElementById("fullname").value.trim(),
+    is_admin: document.getElementById("isAdmin").checked
+  };
+  document.getElementById("createStatus").textContent = "Creating...";
+  try {
+    const res = await fetch(API + "/admin/users", {
+      method: "POST",
+      headers: {"Content-Type":"application/json", ...authHeader},
+      body: JSON.stringify(body)
+    });
+    const j = await res.json();
+    if(!res.ok){ document.getElementById("createStatus").textContent = j.detail || "Create failed"; return; }
+    document.getElementById("createStatus").textContent = "Created user " + j.userid;
+    document.getElementById("userid").value = "";
+    document.getElementById("password").value = "";
+    document.getElementById("fullname").value = "";
+    document.getElementById("isAdmin").checked = false;
+    if (!live) await loadUsers();
+  } catch (e) {
+    console.error("createUser error", e);
+    document.getElementById("createStatus").textContent = "Network error";
+  }
+}
+
+function esc(v){
+  return String(v ?? "").replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;');
+}
+
+// users are paged (X-Next-Cursor) and filtered server-side; stats=true brings each
+// user's records / last date / lifetime totals in the same response (its ETag covers
+// daily changes too, so polls still get 304s)
+let usersNext = null;
+const usersById = new Map();
+function usersUrl(cursor){
+  const p = new URLSearchParams({ limit: "50", stats: "true" });
+  const q = document.getElementById("userSearch").value.trim();
+  if (q) { p.set("q", q); p.set("match", document.getElementById("userMatch").value); }
+  const active = document.getElementById("userActive").value;
+  if (active) p.set("is_active", active);
+  const role = document.getElementById("userRole").value;
+  if (role) p.set("is_admin", role);
+  if (cursor) p.set("cursor", cursor);
+  return API + "/admin/users?" + p.toString();
+}
+
+// client-side twin of the server filters, for rows pushed by the change feed
+function userMatchesFilters(u){
+  const q = document.getElementById("userSearch").value.trim().toLowerCase();
+  if (q) {
+    const fields = [u.userid, u.full_name || ""].map(f => f.toLowerCase());
+    const prefix = document.getElementById("userMatch").value === "prefix";
+    if (!fields.some(f => prefix ? f.startsWith(q) : f.includes(q))) return false;
+  }
+  const active = document.getElementById("userActive").value;
+  if (active && String(!!u.is_active) !== active) return false;
+  const role = document.getElementById("userRole").value;
+  if (role && String(!!u.is_admin) !== role) return false;
+  return true;
+}
+
+function userRow(u){
+  const net = (u.total_deposit || 0) - (u.total_withdraw || 0);
+  const user = encodeURIComponent(u.userid);
+  return `<tr id="user-${u.id}">
+      <td>${esc(u.userid)}</td>
+      <td>${esc(u.full_name)}</td>
+      <td>${u.is_admin ? 'Admin' : 'User'}</td>
+      <td>${u.is_active ? 'Active' : 'Deactivated'}</td>
+      <td>${u.records || 0}</td>
+      <td>${u.last_date || '—'}</td>
+      <td>${net.toFixed(2)}</td>
+      <td class="actions">
+        <button class="view-daily-btn ghost" data-user="${user}">View Daily</button>
+        ${u.is_active ? `<button class="deactivate-btn ghost" data-user="${user}">Deactivate</button>`
+                     : `<button class="restore-user-btn ghost" data-user="${user}">Restore</button>`}
+        <button class="delete-user-btn danger" data-user="${user}">Delete</button>
+      </td>
+    </tr>`;
+}
+
+async function loadUsers(more){
+  console.log("loadUsers() start");
+  const res = await cachedGet(usersUrl(more ? usersNext : null));
+  if (!res.ok) { document.getElementById("users").innerText = "Failed to load users"; return; }
+  const users = res.data;
+  usersNext = res.next;
+  document.getElementById("usersMore").style.display = usersNext ? "" : "none";
+  const out = document.getElementById("users");
+  if (!more) {
+    usersById.clear();
+    out.innerHTML = "<table><thead><tr><th>userid</th><th>full name</th><th>role</th><th>status</th><th>records</th><th>last date</th><th>net</th><th>actions</th></tr></thead><tbody id='userRows'></tbody></table>"
+      + "<div id='noUsers' class='small muted'>No users</div>";
+  }
+  users.forEach(u => usersById.set(u.id, { ...u }));
+  document.getElementById("userRows").insertAdjacentHTML("beforeend", users.map(userRow).join(""));
+  document.getElementById("noUsers").style.display = usersById.size ? "none" : "";
+  console.log("loadUsers() done");
+  if (!more) loadLogs();
+}
+
+// one delegated listener per list, so rows added later by the change feed work too
+document.getElementById('users').addEventListener('click', e => {
+  const btn = e.target.closest('button[data-user]');
+  if (!btn) return;
+  const userid = decodeURIComponent(btn.getAttribute('data-user'));
+  if (btn.classList.contains('view-daily-btn')) loadDaily(userid);
+  else if (btn.classList.contains('deactivate-btn')) deactivateUser(userid);
+  else if (btn.classList.contains('restore-user-btn')) restoreUser(userid);
+  else if (btn.classList.contains('delete-user-btn')) deleteUser(userid);
+});
+
+let searchTimer = null;
+document.getElementById('userSearch').addEventListener('input', () => {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => loadUsers(false), 250);
+});
+['userMatch', 'userActive', 'userRole'].forEach(id =>
+  document.getElementById(id).addEventListener('change', () => loadUsers(false)));
+document.getElementById('usersMore').addEventListener('click', () => loadUsers(true));
+
+function deactivateUser(userid){
+  if(!confirm(`Deactivate user ${userid}?`)) return;
+  fetch(API + "/admin/user/" + encodeURIComponent(userid) + "/deactivate", { method: "POST", headers: authHeader })
+    .then(r=> r.json().then(j=> ({ok:r.ok, body:j})))
+    .then(res=>{
+      if(!res.ok){ alert(res.body.detail || "Failed"); return; }
+      alert("Deactivated");
+      if (!live) loadUsers();
+    }).catch(e=>{ alert("Network error"); console.error(e); });
+}
+
+function restoreUser(userid){
+  fetch(API + "/admin/user/" + encodeURIComponent(userid) + "/restore", { method: "POST", headers: authHeader })
+    .then(r=> r.json().then(j=> ({ok:r.ok, body:j})))
+    .then(res=>{
+      if(!res.ok){ alert(res.body.detail || "Failed"); return; }
+      alert("Restored");
+      if (!live) loadUsers();
+    }).catch(e=>{ alert("Network error"); console.error(e); });
+}
+
+function deleteUser(userid){
+  if(!confirm(`Permanently delete user ${userid}? This is irreversible.`)) return;
+  fetch(API + "/admin/user/" + encodeURIComponent(userid) + "?async=1", { method: "DELETE", headers: authHeader })
+    .then(r=> r.json().then(j=> ({ok:r.ok, body:j})))
+    .then(async res=>{
+      if(!res.ok){ alert(res.body.detail || "Failed"); return; }
+      const job = await waitForJob(res.body.job_id);
+      if(job.status !== "succeeded"){ alert("Delete failed: " + (job.error || job.status)); return; }
+      alert("Deleted permanently");
+      if (!live) loadUsers();
+    }).catch(e=>{ alert("Network error"); console.error(e); });
+}
+
+// heavy admin operations run as background jobs; poll until one finishes
+async function waitForJob(id){
+  for (let delay = 250; ; delay = Math.min(delay * 2, 2000)){
+    const res = await fetch(API + "/admin/jobs/" + id, { headers: authHeader, cache: "no-store" });
+    if (!res.ok) throw new Error("job status " + res.status);
+    const job = await res.json();
+    if (job.status === "succeeded" || job.status === "failed") return job;
+    await new Promise(r => setTimeout(r, delay));
+  }
+}
+
+// the user whose records are shown, with the lifetime totals from the summary endpoint
+let dailyView = null;
+
+function dailyRow(r){
+  const deleted = r.is_deleted === true;
+  return `<tr id="daily-${r.id}" data-date="${r.date}" ${deleted ? 'style="opacity:0.6"' : ''}>
+      <td>${r.date}</td>
+      <td>${r.total_deposit}</td>
+      <td>${r.total_withdraw}</td>
+      <td>
+        ${!deleted ? `<button class="edit-daily ghost" data-id="${r.id}" data-date="${r.date}" data-dep="${r.total_deposit}" data-wit="${r.total_withdraw}">Edit</button>` : ''}
+        ${!deleted ? `<button class="delete-daily danger" data-id="${r.id}">Delete</button>` : `<button class="restore-daily ghost" data-id="${r.id}">Restore</button>`}
+      </td>
+    </tr>`;
+}
+
+function lifetimeLine(s){
+  const net = (s.total_deposit - s.total_withdraw).toFixed(2);
+  return `Lifetime: deposit ${s.total_deposit.toFixed(2)} — withdraw ${s.total_withdraw.toFixed(2)} — net ${net} (${s.days} days)`;
+}
+
+async function loadDaily(userid){
+  console.log("loadDaily()", userid);
+  localStorage.setItem("userid", userid);
+  const res = await cachedGet(API + "/admin/user/" + encodeURIComponent(userid) + "/daily");
+  const out = document.getElementById("daily");
+  if (!res.ok) {
+    dailyView = null;
+    out.innerHTML = `<div class="small muted">Failed to load daily for ${esc(userid)}: ${res.status}</div>`;
+    console.error("loadDaily error", res.status, res.text);
+    return;
+  }
+  const daily = res.data;
+  dailyView = { userid, lifetime: null };
+  let html = `<h4>${esc(userid)} — records</h4>`;
+  const sres = await fetch(API + "/admin/summary/user/" + encodeURIComponent(userid) + "?months=0&weeks=0", { headers: authHeader });
+  if (sres.ok){
+    const s = (await sres.json()).lifetime;
+    dailyView.lifetime = { total_deposit: Number(s.total_deposit), total_withdraw: Number(s.total_withdraw), days: s.days };
+    html += `<div id="dailyLifetime" class="small muted" style="margin-bottom:8px">${lifetimeLine(dailyView.lifetime)}</div>`;
+  }
+  html += `<div id="noDaily" class="small muted" ${daily.length ? 'style="display:none"' : ''}>No records for ${esc(userid)}</div>`;
+  html += `<table><thead><tr><th>Date</th><th>Deposit</th><th>Withdraw</th><th>Actions</th></tr></thead><tbody id="dailyRows">`;
+  html += daily.map(dailyRow).join("");
+  html += "</tbody></table>";
+  out.innerHTML = html;
+}
+
+document.getElementById('daily').addEventListener('click', e => {
+  const btn = e.target.closest('button[data-id]');
+  if (!btn) return;
+  const d = btn.dataset;
+  if (btn.classList.contains('edit-daily')) adminEdit(d.id, d.date, d.dep, d.wit);
+  else if (btn.classList.contains('delete-daily')) adminDelete(d.id);
+  else if (btn.classList.contains('restore-daily')) adminRestore(d.id);
+});
+
+function reloadDaily(){
+  const userid = localStorage.getItem("userid"); if (userid) loadDaily(userid);
+}
+
+async function adminEdit(id, date, oldDep, oldWit){
+  const newDep = prompt("Deposit for " + date, oldDep);
+  if (newDep === null) return;
+  const newWit = prompt("Withdraw for " + date, oldWit);
+  if (newWit === null) return;
+  const payload = { date: date, total_deposit: Number(newDep), total_withdraw: Number(newWit) };
+  const res = await fetch(API + "/admin/daily/" + id, {
+    method: "PUT",
+    headers: {"Content-Type":"application/json", ...authHeader},
+    body: JSON.stringify(payload)
+  });
+  if (!res.ok){ const j = await res.json(); alert(j.detail || "Update failed"); return; }
+  alert("Updated");
+  if (!live) reloadDaily();
+}
+
+async function adminDelete(id){
+  if (!confirm("Soft-delete this record?")) return;
+  const res = await fetch(API + "/admin/daily/" + id, { method: "DELETE", headers: authHeader });
+  if (!res.ok){ const j = await res.json(); alert(j.detail || "Delete failed"); return; }
+  alert("Deleted");
+  if (!live) reloadDaily();
+}
+
+async function adminRestore(id){
+  const res = await fetch(API + "/admin/daily/" + id + "/restore", { method: "POST", headers: authHeader });
+  if (!res.ok){ const j = await res.json(); alert(j.detail || "Restore failed"); return; }
+  alert("Restored");
+  if (!live) reloadDaily();
+}
+
+// newest 100 entries; the change feed merges new ones in
+let logRows = [];
+function renderLogs(){
+  const out = document.getElementById("logs");
+  if (!logRows.length){ out.innerHTML = "<div class='small muted'>No logs</div>"; return; }
+  let html = "<div class='small muted' style='margin-bottom:8px'>Latest actions</div><div>";
+  for (const l of logRows){
+    const details = "details" in l ? JSON.stringify(l.details) : "…";
+    html += `<div class="small">${new Date(l.created_at).toLocaleString()} — ${esc(l.action)} — ${esc(details)}</div>`;
+  }
+  html += "</div>";
+  out.innerHTML = html;
+}
+
+async function loadLogs(){
+  const res = await fetch(API + "/admin/logs?limit=100", { headers: authHeader });
+  if (!res.ok){ document.getElementById("logs").innerText = "Failed to load logs"; return; }
+  logRows = (await res.json()).slice(0, 100);
+  renderLogs();
+}
+
+// --- live updates ---
+// GET /admin/changes streams changed rows (server-sent events) and the lists are
+// patched in place. While the feed is down, lists are reloaded after each action instead.
+let live = false;
+
+function contribution(r){
+  return r && !r.is_deleted
+    ? { days: 1, dep: Number(r.total_deposit || 0), wit: Number(r.total_withdraw || 0) }
+    : { days: 0, dep: 0, wit: 0 };
+}
+
+function applyUsers(change){
+  const tbody = document.getElementById("userRows");
+  for (const r of change.rows){
+    const tr = document.getElementById("user-" + r.id);
+    const known = usersById.get(r.id);
+    if (change.op === "delete" || !userMatchesFilters(r)){
+      if (tr) tr.remove();
+      usersById.delete(r.id);
+      continue;
+    }
+    const u = { ...(known || { records: 0, last_date: null, total_deposit: 0, total_withdraw: 0 }), ...r };
+    if (tr) { usersById.set(r.id, u); tr.outerHTML = userRow(u); }
+    // new users sort last (by id): only show them once the last page is loaded
+    else if (tbody && !usersNext) { usersById.set(r.id, u); tbody.insertAdjacentHTML("beforeend", userRow(u)); }
+  }
+  const none = document.getElementById("noUsers");
+  if (none) none.style.display = usersById.size ? "none" : "";
+}
+
+function applyDaily(change){
+  for (const r of change.rows){
+    const before = change.op === "insert" ? null : (change.op === "update" ? r.old : r);
+    const after = change.op === "delete" ? null : r;
+    const a = contribution(after), b = contribution(before);
+    const u = usersById.get(r.user_id);
+    if (u){
+      u.records = (u.records || 0) + a.days - b.days;
+      u.total_deposit = (u.total_deposit || 0) + a.dep - b.dep;
+      u.total_withdraw = (u.total_withdraw || 0) + a.wit - b.wit;
+      if (after && !after.is_deleted && (!u.last_date || after.date > u.last_date)) u.last_date = after.date;
+      const tr = document.getElementById("user-" + u.id);
+      if (tr) tr.outerHTML = userRow(u);
+    }
+    if (!dailyView || dailyView.userid !== r.userid) continue;
+    if (dailyView.lifetime){
+      const s = dailyView.lifetime;
+      s.days += a.days - b.days; s.total_deposit += a.dep - b.dep; s.total_withdraw += a.wit - b.wit;
+      const line = document.getElementById("dailyLifetime");
+      if (line) line.textContent = lifetimeLine(s);
+    }
+    const tr = document.getElementById("daily-" + r.id);
+    if (!after) { if (tr) tr.remove(); continue; }
+    if (tr) { tr.outerHTML = dailyRow(after); continue; }
+    // newest date first
+    const tbody = document.getElementById("dailyRows");
+    if (!tbody) continue;  // still loading
+    const next = [...tbody.rows].find(row => row.dataset.date < after.date);
+    if (next) next.insertAdjacentHTML("beforebegin", dailyRow(after));
+    else tbody.insertAdjacentHTML("beforeend", dailyRow(after));
+  }
+  const tbody = document.getElementById("dailyRows"), none = document.getElementById("noDaily");
+  if (tbody && none) none.style.display = tbody.rows.length ? "none" : "";
+}
+
+function applyLogs(change){
+  const seen = new Set(logRows.map(l => l.id));
+  logRows = logRows.concat(change.rows.filter(l => !seen.has(l.id)))
+    .sort((x, y) => new Date(y.created_at) - new Date(x.created_at) || y.id - x.id)
+    .slice(0, 100);
+  renderLogs();
+}
+
+// bulk statements and feed gaps arrive as "reload this list" hints; coalesce them
+const pendingReloads = new Set();
+let reloadTimer = null;
+function scheduleReload(...lists){
+  lists.forEach(l => pendingReloads.add(l));
+  clearTimeout(reloadTimer);
+  reloadTimer = setTimeout(() => {
+    const lists = new Set(pendingReloads); pendingReloads.clear();
+    if (lists.has("users")) loadUsers(false);            // also reloads the logs
+    else if (lists.has("logs")) loadLogs();
+    if (lists.has("daily") && dailyView) reloadDaily();
+  }, 300);
+}
+
+function applyChange(change){
+  if (change.truncated){
+    scheduleReload(...({ users: ["users"], daily_financials: ["users", "daily"], audit_logs: ["logs"] }[change.table] || []));
+    return;
+  }
+  if (change.table === "users") applyUsers(change);
+  else if (change.table === "daily_financials") applyDaily(change);
+  else if (change.table === "audit_logs") applyLogs(change);
+}
+
+function connectFeed(){
+  let loaded = false;
+  let lastEventId = "";
+  const initialLoad = () => { if (!loaded) { loaded = true; loadUsers(); } };
+  if (!window.EventSource) { initialLoad(); return; }
+  const open = async () => {
+    // EventSource can't send headers: every connection uses a fresh one-time ticket, which a
+    // browser retry can't reuse, so reconnects are done here rather than by EventSource
+    let ticket;
+    try {
+      const res = await fetch(API + "/admin/changes/ticket", { method: "POST", headers: authHeader });
+      if (!res.ok) { initialLoad(); if (res.status >= 500) setTimeout(open, 5000); return; }
+      ticket = (await res.json()).ticket;
+    } catch (e) {
+      initialLoad();
+      setTimeout(open, 5000);
+      return;
+    }
+    const es = new EventSource(API + "/admin/changes?ticket=" + encodeURIComponent(ticket)
+      + (lastEventId ? "&last_event_id=" + encodeURIComponent(lastEventId) : ""));
+    const seen = e => { if (e.lastEventId) lastEventId = e.lastEventId; };
+    // load only once subscribed, so nothing changes unseen between the load and the feed
+    es.addEventListener("ready", () => { live = true; initialLoad(); });
+    es.addEventListener("reset", e => { seen(e); scheduleReload("users", "daily"); });
+    es.addEventListener("expired", () => { live = false; es.close(); });
+    es.onmessage = e => { seen(e); applyChange(JSON.parse(e.data)); };
+    es.onerror = () => {
+      if (es.readyState === EventSource.CLOSED && !live) { initialLoad(); return; }  // refused
+      live = false;
+      es.close();
+      initialLoad();
+      setTimeout(open, 2000);
+    };
+  };
+  open();
+}
+
+// initial load
+connectFeed();
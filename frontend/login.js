@@ -0,0 +1,26 @@
+// same origin when the app serves the pages (SERVE_FRONTEND=1); the API server when
+// they come from `python -m http.server 8080` in frontend/
+const API = location.port === "8080" ? "http://localhost:8000" : "";
+
+document.getElementById('loginBtn').addEventListener('click', login);
+
+async function login(){
+  const userid = document.getElementById('userid').value;
+  const password = document.getElementById('password').value;
+  const res = await fetch(API + "/auth/login", {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({ userid, password })
+  });
+  const data = await res.json();
+  if(!res.ok){ alert(data.detail || 'Login failed'); return; }
+  localStorage.setItem("token", data.access_token);
+  localStorage.setItem("userid", userid);
+  // probe admin
+  try {
+    const s = await fetch(API + "/admin/users", { headers: { Authorization: "Bearer " + data.access_token }});
+    if(s.ok){ localStorage.setItem("is_admin", "true"); window.location = "admin.html"; return; }
+  } catch(e){}
+  localStorage.setItem("is_admin", "false");
+  window.location = "user.html";
+}
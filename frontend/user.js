@@ -0,0 +1,77 @@
+// same origin when the app serves the pages (SERVE_FRONTEND=1); the API server when
+// they come from `python -m http.server 8080` in frontend/
+const API = location.port === "8080" ? "http://localhost:8000" : "";
+const token = localStorage.getItem("token");
+const userid = localStorage.getItem("userid") || "";
+console.log("user.html start, token present?", !!token, "userid:", userid);
+if (!token){ location = "login.html"; }
+const authHeader = { "Authorization": "Bearer " + token };
+
+// set after a write when the API reads from a replica: sent back so the next reads see the write
+// (the rw cookie does the same when the page is served by the app itself)
+let readAfter = null;
+
+// conditional GET: resend the last ETag and reuse the cached body on 304
+const etagCache = new Map();
+async function cachedGet(url){
+  const hit = etagCache.get(url);
+  const headers = { ...authHeader };
+  if (hit) headers["If-None-Match"] = hit.etag;
+  if (readAfter) headers["X-Read-After"] = readAfter;
+  const res = await fetch(url, { headers, cache: "no-store" });
+  if (res.status === 304 && hit) return { ok: true, status: 200, data: hit.data };
+  if (!res.ok) return { ok: false, status: res.status, text: await res.text() };
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  if (etag) etagCache.set(url, { etag, data });
+  return { ok: true, status: res.status, data };
+}
+
+document.getElementById("logoutBtn").addEventListener('click', ()=>{ localStorage.clear(); location="login.html"; });
+document.getElementById("submitBtn").addEventListener('click', submitDaily);
+
+document.addEventListener('DOMContentLoaded', () => {
+  document.getElementById("loggedAs").textContent = userid ? `Logged in as: ${userid}` : "";
+  const d = new Date();
+  document.getElementById("date").value = d.toISOString().slice(0,10);
+  loadMyHistory();
+});
+
+async function submitDaily(){
+  const date = document.getElementById("date").value;
+  const dep = Number(document.getElementById("deposit").value || 0);
+  const wit = Number(document.getElementById("withdraw").value || 0);
+  if (!date){ alert("Choose a date"); return; }
+  const payload = { date: date, total_deposit: dep, total_withdraw: wit };
+  try {
+    const res = await fetch(API + "/user/daily", {
+      method: "POST",
+      headers: {"Content-Type":"application/json", ...authHeader},
+      body: JSON.stringify(payload)
+    });
+    if (!res.ok){ const j = await res.json(); document.getElementById("submitMsg").textContent = j.detail || "Submit failed"; return; }
+    readAfter = res.headers.get("X-Read-After") || readAfter;
+    document.getElementById("submitMsg").textContent = "Saved";
+    setTimeout(()=> document.getElementById("submitMsg").textContent = "", 2000);
+    loadMyHistory();
+  } catch(e){
+    console.error("submitDaily error", e);
+    document.getElementById("submitMsg").textContent = "Network error";
+  }
+}
+
+async function loadMyHistory(){
+  console.log("loadMyHistory for", userid);
+  const res = await cachedGet(API + "/user/daily");
+  const container = document.getElementById("history");
+  if (!res.ok){ container.innerHTML = "<div class='small'>Failed to load</div>"; return; }
+  const rows = res.data;
+  if (!rows.length){ container.innerHTML = "<div class='small'>No history</div>"; return; }
+  let html = "<table><thead><tr><th>Date</th><th>Deposit</th><th>Withdraw</th></tr></thead><tbody>";
+  for (const r of rows){
+    // backend already filters deleted rows; still protect UI
+    html += `<tr><td>${r.date}</td><td>${r.total_deposit}</td><td>${r.total_withdraw}</td></tr>`;
+  }
+  html += "</tbody></table>";
+  container.innerHTML = html;
+}